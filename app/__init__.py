@@ -1,36 +1,71 @@
 from flask import Flask
 from app.routes import home_routes, login_routes, user_routes, story_editor_routes, read_routes
 from app.api import api_bp
-from app.extensions import db, bcrypt
+from app.extensions import db, bcrypt, assets, fragment_cache, cache, instrumentation, metrics, admission, maintenance, shards
+from app.utils.sqlite import configure_sqlite
+from app.utils.migrations import is_schema_current, migrate, schema_fingerprint, stamp_schema
+from app.utils.startup import StartupTimer, startup_report_command
+from app.commands import serve_command, populate_command, publish_command, rebuild_stats_command, rebuild_search_command, maintenance_command, import_twine_command
 
-def create_app():
+def create_app(config: dict | None = None):
+    timer = StartupTimer()
     app = Flask(__name__)
+    app.extensions["startup"] = timer
     # register the db
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///project.db"
+    # overrides (tests, benchmarks, deployment)
+    if config is not None:
+        app.config.update(config)
 
     # set the secret key
     app.secret_key = "super secret for now (no)"
     
     # Register blueprints
-    app.register_blueprint(home_routes.bp)
-    app.register_blueprint(login_routes.bp)
-    app.register_blueprint(user_routes.bp)
-    app.register_blueprint(story_editor_routes.bp)
-    app.register_blueprint(api_bp, url_prefix="/api")
-    app.register_blueprint(read_routes.bp)
+    with timer.phase("blueprints"):
+        app.register_blueprint(home_routes.bp)
+        app.register_blueprint(login_routes.bp)
+        app.register_blueprint(user_routes.bp)
+        app.register_blueprint(story_editor_routes.bp)
+        app.register_blueprint(api_bp, url_prefix="/api")
+        app.register_blueprint(read_routes.bp)
 
-    bcrypt.init_app(app)
+        app.cli.add_command(serve_command)
+        app.cli.add_command(populate_command)
+        app.cli.add_command(publish_command)
+        app.cli.add_command(rebuild_stats_command)
+        app.cli.add_command(rebuild_search_command)
+        app.cli.add_command(startup_report_command)
+        app.cli.add_command(maintenance_command)
+        app.cli.add_command(import_twine_command)
 
-    # create and populate the database
-    from app.models import Story, StoryEdge, StoryNode, User
-    from populate import populate
+    with timer.phase("extensions"):
+        bcrypt.init_app(app)
+        assets.init_app(app)
+        fragment_cache.init_app(app)
+        cache.init_app(app)
 
-    db.init_app(app)
+        db.init_app(app)
+        with app.app_context():
+            configure_sqlite(app, db.engine)
+        shards.init_app(app)
+        # first, so that rejected requests skip the other extensions' hooks
+        admission.init_app(app)
+        instrumentation.init_app(app)
+        metrics.init_app(app)
+        maintenance.init_app(app)
 
-    # create the db
-    with app.app_context():
-        db.create_all()
-        # populate() # Amment to populate the empty db with some example data
-        
+    # create the db, or bring an existing one to the current schema,
+    # unless it is stamped with the current schema already
+    # (`flask --app run populate` adds an example story to an empty db)
+    with timer.phase("schema"), app.app_context():
+        from app.services.search_service import SEARCH_TABLES, create_search_index
+        from app.services.graph_service import SPATIAL_TABLES, create_spatial_index
+        fingerprint = schema_fingerprint(db.metadata, [*SEARCH_TABLES, *SPATIAL_TABLES])
+        if not is_schema_current(db.engine, fingerprint):
+            migrate(db.engine)
+            db.create_all()
+            create_search_index()
+            create_spatial_index()
+            stamp_schema(db.engine, fingerprint)
     
     return app
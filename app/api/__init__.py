@@ -1,17 +1,38 @@
 from flask import Blueprint
 from app.api.ressources.stories_ressource import *
 from app.api.ressources.users_ressource import *
+from app.api.ressources.search_ressource import *
+from app.api.ressources.assets_ressource import *
+from app.api.ressources.publish_ressource import *
+from app.api.ressources.events_ressource import *
+from app.api.ressources.layout_ressource import *
+from app.api.ressources.import_ressource import *
 
 api_bp = Blueprint("api", __name__)
 
 api_bp.add_url_rule("/stories", view_func=StoriesResource.as_view("stories"))
+api_bp.add_url_rule("/stories/import", view_func=StoryImportResource.as_view("story_import"))
 api_bp.add_url_rule("/stories/<int:id>", view_func=StoryDetailResource.as_view("story"))
+api_bp.add_url_rule("/stories/<int:id>/clone", view_func=StoryCloneResource.as_view("story_clone"))
+api_bp.add_url_rule("/stories/<int:id>/versions", view_func=StoryPublishResource.as_view("story_versions"))
+api_bp.add_url_rule("/bundles/<digest>", view_func=StoryBundleResource.as_view("story_bundle"))
+api_bp.add_url_rule("/stories/<int:id>/stats", view_func=StoryStatsResource.as_view("story_stats"))
 api_bp.add_url_rule("/stories/<int:story_id>/nodes", view_func=StoryNodesResource.as_view("story_nodes"))
 api_bp.add_url_rule("/stories/nodes/<int:id>", view_func=StoryNodeDetailResource.as_view("story_node_detail"))
+api_bp.add_url_rule("/stories/<int:id>/start", view_func=StoryStartNodeResource.as_view("story_start_node"))
+api_bp.add_url_rule("/stories/<int:id>/layout", view_func=StoryLayoutResource.as_view("story_layout"))
+api_bp.add_url_rule("/stories/<int:id>/graph", view_func=StoryGraphResource.as_view("story_graph"))
 
 api_bp.add_url_rule("/stories/<int:story_id>/edges", view_func=StoryEdgesResource.as_view("story_edges"))
 
+api_bp.add_url_rule("/search", view_func=SearchResource.as_view("search"))
+
+api_bp.add_url_rule("/events", view_func=EventsResource.as_view("events"))
+
+api_bp.add_url_rule("/assets/<int:id>/nodes", view_func=AssetNodesResource.as_view("asset_nodes"))
+
 
 api_bp.add_url_rule("/users/new", view_func=UserRessource.as_view("new_user"))
 api_bp.add_url_rule("/users/<int:user_id>", view_func=UserDetailRessource.as_view("user"))
-api_bp.add_url_rule("/userinfo/<int:story_id>", view_func=UserStoryRessource.as_view("user_story"))
\ No newline at end of file
+api_bp.add_url_rule("/userinfo/<int:story_id>", view_func=UserStoryRessource.as_view("user_story"))
+api_bp.add_url_rule("/userinfo/<int:story_id>/advance", view_func=UserStoryAdvanceRessource.as_view("user_story_advance"))
\ No newline at end of file
@@ -0,0 +1,34 @@
+from flask.views import MethodView
+from flask import jsonify
+from app.services.assets_service import get_asset_nodes
+
+
+class AssetNodesResource(MethodView):
+    """
+    Resource listing where a picture is used.
+
+    Endpoints:
+        GET /api/assets/<id>/nodes
+            Retrieve the nodes showing an asset.
+    """
+    def get(self, id: int):
+        """
+        Retrieve the IDs of the nodes using an asset as any of their pictures.
+
+        HTTP Method: GET
+        Endpoint: /api/assets/<id>/nodes
+
+        Args:
+            id (int): The unique identifier of the asset.
+
+        Returns:
+            tuple: A JSON response containing the node IDs and an HTTP status code 200.
+
+        Example:
+            GET /api/assets/1/nodes
+            Response:
+            {
+                "nodes": [1, 2, 5]
+            }
+        """
+        return jsonify({"nodes": get_asset_nodes(id)}), 200
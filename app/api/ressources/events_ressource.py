@@ -0,0 +1,87 @@
+from flask.views import MethodView
+from flask import abort, jsonify, request, session
+from app.services.events_service import get_story_stats, record_events
+
+
+class EventsResource(MethodView):
+    """
+    Resource collecting reading events.
+
+    Endpoints:
+        POST /api/events
+            Record a batch of reading events of the current user.
+    """
+    def post(self):
+        """
+        Record a batch of reading events of the current user.
+
+        HTTP Method: POST
+        Endpoint: /api/events
+
+        Request JSON body:
+            {
+                "events": [
+                    {"story_id": 1, "node_id": 3, "kind": "view"},
+                    {"story_id": 1, "node_id": 3, "kind": "wrong"},
+                    ...
+                ]
+            }
+
+        Side Effects:
+            Appends the events to the log and updates the reading statistics.
+
+        Returns:
+            tuple: A JSON response containing the number of recorded events and an HTTP status code 202.
+
+        Raises:
+            401 Unauthorized: If no user is logged in.
+            400 Bad Request: If the batch is too large or an event is invalid.
+
+        Example:
+            POST /api/events
+            Response:
+            {
+                "recorded": 2
+            }
+        """
+        user_id = session.get("user_id")
+        if user_id is None:
+            abort(401, description="Not logged in")
+        data = request.get_json(silent=True) or {}
+        recorded = record_events(user_id, data.get("events", []))
+        return jsonify({"recorded": recorded}), 202
+
+
+class StoryStatsResource(MethodView):
+    """
+    Resource exposing the reading statistics of a story.
+
+    Endpoints:
+        GET /api/stories/<id>/stats
+            Retrieve the story and per-node reading statistics.
+    """
+    def get(self, id: int):
+        """
+        Retrieve the reading statistics of a story: views, quiz fail rates, drop-off and completions.
+
+        HTTP Method: GET
+        Endpoint: /api/stories/<id>/stats
+
+        Args:
+            id (int): The unique identifier of the story.
+
+        Returns:
+            tuple: A JSON response containing the statistics and an HTTP status code 200.
+
+        Example:
+            GET /api/stories/1/stats
+            Response:
+            {
+                "story": {"story_id": 1, "readers": 12, "completions": 5, "fail_rate": 0.25, ...},
+                "nodes": [
+                    {"node_id": 4, "views": 10, "correct": 9, "wrong": 3, "fail_rate": 0.25, "drop_off": 2, ...},
+                    ...
+                ]
+            }
+        """
+        return jsonify(get_story_stats(id)), 200
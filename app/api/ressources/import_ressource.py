@@ -0,0 +1,63 @@
+import io
+from flask.views import MethodView
+from flask import abort, jsonify, request
+from app.services.import_service import import_twine_story
+
+
+class StoryImportResource(MethodView):
+    """
+    Resource importing stories written with Twine.
+
+    Endpoints:
+        POST /api/stories/import
+            Create a story from a Twee file or a Twine 2 HTML archive.
+    """
+    def post(self):
+        """
+        Create a story from a Twine source, uploaded as the "file" field of a form
+        or sent as the body of the request.
+
+        The upload is read as a stream: large uploads are spooled to disk by the
+        form parser, not held in memory.
+
+        HTTP Method: POST
+        Endpoint: /api/stories/import
+
+        Form Data:
+            file: The Twee file or Twine 2 HTML archive, in UTF-8.
+            title (optional): The title of the story, by default the one of the Twine story.
+            (or `?title=` with the source as the request body)
+
+        Side Effects:
+            Creates a new story with a node per passage and an edge per link.
+
+        Returns:
+            tuple: A JSON response containing the new story's ID, the numbers of nodes
+                   and edges imported, and an HTTP status code 201.
+
+        Raises:
+            400 Bad Request: If there is no source or it is not a valid Twine story;
+                             the description gives the line of the error.
+
+        Example:
+            POST /api/stories/import (multipart, file=cave.twee)
+            Response:
+            {
+                "message": "Story imported",
+                "story_id": 5,
+                "nodes": 42,
+                "edges": 57
+            }
+        """
+        upload = request.files.get("file")
+        if upload is not None:
+            stream = upload.stream
+        elif not request.files and not request.form and (
+                request.content_length or request.headers.get("Transfer-Encoding") == "chunked"):
+            stream = io.BufferedReader(request.stream)
+        else:
+            abort(400, description="No Twine source")
+        title = request.form.get("title") or request.args.get("title")
+        source = io.TextIOWrapper(stream, encoding="utf-8")
+        story, counts = import_twine_story(source, title)
+        return jsonify({"message": "Story imported", "story_id": story.id, **counts}), 201
@@ -0,0 +1,105 @@
+from flask.views import MethodView
+from flask import jsonify, request
+from app.services.graph_service import get_story_graph, parse_bbox
+from app.services.layout_service import apply_story_layout, get_story_layout
+
+
+class StoryLayoutResource(MethodView):
+    """
+    Resource for the automatic layout of a story graph in the editor.
+
+    Endpoints:
+        GET /api/stories/<id>/layout
+            Compute the automatic position of every node of a story.
+        POST /api/stories/<id>/layout
+            Move every node of a story to its automatic position.
+    """
+    def get(self, id: int) -> object:
+        """
+        Compute the automatic position of every node of a story, without moving them.
+
+        HTTP Method: GET
+        Endpoint: /api/stories/<id>/layout
+
+        Args:
+            id (int): The unique identifier of the story.
+
+        Returns:
+            tuple: A JSON response with the (x, y) position of every node by node ID and an HTTP status code 200.
+
+        Example:
+            GET /api/stories/1/layout
+            Response:
+            {
+                "positions": {"1": [50, 50], "3": [350, 50], ...}
+            }
+        """
+        return jsonify({"positions": get_story_layout(id)}), 200
+
+    def post(self, id: int) -> object:
+        """
+        Move every node of a story to its automatic position.
+
+        HTTP Method: POST
+        Endpoint: /api/stories/<id>/layout
+
+        Args:
+            id (int): The unique identifier of the story.
+
+        Side Effects:
+            Stores the new position of every node of the story.
+
+        Returns:
+            tuple: A JSON response with the new (x, y) position of every node by node ID and an HTTP status code 200.
+
+        Example:
+            POST /api/stories/1/layout
+            Response:
+            {
+                "message": "Layout applied",
+                "positions": {"1": [50, 50], "3": [350, 50], ...}
+            }
+        """
+        return jsonify({"message": "Layout applied", "positions": apply_story_layout(id)}), 200
+
+
+class StoryGraphResource(MethodView):
+    """
+    Resource for the part of a story graph shown in the editor's viewport.
+
+    Endpoints:
+        GET /api/stories/<id>/graph?bbox=x0,y0,x1,y1
+            Retrieve the nodes inside a viewport and the edges touching them.
+    """
+    def get(self, id: int) -> object:
+        """
+        Retrieve the nodes inside a viewport and the edges touching them, so that
+        the editor only loads what is on screen.
+
+        HTTP Method: GET
+        Endpoint: /api/stories/<id>/graph
+
+        Args:
+            id (int): The unique identifier of the story.
+
+        Query Parameters:
+            bbox (str): The viewport, as "x0,y0,x1,y1" in graph coordinates.
+
+        Returns:
+            tuple: A JSON response with the nodes overlapping the viewport, the edges leaving
+                   or reaching them, the position of their other ends and the size of the whole
+                   graph, with an HTTP status code 200. Nodes without a position are placed
+                   in the automatic layout first.
+
+        Example:
+            GET /api/stories/1/graph?bbox=0,0,1200,800
+            Response:
+            {
+                "nodes": [{"id": 1, "node_type": "START", "speaker": "Narrator", "x": 50.0, "y": 50.0}, ...],
+                "edges": [{"from": 1, "to": 3, "condition": "SUCCESS"}, ...],
+                "neighbors": {"7": [1850.0, 50.0]},
+                "extent": [1400.0, 530.0]
+            }
+        """
+        bbox = parse_bbox(request.args.get("bbox"))
+        return jsonify(get_story_graph(id, bbox)), 200
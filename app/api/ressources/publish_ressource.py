@@ -0,0 +1,132 @@
+import gzip
+import os
+import re
+from flask.views import MethodView
+from flask import abort, jsonify, request, send_file, url_for, Response
+from app.services.publish_service import get_bundle_path, get_story_versions, publish_story
+from app.utils.static_assets import IMMUTABLE_MAX_AGE
+
+_DIGEST = re.compile(r"[0-9a-f]{32}")
+
+
+def _version_payload(version) -> dict:
+    return {**version.serialize(), "url": url_for("api.story_bundle", digest=version.digest)}
+
+
+class StoryPublishResource(MethodView):
+    """
+    Resource for publishing stories.
+
+    Endpoints:
+        GET /api/stories/<id>/versions
+            List the published versions of a story.
+        POST /api/stories/<id>/versions
+            Publish the current draft of a story.
+    """
+    def get(self, id: int):
+        """
+        List the published versions of a story, the latest first.
+
+        HTTP Method: GET
+        Endpoint: /api/stories/<id>/versions
+
+        Args:
+            id (int): The unique identifier of the story.
+
+        Returns:
+            tuple: A JSON response containing the versions and an HTTP status code 200.
+
+        Example:
+            GET /api/stories/1/versions
+            Response:
+            {
+                "versions": [
+                    {
+                        "story_id": 1,
+                        "version": 2,
+                        "digest": "4f0c...",
+                        "size": 2048,
+                        "published_at": "2025-03-01T10:00:00",
+                        "url": "/api/bundles/4f0c..."
+                    },
+                    ...
+                ]
+            }
+        """
+        return jsonify({"versions": [_version_payload(version) for version in get_story_versions(id)]}), 200
+
+    def post(self, id: int):
+        """
+        Publish the current draft of a story. Readers starting the story from now on read this version.
+
+        HTTP Method: POST
+        Endpoint: /api/stories/<id>/versions
+
+        Args:
+            id (int): The unique identifier of the story.
+
+        Side Effects:
+            Compiles the story into a bundle file and records a new version,
+            unless the draft didn't change since the latest version.
+
+        Returns:
+            tuple: A JSON response describing the published version and an HTTP status code 201.
+
+        Example:
+            POST /api/stories/1/versions
+            Response:
+            {
+                "message": "Story published",
+                "story_id": 1,
+                "version": 3,
+                ...
+            }
+        """
+        version = publish_story(id)
+        return jsonify({"message": "Story published", **_version_payload(version)}), 201
+
+
+class StoryBundleResource(MethodView):
+    """
+    Resource serving the published bundles.
+
+    Endpoints:
+        GET /api/bundles/<digest>
+            Retrieve a published story bundle.
+    """
+    def get(self, digest: str):
+        """
+        Retrieve a published story bundle: the story, its nodes, edges and pictures as JSON.
+
+        Bundles never change once written, so they are served with an immutable
+        `Cache-Control`, gzipped as they are stored.
+
+        HTTP Method: GET
+        Endpoint: /api/bundles/<digest>
+
+        Args:
+            digest (str): The content hash of the bundle.
+
+        Returns:
+            Response: The bundle.
+
+        Raises:
+            404 Not Found: If no bundle has this hash.
+
+        Example:
+            GET /api/bundles/4f0c...
+        """
+        path = get_bundle_path(digest)
+        if not _DIGEST.fullmatch(digest) or not os.path.exists(path):
+            abort(404, description="Bundle not found")
+        if "gzip" in request.accept_encodings:
+            response = send_file(path, mimetype="application/json", max_age=IMMUTABLE_MAX_AGE)
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            with open(path, "rb") as file:
+                response = Response(gzip.decompress(file.read()), mimetype="application/json")
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        response.vary.add("Accept-Encoding")
+        return response
@@ -0,0 +1,52 @@
+from flask.views import MethodView
+from flask import jsonify, request
+from app.services.search_service import search
+
+
+class SearchResource(MethodView):
+    """
+    Resource for full-text search over stories and node content.
+
+    Endpoints:
+        GET /api/search?q=<words>&page=<n>&per_page=<n>&scope=<all|stories|nodes>
+            Search story titles, descriptions, node content and speakers.
+    """
+    def get(self):
+        """
+        Search stories and node content, best matches first.
+
+        HTTP Method: GET
+        Endpoint: /api/search
+
+        Query parameters:
+            q (str): The words to look for. The last one may be incomplete.
+            page (int): The 1-based page number (default 1).
+            per_page (int): The number of results per page (default 20, at most 100).
+            scope (str): "stories", "nodes" or "all" (default).
+
+        Returns:
+            tuple: A JSON response containing the page of results and an HTTP status code 200.
+
+        Example:
+            GET /api/search?q=greek
+            Response:
+            {
+                "results": [
+                    {
+                        "kind": "node",
+                        "id": 4,
+                        "story_id": 1,
+                        "story_title": "Test Story",
+                        "snippet": "what is the first <mark>greek</mark> letter ? alpha beta"
+                    }
+                ],
+                "page": 1,
+                "per_page": 20,
+                "has_more": false
+            }
+        """
+        query = request.args.get("q", "")
+        page = max(request.args.get("page", 1, type=int), 1)
+        per_page = min(max(request.args.get("per_page", 20, type=int), 1), 100)
+        scope = request.args.get("scope", "all")
+        return jsonify(search(query, page, per_page, scope)), 200
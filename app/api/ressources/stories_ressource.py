@@ -1,12 +1,16 @@
 # app/views/stories.py
 from flask.views import MethodView
-from flask import jsonify, request
+from flask import abort, jsonify, request
+from sqlalchemy.exc import NoResultFound
 from app.services.stories_service import (
     get_all_stories, get_next_nodes_id, get_story_by_id, get_story_node, update_story, 
-    get_story_nodes, create_story_node, update_story_node,
+    get_story_nodes, create_story_node, update_story_node, parse_node_fields, get_story_next_nodes_ids,
     delete_story_node, get_story_edges, create_story_edge,
-    delete_story_edge
+    delete_story_edge, clone_story, get_start_node_data
 )
+from app.services.assets_service import collect_assets
+from app.models import StoryNode
+from app.utils.instrumentation import timing
 
 class StoriesResource(MethodView):
     """
@@ -37,8 +41,10 @@ class StoriesResource(MethodView):
             }
         """
         stories = get_all_stories()
-        serialized = [story.serialize() for story in stories]
-        return jsonify({"stories": serialized}), 200
+        with timing("serialize"):
+            serialized = [story.serialize() for story in stories]
+            response = jsonify({"stories": serialized})
+        return response, 200
 
 
 class StoryDetailResource(MethodView):
@@ -107,6 +113,42 @@ class StoryDetailResource(MethodView):
         return jsonify({"message": "Story updated"}), 200
 
 
+class StoryCloneResource(MethodView):
+    """
+    Resource for duplicating a story.
+
+    Endpoints:
+        POST /api/stories/<id>/clone
+            Create a deep copy of a story, its nodes and its edges.
+    """
+    def post(self, id: int):
+        """
+        Clone a story, for instance to use it as the starting point of a new one.
+
+        HTTP Method: POST
+        Endpoint: /api/stories/<id>/clone
+
+        Args:
+            id (int): The unique identifier of the story to clone.
+
+        Side Effects:
+            Creates a new story with copies of all the nodes and edges of the original.
+
+        Returns:
+            tuple: A JSON response containing the new story's ID and an HTTP status code 201.
+
+        Example:
+            POST /api/stories/1/clone
+            Response:
+            {
+                "message": "Story cloned",
+                "story_id": 4
+            }
+        """
+        story = clone_story(id)
+        return jsonify({"message": "Story cloned", "story_id": story.id}), 201
+
+
 class StoryNodesResource(MethodView):
     """
     Resource for managing nodes associated with a specific story.
@@ -127,10 +169,21 @@ class StoryNodesResource(MethodView):
         Args:
             story_id (int): The unique identifier of the story.
 
+        Query Parameters:
+            fields (str, optional): Comma-separated fields to return, e.g. "id,node_type,speaker,next".
+                                    Columns that are not requested are not read from the database.
+
         Returns:
-            tuple: A JSON response containing a list of nodes (with additional 'next' node IDs) and an HTTP status code 200.
+            tuple: A JSON response containing a list of nodes (with additional 'next' node IDs), the paths
+                   of the pictures they reference by asset ID, and an HTTP status code 200.
 
         Example:
+            GET /api/stories/1/nodes?fields=node_type,next
+            Response:
+            {
+                "nodes": [{"id": 1, "node_type": "DIALOG", "next": [2, 3]}, ...]
+            }
+
             GET /api/stories/1/nodes
             Response:
             {
@@ -140,26 +193,31 @@ class StoryNodesResource(MethodView):
                         "node_type": "DIALOG",
                         "content": "Hello World",
                         "speaker": "Narrator",
-                        "left_img": "path/to/left.png",
-                        "right_img": "path/to/right.png",
+                        "left_img_id": 1,
+                        "right_img_id": 2,
+                        "background_img_id": 3,
                         "next": [2, 3]
                     },
                     ...
-                ]
+                ],
+                "assets": {"1": "path/to/left.png", "2": "path/to/right.png", "3": "path/to/bg.png"}
             }
         """
-        nodes = get_story_nodes(story_id)
-        result = [{
-            "id": n.id,
-            "node_type": n.node_type,
-            "content": n.content,
-            "speaker": n.speaker,
-            "left_img": n.left_img,
-            "right_img": n.right_img,
-            "background_img": n.background_img,
-            "next": get_next_nodes_id(n.id)
-        } for n in nodes]
-        return jsonify({"nodes": result}), 200
+        fields = parse_node_fields(request.args.get("fields"), extra=("next",))
+        nodes = get_story_nodes(story_id, fields)
+        with_next = fields is None or "next" in fields
+        next_ids = get_story_next_nodes_ids(story_id) if with_next else {}
+        columns = [field for field in fields or StoryNode.FIELDS if field != "next"]
+        with timing("serialize"):
+            result = []
+            for n in nodes:
+                item = {"id": n.id}
+                item.update((column, getattr(n, column)) for column in columns)
+                if with_next:
+                    item["next"] = next_ids.get(n.id, [])
+                result.append(item)
+            response = jsonify({"nodes": result, "assets": collect_assets(result)})
+        return response, 200
 
     def post(self, story_id: int):
         """
@@ -226,9 +284,12 @@ class StoryNodeDetailResource(MethodView):
         Args:
             id (int): The unique identifier of the node.
 
+        Query Parameters:
+            fields (str, optional): Comma-separated columns to return, e.g. "content,speaker".
+
         Returns:
-            tuple: A JSON response containing the serialized node data and a list of 'next' node IDs,
-                   with an HTTP status code 200.
+            tuple: A JSON response containing the serialized node data, a list of 'next' node IDs
+                   and the paths of the node's pictures by asset ID, with an HTTP status code 200.
 
         Example:
             GET /api/stories/nodes/2
@@ -239,16 +300,18 @@ class StoryNodeDetailResource(MethodView):
                     "type": "DIALOG",
                     "content": "Hello",
                     "speaker": "Narrator",
-                    "left_img": "path/to/left.png",
-                    "right_img": "path/to/right.png",
-                    "background_img": "path/to/bg.png"
+                    "left_img_id": 1,
+                    "right_img_id": 2,
+                    "background_img_id": 3
                 },
-                "next": [3, 4]
+                "next": [3, 4],
+                "assets": {"1": "path/to/left.png", "2": "path/to/right.png", "3": "path/to/bg.png"}
             }
         """
-        node_data = get_story_node(id)
+        node_data = get_story_node(id, parse_node_fields(request.args.get("fields")))
         next_nodes = get_next_nodes_id(id)
-        return jsonify({"data": node_data, "next": next_nodes}), 200
+        assets = collect_assets([node_data]) if node_data else {}
+        return jsonify({"data": node_data, "next": next_nodes, "assets": assets}), 200
 
     def put(self, id: int):
         """
@@ -311,6 +374,45 @@ class StoryNodeDetailResource(MethodView):
         return jsonify({"message": "Node deleted"}), 200
 
 
+class StoryStartNodeResource(MethodView):
+    """
+    Resource for the node a story starts with.
+
+    Endpoints:
+        GET /api/stories/<id>/start
+            Retrieve the start node of a story.
+    """
+    def get(self, id: int) -> object:
+        """
+        Retrieve the start node of a story, in the same format as a node detail.
+
+        HTTP Method: GET
+        Endpoint: /api/stories/<id>/start
+
+        Args:
+            id (int): The unique identifier of the story.
+
+        Returns:
+            tuple: A JSON response containing the serialized start node, a list of 'next' node IDs
+                   and the paths of the node's pictures by asset ID, with an HTTP status code 200.
+
+        Example:
+            GET /api/stories/1/start
+            Response:
+            {
+                "data": {"id": 1, "type": "START", "content": "...", ...},
+                "next": [2],
+                "assets": {"1": "path/to/left.png", ...}
+            }
+        """
+        try:
+            node_data = get_start_node_data(id)
+        except NoResultFound:
+            abort(404, description="Story not found")
+        next_nodes = get_next_nodes_id(node_data["id"])
+        return jsonify({"data": node_data, "next": next_nodes, "assets": collect_assets([node_data])}), 200
+
+
 class StoryEdgesResource(MethodView):
     """
     Resource for managing edges between nodes in a story.
@@ -347,9 +449,11 @@ class StoryEdgesResource(MethodView):
             }
         """
         edges = get_story_edges(story_id)
-        return jsonify({
-            "edges": [edge.serialize() for edge in edges]
-        }), 200
+        with timing("serialize"):
+            response = jsonify({
+                "edges": [edge.serialize() for edge in edges]
+            })
+        return response, 200
 
     def post(self, story_id: int):
         """
@@ -1,7 +1,7 @@
 from flask.views import MethodView
-from flask import jsonify, request, session
-from app.models.user_story import UserStory
-from app.services.users_service import create_user, get_user_story_info, update_user_story_info
+from flask import abort, jsonify, request, session
+from app.services.branching_service import advance_reader
+from app.services.users_service import create_user, get_user_story_data, update_user_story_info
 
 
 class UserRessource(MethodView):
@@ -93,8 +93,8 @@ class UserStoryRessource(MethodView):
         HTTP Method: GET
         Endpoint: /api/users/stories/<story_id>
 
-        The function extracts the user_id from the session, then uses the get_user_story_info
-        service to fetch the associated UserStory record. The record is serialized and returned as JSON.
+        The function extracts the user_id from the session, then uses the get_user_story_data
+        service to fetch the associated UserStory record, serialized, and returns it as JSON.
 
         Args:
             story_id (int): The unique identifier of the story.
@@ -114,8 +114,10 @@ class UserStoryRessource(MethodView):
             }
         """
         user_id: int = session["user_id"]
-        data: UserStory = get_user_story_info(user_id, story_id)
-        return jsonify(data.serialize()), 200
+        data: dict | None = get_user_story_data(user_id, story_id)
+        if data is None:
+            abort(404, description="Story not followed")
+        return jsonify(data), 200
 
     def put(self, story_id: int):
         """
@@ -125,29 +127,91 @@ class UserStoryRessource(MethodView):
         Endpoint: /api/users/stories/<story_id>
 
         This function extracts the user_id from the session and expects a JSON payload
-        containing fields to update (for example, 'progress' or 'health'). It then calls
-        the update_user_story_info service to commit the changes to the database.
+        containing fields to update (for example, 'health'). It then calls the
+        update_user_story_info service to commit the changes to the database.
+        The progress only moves with POST /api/userinfo/<story_id>/advance.
 
         Args:
             story_id (int): The unique identifier of the story.
 
         Request JSON body example:
             {
-                "progress": 10,
                 "health": 80
             }
 
         Returns:
             tuple: A JSON response confirming the update and an HTTP status code 200.
 
+        Raises:
+            400 Bad Request: If the payload sets the progress.
+
         Example:
             PUT /api/users/stories/2
             {
-                "progress": 10,
                 "health": 80
             }
         """
         user_id: int = session["user_id"]
         data = request.get_json()
         update_user_story_info(user_id, story_id, **data)
-        return jsonify({"message": "User story information updated successfully"}), 200
\ No newline at end of file
+        return jsonify({"message": "User story information updated successfully"}), 200
+
+
+class UserStoryAdvanceRessource(MethodView):
+    """
+    Resource moving the current user through a story.
+
+    The next node is chosen on the server, from the conditions of the edges
+    leaving the current node and the reader's state.
+    """
+
+    def post(self, story_id: int):
+        """
+        Move the current user past a node of a story.
+
+        HTTP Method: POST
+        Endpoint: /api/userinfo/<story_id>/advance
+
+        Args:
+            story_id (int): The unique identifier of the story.
+
+        Request JSON body example:
+            {
+                "node_id": 4,
+                "outcome": "wrong",
+                "choice": null
+            }
+
+        Side Effects:
+            Updates the progress and health of the user in the story.
+
+        Returns:
+            tuple: A JSON response with the next node ID (null to stay on the node) and the
+                   user's new health and progress, with an HTTP status code 200.
+
+        Raises:
+            401 Unauthorized: If no user is logged in.
+            400 Bad Request: If the node ID is missing or the outcome is unknown.
+            404 Not Found: If the user doesn't read the story.
+            409 Conflict: If the user is not on the node.
+
+        Example:
+            POST /api/userinfo/2/advance
+            Response:
+            {
+                "next": 6,
+                "health": 90,
+                "progress": 6
+            }
+        """
+        user_id = session.get("user_id")
+        if user_id is None:
+            abort(401, description="Not logged in")
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data.get("node_id"), int):
+            abort(400, description="Missing node_id")
+        choice = data.get("choice")
+        next_node_id, information = advance_reader(
+            user_id, story_id, data["node_id"], data.get("outcome"), choice if isinstance(choice, int) else None
+        )
+        return jsonify({"next": next_node_id, "health": information.health, "progress": information.progress}), 200
@@ -0,0 +1,167 @@
+"""
+Async entry point for readers.
+
+The reader endpoints (node detail, start node, user progress) are served by
+coroutines on an async SQLAlchemy engine (aiosqlite), so an open reader no
+longer holds a thread: one process keeps thousands of reader requests in
+flight, and the independent lookups of a request run concurrently. Every other
+request is passed to the Flask application, run on a thread pool, so the sync
+blueprints work unchanged.
+
+Only the central database is read asynchronously: the requests for a story kept
+in a shard (see `app.utils.shards`) fall through to the Flask application.
+
+    uvicorn --factory app.asgi:create_asgi_app --port 8000
+
+Configuration:
+    ASYNC_DB_POOL_SIZE (int): Connections of the async engine. Defaults to 8.
+    ASYNC_WSGI_THREADS (int): Threads running the Flask application. Defaults to 8.
+"""
+import asyncio
+from flask import Flask
+from itsdangerous import BadSignature
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.services import async_reader_service
+from app.utils.shards import node_shard
+from app.utils.asgi import Request, Router, WSGIAdapter, send_json
+
+try:
+    import aiosqlite
+except ImportError:  # aiosqlite is optional, only needed by the async entry point
+    aiosqlite = None
+
+
+router = Router()
+
+
+class AsyncReaderApp:
+    """
+    ASGI application serving the reader endpoints asynchronously and everything
+    else through the Flask application.
+
+    Args:
+        flask_app (Flask): The application whose database, session secret and routes are used.
+    """
+
+    def __init__(self, flask_app: Flask):
+        if aiosqlite is None:
+            raise RuntimeError("The async entry point requires the aiosqlite package")
+        from app.extensions import db
+        from app.utils.sqlite import configure_sqlite
+        self.flask_app = flask_app
+        flask_app.config.setdefault("ASYNC_DB_POOL_SIZE", 8)
+        flask_app.config.setdefault("ASYNC_WSGI_THREADS", 8)
+        with flask_app.app_context():
+            url = db.engine.url.set(drivername="sqlite+aiosqlite")
+        # file databases get no pool by default with aiosqlite
+        self.engine: AsyncEngine = create_async_engine(
+            url, poolclass=AsyncAdaptedQueuePool, pool_size=flask_app.config["ASYNC_DB_POOL_SIZE"], max_overflow=0
+        )
+        configure_sqlite(flask_app, self.engine.sync_engine)
+        self.wsgi = WSGIAdapter(flask_app.wsgi_app, flask_app.config["ASYNC_WSGI_THREADS"])
+        self._sessions = flask_app.session_interface.get_signing_serializer(flask_app)
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        route = router.match(scope["method"], scope["path"])
+        if route is not None:
+            handler, arguments = route
+            if await handler(self, Request(scope), send, *arguments) is not False:
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.flask_app.extensions["maintenance"].start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.flask_app.extensions["maintenance"].stop(timeout=10)
+                await self.engine.dispose()
+                self.wsgi.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def sharded(self, story_id: int) -> bool:
+        """Tell whether a story is kept in a shard, so that its requests are left to the Flask application."""
+        from app.extensions import shards
+        return shards.in_use and await async_reader_service.get_story_shard(self.engine, story_id) is not None
+
+    def session_user(self, request: Request) -> int | None:
+        """Return the user ID stored in the Flask session cookie of a request, if it is valid."""
+        cookie = request.cookies.get(self.flask_app.config["SESSION_COOKIE_NAME"])
+        if not cookie or self._sessions is None:
+            return None
+        max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            return self._sessions.loads(cookie, max_age=max_age).get("user_id")
+        except BadSignature:
+            return None
+
+
+@router.route("GET", r"/api/stories/nodes/(\d+)")
+async def node_detail(app: AsyncReaderApp, request: Request, send, node_id: int):
+    """Async variant of `StoryNodeDetailResource.get`; projections are left to the Flask resource."""
+    if "fields" in request.args or node_shard(node_id) is not None:
+        return False
+    found, next_nodes = await asyncio.gather(
+        async_reader_service.get_story_node(app.engine, node_id),
+        async_reader_service.get_next_nodes_id(app.engine, node_id)
+    )
+    node, assets = found if found is not None else (None, {})
+    await send_json(send, {"data": node, "next": next_nodes, "assets": assets})
+
+
+@router.route("GET", r"/api/stories/(\d+)/start")
+async def start_node(app: AsyncReaderApp, request: Request, send, story_id: int):
+    """Async variant of `StoryStartNodeResource.get`."""
+    sharded, found, next_nodes = await asyncio.gather(
+        app.sharded(story_id),
+        async_reader_service.get_start_node(app.engine, story_id),
+        async_reader_service.get_start_next_nodes_id(app.engine, story_id)
+    )
+    if sharded:
+        return False
+    if found is None:
+        await send_json(send, {"message": "Story not found"}, 404)
+        return
+    node, assets = found
+    await send_json(send, {"data": node, "next": next_nodes, "assets": assets})
+
+
+@router.route("GET", r"/api/userinfo/(\d+)")
+async def user_progress(app: AsyncReaderApp, request: Request, send, story_id: int):
+    """Async variant of `UserStoryRessource.get`."""
+    user_id = app.session_user(request)
+    if user_id is None:
+        await send_json(send, {"message": "Authentication required"}, 401)
+        return
+    sharded, information = await asyncio.gather(
+        app.sharded(story_id),
+        async_reader_service.get_user_story_info(app.engine, user_id, story_id)
+    )
+    if sharded:
+        return False
+    if information is None:
+        await send_json(send, {"message": "Story not followed"}, 404)
+        return
+    await send_json(send, information)
+
+
+def create_asgi_app(flask_app: Flask | None = None) -> AsyncReaderApp:
+    """
+    Create the async entry point, around a new Flask application by default.
+
+    Example:
+        >>> application = create_asgi_app(create_app())
+    """
+    if flask_app is None:
+        from app import create_app
+        flask_app = create_app()
+    return AsyncReaderApp(flask_app)
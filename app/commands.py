@@ -0,0 +1,105 @@
+"""
+Command line interface of the application, e.g. `flask --app run publish 1`.
+
+The modules behind the commands are imported when a command runs, so that
+they don't slow down the application factory.
+"""
+import logging
+import os
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command("serve")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8000, show_default=True, type=int)
+@click.option("--processes", "-p", default=os.cpu_count() or 1, show_default="CPU count", type=int)
+@click.option("--threads", "-t", default=8, show_default=True, type=int)
+@click.option("--graceful-timeout", default=30.0, show_default=True, type=float)
+@with_appcontext
+def serve_command(host: str, port: int, processes: int, threads: int, graceful_timeout: float):
+    """
+    Run the application with prefork workers.
+
+    With several processes, the "lru" cache backend is replaced by the "shared" one:
+    an in-process cache would keep serving what another worker invalidated.
+    """
+    from app.extensions import cache
+    from app.utils.prefork import PreforkServer
+    logging.basicConfig(level=logging.INFO, format="[%(process)d] %(levelname)s %(message)s")
+    app = current_app._get_current_object()
+    if processes > 1 and app.config["CACHE_BACKEND"] == "lru":
+        logging.getLogger(__name__).warning(
+            "The lru cache is per process: using the shared cache backend for %d processes", processes)
+        app.config["CACHE_BACKEND"] = "shared"
+        cache.init_app(app)
+    PreforkServer(app, host, port, processes, threads, graceful_timeout).run()
+
+
+@click.command("populate")
+@with_appcontext
+def populate_command():
+    """Fill an empty database with an example story."""
+    from populate import populate
+    populate()
+    click.echo("Example story added")
+
+
+@click.command("publish")
+@click.argument("story_ids", type=int, nargs=-1, required=True)
+@with_appcontext
+def publish_command(story_ids: tuple[int, ...]):
+    """Publish the current draft of the given stories."""
+    from app.services.publish_service import publish_story
+    for story_id in story_ids:
+        version = publish_story(story_id)
+        click.echo(f"Story {story_id}: version {version.version} ({version.digest})")
+
+
+@click.command("rebuild-stats")
+@with_appcontext
+def rebuild_stats_command():
+    """Recompute the reading statistics from the event log and the readers' progress."""
+    from app.services.events_service import rebuild_reading_stats
+    rebuild_reading_stats()
+    click.echo("Reading statistics rebuilt")
+
+
+@click.command("rebuild-search")
+@with_appcontext
+def rebuild_search_command():
+    """Re-index every story and node for search, each node in the database of its story."""
+    from app.extensions import db
+    from app.services.search_service import rebuild_search_index
+    rebuild_search_index()
+    db.session.commit()
+    click.echo("Search index rebuilt")
+
+
+@click.command("maintenance")
+@click.argument("jobs", nargs=-1)
+@with_appcontext
+def maintenance_command(jobs: tuple[str, ...]):
+    """Run maintenance jobs now, by default every scheduled one."""
+    from app.extensions import maintenance
+    names = jobs or [job.name for job in maintenance.jobs.values() if job.interval is not None]
+    for name in names:
+        if name not in maintenance.jobs:
+            raise click.BadParameter(f"unknown job {name!r}, expected one of {', '.join(maintenance.jobs)}")
+        click.echo(f"{name}: {maintenance.run_job(name)}")
+
+
+@click.command("import-twine")
+@click.argument("source", type=click.File("r", encoding="utf-8"))
+@click.option("--title", help="Title of the story, by default the one of the Twine story.")
+@with_appcontext
+def import_twine_command(source, title: str | None):
+    """Create a story from a Twee file or a Twine 2 HTML archive ("-" for stdin)."""
+    from werkzeug.exceptions import HTTPException
+    from app.services.import_service import import_twine_story
+    try:
+        story, counts = import_twine_story(source, title)
+    except HTTPException as error:
+        raise click.ClickException(error.description)
+    click.echo(f"Story {story.id} ({story.title}): {counts['nodes']} nodes, {counts['edges']} edges")
@@ -1,7 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
+from app.utils.static_assets import StaticAssets
+from app.utils.fragment_cache import FragmentCache
+from app.utils.instrumentation import Instrumentation
+from app.utils.metrics import Metrics
+from app.utils.admission import AdmissionControl
+from app.utils.cache import Cache
+from app.utils.maintenance import Maintenance
+from app.utils.shards import RoutingSession, ShardRouter
 # from flask_marshmallow import Marshmallow
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 # ma = Marshmallow()
-bcrypt = Bcrypt()
\ No newline at end of file
+bcrypt = Bcrypt()
+assets = StaticAssets()
+fragment_cache = FragmentCache()
+instrumentation = Instrumentation()
+metrics = Metrics()
+admission = AdmissionControl()
+cache = Cache()
+maintenance = Maintenance()
+shards = ShardRouter()
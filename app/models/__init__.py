@@ -1,5 +1,9 @@
+from app.models.asset import Asset
 from app.models.story import Story
 from app.models.user import User
 from app.models.story_node import StoryNode
 from app.models.story_edge import StoryEdge
-from app.models.user_story import UserStory
\ No newline at end of file
+from app.models.user_story import UserStory
+from app.models.story_version import StoryVersion
+from app.models.reading_event import ReadingEvent
+from app.models.reading_stats import NodeStats, StoryStats
@@ -0,0 +1,19 @@
+from app.extensions import db
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+
+class Asset(db.Model):
+    __tablename__ = "assets"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    path: Mapped[str] = mapped_column(unique=True)
+
+    def __repr__(self):
+        return f"<Asset {self.id} ({self.path})>"
+
+    def serialize(self) -> object:
+        return {
+            "id": self.id,
+            "path": self.path
+        }
@@ -0,0 +1,23 @@
+from datetime import datetime
+from app.extensions import db
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+
+class ReadingEvent(db.Model):
+    """Append-only log of what readers do, aggregated into NodeStats and StoryStats"""
+    __tablename__ = "reading_events"
+
+    KINDS = ("view", "correct", "wrong", "complete")
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    story_id: Mapped[int] = mapped_column(ForeignKey("stories.id"))
+    node_id: Mapped[int] = mapped_column()
+    # one of KINDS
+    kind: Mapped[str] = mapped_column()
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ReadingEvent {self.kind} user={self.user_id} node={self.node_id}>"
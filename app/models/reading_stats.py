@@ -0,0 +1,59 @@
+from app.extensions import db
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+
+class NodeStats(db.Model):
+    """Rollup of the reading events of a node, updated with every batch of events"""
+    __tablename__ = "node_stats"
+
+    node_id: Mapped[int] = mapped_column(primary_key=True)
+    story_id: Mapped[int] = mapped_column(ForeignKey("stories.id"), index=True)
+    views: Mapped[int] = mapped_column(default=0)
+    correct: Mapped[int] = mapped_column(default=0)
+    wrong: Mapped[int] = mapped_column(default=0)
+    # readers whose progress is this node
+    readers_here: Mapped[int] = mapped_column(default=0)
+
+    def __repr__(self):
+        return f"<NodeStats {self.node_id}>"
+
+    def serialize(self) -> object:
+        answers = self.correct + self.wrong
+        return {
+            "node_id": self.node_id,
+            "views": self.views,
+            "correct": self.correct,
+            "wrong": self.wrong,
+            "fail_rate": self.wrong / answers if answers else None,
+            "readers_here": self.readers_here
+        }
+
+
+class StoryStats(db.Model):
+    """Rollup of the reading events of a story"""
+    __tablename__ = "story_stats"
+
+    story_id: Mapped[int] = mapped_column(ForeignKey("stories.id"), primary_key=True)
+    readers: Mapped[int] = mapped_column(default=0)
+    views: Mapped[int] = mapped_column(default=0)
+    correct: Mapped[int] = mapped_column(default=0)
+    wrong: Mapped[int] = mapped_column(default=0)
+    completions: Mapped[int] = mapped_column(default=0)
+
+    def __repr__(self):
+        return f"<StoryStats {self.story_id}>"
+
+    def serialize(self) -> object:
+        answers = self.correct + self.wrong
+        return {
+            "story_id": self.story_id,
+            "readers": self.readers,
+            "views": self.views,
+            "correct": self.correct,
+            "wrong": self.wrong,
+            "fail_rate": self.wrong / answers if answers else None,
+            "completions": self.completions,
+            "completion_rate": self.completions / self.readers if self.readers else None
+        }
@@ -12,6 +12,8 @@ class Story(db.Model):
     id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column()
     description: Mapped[str]
+    # shard database of the nodes, edges and readers of the story, None for the central database
+    shard: Mapped[int | None] = mapped_column(nullable=True)
     
     # Existing relationship with StoryNode
     nodes: Mapped[list["StoryNode"]] = relationship(back_populates="story")
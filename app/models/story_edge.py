@@ -17,7 +17,8 @@ class StoryEdge(db.Model):
     )
     to_node_id: Mapped[int] = mapped_column(
         db.ForeignKey("story_nodes.id", ondelete="CASCADE"), 
-        primary_key=True
+        primary_key=True,
+        index=True  # edges reaching a node, the primary key only covers the ones leaving it
     )
     condition: Mapped[str] = mapped_column(default="SUCCESS")
 
@@ -1,6 +1,8 @@
 from app.extensions import db
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy import text
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import DeclarativeBase
@@ -8,42 +10,61 @@ from sqlalchemy.orm import relationship
 
 class StoryNode(db.Model):
     __tablename__ = "story_nodes"
+    # the nodes missing from the spatial index of the editor (see graph_service)
+    __table_args__ = (Index("ix_story_nodes_unplaced", "story_id", sqlite_where=text("x IS NULL")),)
 
     id: Mapped[int] = mapped_column(primary_key=True)
     node_type: Mapped[str] = mapped_column(default="DIALOG")
     content: Mapped[str] = mapped_column()
     speaker: Mapped[str] = mapped_column()
-    left_img: Mapped[str] = mapped_column()
-    right_img: Mapped[str] = mapped_column()
-    background_img: Mapped[str] = mapped_column()
+    # pictures are shared by many nodes, they are stored once in the assets table
+    left_img_id: Mapped[int | None] = mapped_column(ForeignKey("assets.id"), index=True)
+    right_img_id: Mapped[int | None] = mapped_column(ForeignKey("assets.id"), index=True)
+    background_img_id: Mapped[int | None] = mapped_column(ForeignKey("assets.id"), index=True)
     # one to many relation ship with Story (a story has many nodes)
     story_id: Mapped[int] = mapped_column(ForeignKey("stories.id"))
     story: Mapped["Story"] = relationship(back_populates="nodes")
+    # position in the editor, None until the node is placed (see layout_service)
+    x: Mapped[float | None] = mapped_column()
+    y: Mapped[float | None] = mapped_column()
     # many to many relations between node
 
+    # columns that can be requested with a `fields=` projection
+    FIELDS = ("node_type", "content", "speaker", "left_img_id", "right_img_id", "background_img_id")
+    # editor-only columns, only returned when requested with a projection
+    POSITION = ("x", "y")
+    # asset reference columns, by the name of the picture path accepted when writing a node
+    IMAGES = {"left_img": "left_img_id", "right_img": "right_img_id", "background_img": "background_img_id"}
+    DEFAULT_IMAGES = {
+        "left_img": "../static/images/p1.png",
+        "right_img": "../static/images/p2.png",
+        "background_img": "../static/images/joli_paysage.jpeg"
+    }
+
     def __repr__(self):
         return f"<StoryNode {self.id} ({self.node_type})>"
 
-    def serialize(self) -> object:
-        return {
-            "id": self.id,
-            "type": self.node_type,
-            "content": self.content,
-            "speaker": self.speaker,
-            "left_img": self.left_img,
-            "right_img": self.right_img,
-            "background_img": self.background_img
-        }
+    def serialize(self, fields: list[str] | None = None) -> object:
+        """Serialize the node, restricted to the given columns if `fields` is set"""
+        return self.serialize_row(self, fields)
+
+    @classmethod
+    def serialize_row(cls, row, fields: list[str] | None = None) -> dict:
+        """Serialize a node or a row of node columns (from a Core select), restricted to `fields` if set"""
+        if fields is None:
+            fields = cls.FIELDS
+        result = {"id": row.id}
+        for field in fields:
+            # the node type is exposed as "type"
+            result["type" if field == "node_type" else field] = getattr(row, field)
+        return result
     
     @classmethod
     def default(cls, parent: int, node_type: str = "DIALOG") -> "StoryNode":
-        """Create a default node"""
+        """Create a default node, without pictures (see DEFAULT_IMAGES)"""
         return cls(
             node_type=node_type,
             content="Node content",
             speaker="Speaker",
-            left_img="../static/images/p1.png",
-            right_img="../static/images/p2.png",
-            background_img="../static/images/joli_paysage.jpeg",
             story_id=parent
         )
\ No newline at end of file
@@ -0,0 +1,32 @@
+from datetime import datetime
+from app.extensions import db
+from sqlalchemy import ForeignKey
+from sqlalchemy import UniqueConstraint
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+
+class StoryVersion(db.Model):
+    """A published, immutable snapshot of a story, stored as a bundle file named after its content hash"""
+    __tablename__ = "story_versions"
+    __table_args__ = (UniqueConstraint("story_id", "version"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    story_id: Mapped[int] = mapped_column(ForeignKey("stories.id"), index=True)
+    # 1, 2, 3... for each story
+    version: Mapped[int] = mapped_column()
+    digest: Mapped[str] = mapped_column(index=True)
+    size: Mapped[int] = mapped_column()
+    published_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<StoryVersion {self.story_id} v{self.version}>"
+
+    def serialize(self) -> object:
+        return {
+            "story_id": self.story_id,
+            "version": self.version,
+            "digest": self.digest,
+            "size": self.size,
+            "published_at": self.published_at.isoformat()
+        }
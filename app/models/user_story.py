@@ -12,6 +12,8 @@ class UserStory(db.Model):
     # Store progress (this could be an integer, a percentage, or even a pointer to a StoryNode id)
     progress: Mapped[int] = mapped_column(db.Integer, default=0)
     health: Mapped[int] = mapped_column(db.Integer, default=100)
+    # published version of the story being read, None while the story has never been published
+    story_version: Mapped[int | None] = mapped_column(db.Integer, nullable=True)
     
     # Relationships back to User and Story
     user = relationship("User", back_populates="user_stories")
@@ -24,5 +26,6 @@ class UserStory(db.Model):
         return {
             "story_id": self.story_id,
             "progress": self.progress,
-            "health": self.health
+            "health": self.health,
+            "story_version": self.story_version
         }
\ No newline at end of file
@@ -1,10 +1,11 @@
 from flask import Blueprint, render_template
-from app.models.story import Story
-from app.services.stories_service import get_all_stories  # Adjust import as needed
+from app.services.stories_service import get_all_stories, get_catalog_version  # Adjust import as needed
+from app.utils.fragment_cache import Deferred
 
 bp = Blueprint('home', __name__)
 
 @bp.route("/")
 def home():
-    stories: list[Story] = get_all_stories()  # Retrieve all available stories
-    return render_template("index.html", stories=stories)
\ No newline at end of file
+    # the stories are only queried when the cached story grid is stale
+    stories = Deferred(get_all_stories)
+    return render_template("index.html", stories=stories, catalog_version=get_catalog_version())
@@ -1,9 +1,10 @@
-from flask import Blueprint, render_template, request, session, redirect, flash
+from flask import Blueprint, render_template, request, session, redirect, flash, url_for
 from app.models.story import Story
 from app.models.user import User
 from app.services.stories_service import get_story_by_id
-from app.services.users_service import add_story_to_user, get_user_by_id, user_reads_story
+from app.services.users_service import add_story_to_user, get_reading_version, get_user_by_id
 from app.utils import require_auth
+from app.utils.transactions import transaction
 
 bp = Blueprint('story_read', __name__, url_prefix="/read")
 
@@ -12,8 +13,13 @@ bp = Blueprint('story_read', __name__, url_prefix="/read")
 def read(story_id: int):
     """
     This route will render the visual story.
+    Published stories are read from the bundle of the reader's version, drafts from the live API.
     """
     user_id: int = session["user_id"]
-    if not user_reads_story(user_id, story_id):
+    with transaction():
+        # idempotent: a no-op for a reader of the story
         add_story_to_user(user_id, story_id)
-    return render_template("read.html", story_id=story_id, user_id=user_id)
+    # after the enrollment is committed: pinning a version is a write of its own
+    version = get_reading_version(user_id, story_id)
+    bundle_url = url_for("api.story_bundle", digest=version.digest) if version else ""
+    return render_template("read.html", story_id=story_id, user_id=user_id, bundle_url=bundle_url)
@@ -0,0 +1,96 @@
+from typing import Iterable
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.sqlite import insert
+from app.models import Asset, StoryNode
+from app.extensions import db, shards
+
+
+def get_or_create_asset(path: str | None) -> int | None:
+    """
+    Retrieve the identifier of the asset stored at a path, creating the asset if needed.
+
+    Args:
+        path (str | None): The path of the picture.
+
+    Returns:
+        int | None: The asset's unique identifier, or None for an empty path.
+
+    Side Effects:
+        May add an asset within the current transaction.
+
+    Example:
+        >>> asset_id = get_or_create_asset("../static/images/p1.png")
+    """
+    if not path:
+        return None
+    # looked up first: the insert would take the write lock of the central database even for a known path
+    asset_id = db.session.execute(select(Asset.id).where(Asset.path == path)).scalar()
+    if asset_id is not None:
+        return asset_id
+    # concurrent writers may add the same path: let the unique constraint pick one
+    db.session.execute(insert(Asset).values(path=path).on_conflict_do_nothing(index_elements=["path"]))
+    return db.session.execute(select(Asset.id).where(Asset.path == path)).scalar_one()
+
+
+def get_assets(asset_ids: Iterable[int]) -> dict[int, str]:
+    """
+    Retrieve the paths of a set of assets.
+
+    Args:
+        asset_ids (Iterable[int]): The unique identifiers of the assets. None values are ignored.
+
+    Returns:
+        dict[int, str]: The asset paths by asset ID.
+
+    Example:
+        >>> get_assets([1, 2])
+        {1: "../static/images/p1.png", 2: "../static/images/p2.png"}
+    """
+    asset_ids = {asset_id for asset_id in asset_ids if asset_id is not None}
+    if not asset_ids:
+        return {}
+    rows = db.session.execute(select(Asset.id, Asset.path).where(Asset.id.in_(asset_ids)))
+    return dict(rows.all())
+
+
+def collect_assets(nodes: Iterable[dict]) -> dict[int, str]:
+    """
+    Retrieve the paths of the assets referenced by serialized nodes, in a single query.
+
+    Args:
+        nodes (Iterable[dict]): Serialized nodes, possibly restricted to some fields.
+
+    Returns:
+        dict[int, str]: The asset paths by asset ID, to send once alongside the nodes.
+
+    Example:
+        >>> collect_assets([{"id": 1, "left_img_id": 1, "right_img_id": 2}])
+        {1: "../static/images/p1.png", 2: "../static/images/p2.png"}
+    """
+    columns = StoryNode.IMAGES.values()
+    return get_assets(node[column] for node in nodes for column in columns if column in node)
+
+
+def get_asset_nodes(asset_id: int) -> list[int]:
+    """
+    Retrieve the identifiers of the nodes showing an asset.
+
+    Each asset reference column is indexed, so this doesn't scan the nodes table.
+    The nodes of every shard are searched.
+
+    Args:
+        asset_id (int): The unique identifier of the asset.
+
+    Returns:
+        list[int]: The IDs of the nodes using the asset as any of their pictures.
+
+    Example:
+        >>> node_ids = get_asset_nodes(1)
+    """
+    statement = (
+        select(StoryNode.id)
+        .where(or_(*(getattr(StoryNode, column) == asset_id for column in StoryNode.IMAGES.values())))
+        .order_by(StoryNode.id)
+    )
+    # the IDs of a shard are above the central ones and below the ones of the next shard
+    return [node_id for _ in shards.each() for node_id in db.session.scalars(statement)]
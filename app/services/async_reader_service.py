@@ -0,0 +1,172 @@
+"""
+Reader lookups on the async engine (see `app.asgi`).
+
+Every function opens its own connection, so that independent lookups of one
+request can run concurrently with `asyncio.gather`. The results have the same
+shape as the ones of the synchronous services.
+
+The engine is the one of the central database: the stories kept in a shard
+(see `app.utils.shards`) are left to the synchronous services.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import aliased
+from app.models import Asset, Story, StoryEdge, StoryNode, UserStory
+
+
+_LEFT, _RIGHT, _BACKGROUND = (aliased(Asset, name=name) for name in ("left_img", "right_img", "background_img"))
+
+# a node with the paths of its pictures, in one statement
+_NODE_WITH_ASSETS = (
+    select(
+        StoryNode.id,
+        *(getattr(StoryNode, column) for column in StoryNode.FIELDS),
+        _LEFT.path.label("left_img"),
+        _RIGHT.path.label("right_img"),
+        _BACKGROUND.path.label("background_img")
+    )
+    .outerjoin(_LEFT, _LEFT.id == StoryNode.left_img_id)
+    .outerjoin(_RIGHT, _RIGHT.id == StoryNode.right_img_id)
+    .outerjoin(_BACKGROUND, _BACKGROUND.id == StoryNode.background_img_id)
+)
+
+
+def _serialize_node(row) -> tuple[dict, dict[int, str]]:
+    node = {"id": row.id}
+    for field in StoryNode.FIELDS:
+        node["type" if field == "node_type" else field] = getattr(row, field)
+    assets = {}
+    for name, column in StoryNode.IMAGES.items():
+        if node[column] is not None:
+            assets[node[column]] = getattr(row, name)
+    return node, assets
+
+
+async def get_story_node(engine: AsyncEngine, story_node_id: int) -> tuple[dict, dict[int, str]] | None:
+    """
+    Retrieve a story node and the paths of its pictures.
+
+    Args:
+        engine (AsyncEngine): The async engine.
+        story_node_id (int): The unique identifier of the story node.
+
+    Returns:
+        tuple[dict, dict[int, str]] | None: The serialized node and its picture paths by asset ID,
+                                            or None if no node exists with the provided ID.
+
+    Example:
+        >>> node, assets = await get_story_node(engine, 3)
+    """
+    async with engine.connect() as connection:
+        row = (await connection.execute(_NODE_WITH_ASSETS.where(StoryNode.id == story_node_id))).first()
+    return _serialize_node(row) if row is not None else None
+
+
+async def get_start_node(engine: AsyncEngine, story_id: int) -> tuple[dict, dict[int, str]] | None:
+    """
+    Retrieve the start node of a story and the paths of its pictures.
+
+    Args:
+        engine (AsyncEngine): The async engine.
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        tuple[dict, dict[int, str]] | None: The serialized node and its picture paths by asset ID,
+                                            or None if the story has no start node.
+
+    Example:
+        >>> node, assets = await get_start_node(engine, 1)
+    """
+    async with engine.connect() as connection:
+        row = (await connection.execute(
+            _NODE_WITH_ASSETS.where(StoryNode.story_id == story_id, StoryNode.node_type == "START")
+        )).first()
+    return _serialize_node(row) if row is not None else None
+
+
+async def get_next_nodes_id(engine: AsyncEngine, story_node_id: int) -> list[int]:
+    """
+    Retrieve the identifiers of all nodes that follow a given story node.
+
+    Args:
+        engine (AsyncEngine): The async engine.
+        story_node_id (int): The unique identifier of the story node.
+
+    Returns:
+        list[int]: The IDs of the 'next' nodes.
+
+    Example:
+        >>> next_ids = await get_next_nodes_id(engine, 3)
+    """
+    async with engine.connect() as connection:
+        result = await connection.execute(
+            select(StoryEdge.to_node_id).where(StoryEdge.from_node_id == story_node_id)
+        )
+        return list(result.scalars())
+
+
+async def get_start_next_nodes_id(engine: AsyncEngine, story_id: int) -> list[int]:
+    """
+    Retrieve the identifiers of the nodes that follow the start node of a story,
+    without knowing the start node's ID beforehand.
+
+    Args:
+        engine (AsyncEngine): The async engine.
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        list[int]: The IDs of the 'next' nodes of the start node.
+
+    Example:
+        >>> next_ids = await get_start_next_nodes_id(engine, 1)
+    """
+    async with engine.connect() as connection:
+        result = await connection.execute(
+            select(StoryEdge.to_node_id)
+            .join(StoryNode, StoryNode.id == StoryEdge.from_node_id)
+            .where(StoryNode.story_id == story_id, StoryNode.node_type == "START")
+        )
+        return list(result.scalars())
+
+
+async def get_user_story_info(engine: AsyncEngine, user_id: int, story_id: int) -> dict | None:
+    """
+    Retrieve the progress of a user in a story.
+
+    Args:
+        engine (AsyncEngine): The async engine.
+        user_id (int): The unique identifier of the user.
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict | None: The serialized UserStory record, or None if the user doesn't read the story.
+
+    Example:
+        >>> await get_user_story_info(engine, 1, 2)
+        {"story_id": 2, "progress": 5, "health": 100, "story_version": 1}
+    """
+    async with engine.connect() as connection:
+        row = (await connection.execute(
+            select(UserStory.story_id, UserStory.progress, UserStory.health, UserStory.story_version)
+            .where(UserStory.user_id == user_id, UserStory.story_id == story_id)
+        )).first()
+    return row._asdict() if row is not None else None
+
+
+async def get_story_shard(engine: AsyncEngine, story_id: int) -> int | None:
+    """
+    Retrieve the shard holding the nodes and readers of a story.
+
+    Args:
+        engine (AsyncEngine): The async engine.
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        int | None: The shard bucket, or None if the story is in the central database or doesn't exist.
+
+    Example:
+        >>> await get_story_shard(engine, 2)
+        3
+    """
+    async with engine.connect() as connection:
+        return (await connection.execute(select(Story.shard).where(Story.id == story_id))).scalar()
@@ -0,0 +1,208 @@
+"""
+Branching: choosing the node a reader goes to next.
+
+The edges of a story are compiled once into its branch table, mapping each node
+to its (next node, predicate) pairs in order. Advancing a reader is then a dict
+lookup and a few predicate calls, without parsing or reading the edges again.
+
+Branch tables are kept per process: the draft one until the story's graph
+changes (its cache namespace is bumped), the ones of published versions for
+good, since versions never change.
+"""
+import gzip
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable
+from flask import abort
+from sqlalchemy import select
+from app.models import StoryEdge, StoryNode, StoryVersion, UserStory
+from app.extensions import cache, db
+from app.services.events_service import move_reader
+from app.services.publish_service import get_bundle_path, get_story_version
+from app.services.stories_service import _story_namespace, get_story_shard
+from app.services.users_service import get_user_story_info
+from app.utils.conditions import ConditionError, Predicate, compile_condition
+from app.utils.shards import routed
+from app.utils.transactions import transactional
+
+
+logger = logging.getLogger(__name__)
+
+WRONG_ANSWER_DAMAGE = 10
+OUTCOMES = (None, "correct", "wrong")
+# branch tables kept per process, drafts and published versions each
+MAX_BRANCH_TABLES = 256
+
+Branches = dict[int, list[tuple[int, Predicate]]]
+
+_drafts: OrderedDict[int, tuple[int, Branches]] = OrderedDict()
+_versions: OrderedDict[tuple[int, int], Branches] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _never(state: dict) -> bool:
+    return False
+
+
+def compile_branches(edges: Iterable[tuple[int, int, str]]) -> Branches:
+    """
+    Compile the (from, to, condition) edges of a story into its branch table.
+
+    Conditions are validated when edges are saved; one that still doesn't compile
+    (an old bundle, a manual edit) is logged and never followed.
+
+    Example:
+        >>> branches = compile_branches([(1, 3, "SUCCESS"), (1, 4, "FAIL")])
+        >>> choose_next(branches, 1, {"outcome": "wrong", "health": 90, "choice": None})
+        4
+    """
+    branches: Branches = {}
+    for from_node_id, to_node_id, condition in edges:
+        try:
+            predicate = compile_condition(condition)
+        except ConditionError as error:
+            logger.warning("Edge %d -> %d is never followed, invalid condition: %s", from_node_id, to_node_id, error)
+            predicate = _never
+        branches.setdefault(from_node_id, []).append((to_node_id, predicate))
+    return branches
+
+
+def _remember(tables: OrderedDict, key, value) -> None:
+    with _lock:
+        tables[key] = value
+        tables.move_to_end(key)
+        while len(tables) > MAX_BRANCH_TABLES:
+            tables.popitem(last=False)
+
+
+@routed("story_id", get_story_shard)
+def get_draft_branches(story_id: int) -> Branches:
+    """
+    Retrieve the branch table of the current draft of a story.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        Branches: The (next node ID, predicate) pairs of every node with outgoing edges.
+
+    Example:
+        >>> branches = get_draft_branches(1)
+    """
+    # read before the edges: a graph changed meanwhile is reloaded on the next call
+    version = cache.version(_story_namespace(story_id))
+    table = _drafts.get(story_id)
+    if table is not None and table[0] == version:
+        return table[1]
+    edges = db.session.execute(
+        select(StoryEdge.from_node_id, StoryEdge.to_node_id, StoryEdge.condition)
+        .join(StoryNode, StoryEdge.from_node_id == StoryNode.id)
+        .where(StoryNode.story_id == story_id)
+        .order_by(StoryEdge.from_node_id, StoryEdge.to_node_id)
+    ).all()
+    branches = compile_branches(edges)
+    _remember(_drafts, story_id, (version, branches))
+    return branches
+
+
+def get_version_branches(story_id: int, version: int) -> Branches:
+    """
+    Retrieve the branch table of a published version of a story, compiled from its bundle.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+        version (int): The version number.
+
+    Returns:
+        Branches: The (next node ID, predicate) pairs of every node with outgoing edges.
+
+    Raises:
+        404 Not Found: If the story has no such version.
+
+    Example:
+        >>> branches = get_version_branches(1, 2)
+    """
+    branches = _versions.get((story_id, version))
+    if branches is not None:
+        return branches
+    story_version: StoryVersion = get_story_version(story_id, version)
+    with gzip.open(get_bundle_path(story_version.digest), "rt", encoding="utf-8") as file:
+        bundle = json.load(file)
+    branches = compile_branches(bundle["edges"])
+    _remember(_versions, (story_id, version), branches)
+    return branches
+
+
+def choose_next(branches: Branches, node_id: int, state: dict) -> int | None:
+    """
+    Return the first node after `node_id` whose edge condition holds for the state, or None.
+
+    Example:
+        >>> choose_next(branches, 1, {"outcome": None, "health": 100, "choice": None})
+        3
+    """
+    for to_node_id, predicate in branches.get(node_id, ()):
+        if predicate(state):
+            return to_node_id
+    return None
+
+
+@routed("story_id", get_story_shard)
+@transactional(immediate=True)
+def advance_reader(user_id: int, story_id: int, node_id: int, outcome: str | None = None,
+                   choice: int | None = None) -> tuple[int | None, UserStory]:
+    """
+    Move a reader past a node, along the first edge whose condition holds.
+
+    A wrong answer costs `WRONG_ANSWER_DAMAGE` health before the conditions are
+    evaluated. Readers of a published version follow the edges of that version,
+    the others the edges of the draft. When no edge is followed the reader stays
+    on the node (e.g. a wrong answer with only SUCCESS edges).
+
+    Args:
+        user_id (int): The unique identifier of the reader.
+        story_id (int): The unique identifier of the story.
+        node_id (int): The node the reader leaves.
+        outcome (str | None): "correct" or "wrong" after a quiz, None otherwise.
+        choice (int | None): The option picked by the reader, if any.
+
+    Returns:
+        tuple[int | None, UserStory]: The next node ID (None if the reader stays on the node),
+                                      and the reader's record with its new progress and health.
+
+    Raises:
+        400 Bad Request: If the outcome is unknown.
+        404 Not Found: If the user doesn't read the story.
+        409 Conflict: If the reader is not on the node.
+
+    Side Effects:
+        Updates the reader's progress and health, and the readers counted on the nodes,
+        within the current transaction.
+
+    Example:
+        >>> next_node_id, information = advance_reader(1, 1, 4, outcome="wrong")
+        >>> next_node_id, information.health
+        (6, 90)
+    """
+    if outcome not in OUTCOMES:
+        abort(400, description="Unknown outcome")
+    information: UserStory | None = get_user_story_info(user_id, story_id)
+    if information is None:
+        abort(404, description="Story not followed")
+    if node_id != information.progress:
+        # a stale page, or another tab that advanced meanwhile
+        abort(409, description="The reader is not on this node")
+    health = information.health
+    if outcome == "wrong":
+        health = max(0, health - WRONG_ANSWER_DAMAGE)
+    if information.story_version is not None:
+        branches = get_version_branches(story_id, information.story_version)
+    else:
+        branches = get_draft_branches(story_id)
+    next_node_id = choose_next(branches, node_id, {"outcome": outcome, "health": health, "choice": choice})
+    information.health = health
+    if next_node_id is not None:
+        move_reader(information, next_node_id)
+    return next_node_id, information
@@ -0,0 +1,262 @@
+from collections import Counter
+from flask import abort
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as upsert
+from app.models import NodeStats, ReadingEvent, StoryNode, StoryStats, UserStory
+from app.extensions import db, shards
+from app.services.stories_service import get_story_by_id, get_story_shard
+from app.utils.shards import NODE_ID_BITS, node_shard, routed, use_shard
+from app.utils.transactions import transactional
+
+
+MAX_BATCH_SIZE = 500
+
+_NODE_COUNTERS = ("views", "correct", "wrong", "readers_here")
+_STORY_COUNTERS = ("readers", "views", "correct", "wrong", "completions")
+_COUNTED_KINDS = {"view": "views", "correct": "correct", "wrong": "wrong", "complete": "completions"}
+
+
+def _add_node_stats(deltas: dict[int, Counter], stories: dict[int, int]) -> None:
+    rows = [{"node_id": node_id, "story_id": stories[node_id],
+             **{counter: delta.get(counter, 0) for counter in _NODE_COUNTERS}}
+            for node_id, delta in deltas.items()]
+    if not rows:
+        return
+    statement = upsert(NodeStats)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[NodeStats.node_id],
+        set_={counter: getattr(NodeStats, counter) + getattr(statement.excluded, counter)
+              for counter in _NODE_COUNTERS}
+    ), rows)
+
+
+def _add_story_stats(deltas: dict[int, Counter]) -> None:
+    rows = [{"story_id": story_id, **{counter: delta.get(counter, 0) for counter in _STORY_COUNTERS}}
+            for story_id, delta in deltas.items()]
+    if not rows:
+        return
+    statement = upsert(StoryStats)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[StoryStats.story_id],
+        set_={counter: getattr(StoryStats, counter) + getattr(statement.excluded, counter)
+              for counter in _STORY_COUNTERS}
+    ), rows)
+
+
+def record_enrollment(story_id: int, start_node_id: int) -> None:
+    """
+    Count a new reader of a story, positioned on its start node.
+
+    Call it in the shard of the story, like the services writing `user_stories`.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+        start_node_id (int): The unique identifier of the story's start node.
+
+    Side Effects:
+        Updates the rollups within the current transaction.
+
+    Example:
+        >>> record_enrollment(2, 7)
+    """
+    _add_node_stats({start_node_id: Counter(readers_here=1)}, {start_node_id: story_id})
+    _add_story_stats({story_id: Counter(readers=1)})
+
+
+def move_reader(reading: UserStory, node_id: int) -> None:
+    """
+    Move a reader's progress to a node, and their count from the node they leave to that one.
+
+    Every change of `UserStory.progress` goes through here, so that the number of
+    readers on each node, the drop-off, stays right. Call it in the shard of the
+    story: the rollups are kept next to the readers.
+
+    Args:
+        reading (UserStory): The reader's record.
+        node_id (int): The node the reader is now on.
+
+    Side Effects:
+        Updates the record and the rollups within the current transaction.
+
+    Example:
+        >>> move_reader(get_user_story_info(1, 2), 8)
+    """
+    if reading.progress == node_id:
+        return
+    # the reader left their previous node
+    _add_node_stats({reading.progress: Counter(readers_here=-1), node_id: Counter(readers_here=1)},
+                    {reading.progress: reading.story_id, node_id: reading.story_id})
+    reading.progress = node_id
+
+
+@transactional
+def record_events(user_id: int, events: list[dict]) -> int:
+    """
+    Append a batch of reading events to the log and fold them into the rollups.
+
+    The events are written with one bulk insert, and the per-node and per-story
+    counters are updated with one upsert each, from the counts of the batch only:
+    the log itself is never scanned. Events and rollups are kept in the database of
+    their story, so a batch on a sharded story writes to its shard only. Events
+    don't move the reader's progress: a batch may arrive late, after the reader
+    advanced (see `advance_reader`).
+
+    Args:
+        user_id (int): The unique identifier of the reader.
+        events (list[dict]): The events, in the order they happened, each with a
+                             "story_id", a "node_id" and a "kind" (see `ReadingEvent.KINDS`).
+
+    Returns:
+        int: The number of recorded events.
+
+    Raises:
+        400 Bad Request: If the batch is too large, an event is malformed or a node
+                         doesn't belong to the given story.
+
+    Side Effects:
+        Inserts the events and updates the rollups within the current transaction.
+
+    Example:
+        >>> record_events(1, [{"story_id": 1, "node_id": 3, "kind": "view"},
+        ...                   {"story_id": 1, "node_id": 3, "kind": "wrong"}])
+        2
+    """
+    if len(events) > MAX_BATCH_SIZE:
+        abort(400, description=f"At most {MAX_BATCH_SIZE} events per batch")
+    try:
+        rows = [{
+            "user_id": user_id,
+            "story_id": int(event["story_id"]),
+            "node_id": int(event["node_id"]),
+            "kind": str(event["kind"])
+        } for event in events]
+    except (KeyError, TypeError, ValueError):
+        abort(400, description="Malformed event")
+    if not rows:
+        return 0
+    if any(row["kind"] not in ReadingEvent.KINDS for row in rows):
+        abort(400, description="Unknown event kind")
+    # the node IDs carry their shard, which is the one of their story
+    batches: dict[int | None, list[dict]] = {}
+    for row in rows:
+        batches.setdefault(node_shard(row["node_id"]), []).append(row)
+    for shard, batch in batches.items():
+        with use_shard(shard):
+            _record_batch(batch)
+    return len(rows)
+
+
+def _record_batch(rows: list[dict]) -> None:
+    # the insert comes first: it takes the write lock without a read snapshot that another writer could invalidate
+    # (an unknown node rolls it back)
+    db.session.execute(insert(ReadingEvent), rows)
+    stories: dict[int, int] = dict(db.session.execute(
+        select(StoryNode.id, StoryNode.story_id).where(StoryNode.id.in_({row["node_id"] for row in rows}))
+    ).all())
+    if any(stories.get(row["node_id"]) != row["story_id"] for row in rows):
+        abort(400, description="Unknown node")
+
+    node_deltas: dict[int, Counter] = {}
+    story_deltas: dict[int, Counter] = {}
+    for row in rows:
+        counter = _COUNTED_KINDS[row["kind"]]
+        story_deltas.setdefault(row["story_id"], Counter())[counter] += 1
+        if row["kind"] != "complete":
+            node_deltas.setdefault(row["node_id"], Counter())[counter] += 1
+
+    _add_node_stats(node_deltas, stories)
+    _add_story_stats(story_deltas)
+
+
+@routed("story_id", get_story_shard)
+def get_story_stats(story_id: int) -> dict:
+    """
+    Retrieve the reading statistics of a story and of each of its nodes, from the rollups.
+
+    The drop-off of a node is the number of readers whose progress stopped there,
+    END nodes excluded.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict: The story statistics and the statistics of every node that was reached.
+
+    Raises:
+        404 Not Found: If no story exists with the provided ID.
+
+    Example:
+        >>> get_story_stats(1)
+        {"story": {"story_id": 1, "readers": 12, ...}, "nodes": [{"node_id": 1, "views": 12, ...}, ...]}
+    """
+    get_story_by_id(story_id)
+    story_stats = db.session.get(StoryStats, story_id) or StoryStats(
+        story_id=story_id, **{counter: 0 for counter in _STORY_COUNTERS}
+    )
+    node_types = dict(db.session.execute(
+        select(StoryNode.id, StoryNode.node_type).where(StoryNode.story_id == story_id)
+    ).all())
+    rows = db.session.scalars(
+        select(NodeStats).where(NodeStats.story_id == story_id).order_by(NodeStats.node_id)
+    )
+    nodes = []
+    for node_stats in rows:
+        node_type = node_types.get(node_stats.node_id)
+        if node_type is None:  # deleted node
+            continue
+        item = node_stats.serialize()
+        item["drop_off"] = 0 if node_type == "END" else node_stats.readers_here
+        nodes.append(item)
+    return {"story": story_stats.serialize(), "nodes": nodes}
+
+
+@transactional
+def rebuild_reading_stats() -> None:
+    """
+    Recompute every rollup from the event log and the readers' progress.
+
+    Only needed to initialize the rollups of existing data, or to repair them.
+    The rollups of each database, central or shard, are rebuilt from its own log and readers.
+    Events of sharded stories found in the central log (where they were kept before
+    the rollups moved to the shards) are moved to their shard first.
+
+    Side Effects:
+        Replaces the content of the rollup tables within the current transaction.
+
+    Example:
+        >>> rebuild_reading_stats()
+    """
+    misplaced: dict[int, list[dict]] = {}
+    for event in db.session.execute(select(ReadingEvent.__table__).where(ReadingEvent.node_id >= 1 << NODE_ID_BITS)):
+        misplaced.setdefault(node_shard(event.node_id), []).append(event._asdict())
+    if misplaced:
+        db.session.execute(delete(ReadingEvent).where(ReadingEvent.node_id >= 1 << NODE_ID_BITS))
+        for shard, events in misplaced.items():
+            with use_shard(shard):
+                db.session.execute(insert(ReadingEvent), [{**event, "id": None} for event in events])
+    for _ in shards.each():
+        db.session.execute(delete(NodeStats))
+        db.session.execute(delete(StoryStats))
+        node_deltas: dict[int, Counter] = {}
+        story_deltas: dict[int, Counter] = {}
+        stories: dict[int, int] = {}
+        counts = db.session.execute(
+            select(ReadingEvent.story_id, ReadingEvent.node_id, ReadingEvent.kind, func.count())
+            .group_by(ReadingEvent.story_id, ReadingEvent.node_id, ReadingEvent.kind)
+        )
+        for story_id, node_id, kind, count in counts:
+            counter = _COUNTED_KINDS[kind]
+            story_deltas.setdefault(story_id, Counter())[counter] += count
+            if kind != "complete":
+                node_deltas.setdefault(node_id, Counter())[counter] += count
+                stories[node_id] = story_id
+        positions = db.session.execute(
+            select(UserStory.story_id, UserStory.progress, func.count())
+            .group_by(UserStory.story_id, UserStory.progress)
+        )
+        for story_id, progress, count in positions:
+            node_deltas.setdefault(progress, Counter())["readers_here"] += count
+            story_deltas.setdefault(story_id, Counter())["readers"] += count
+            stories[progress] = story_id
+        _add_node_stats(node_deltas, stories)
+        _add_story_stats(story_deltas)
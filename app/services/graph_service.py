@@ -0,0 +1,191 @@
+"""
+Viewport queries of the story editor.
+
+The boxes of the placed nodes are kept in an SQLite R*Tree, with the story as a
+third dimension so that a lookup only visits the nodes of one story. Triggers on
+`story_nodes` keep it in sync with every write of a position, including the bulk
+ones (layouts, clones), so the services don't have to.
+
+Nodes created without a position (through the API, or imported from a source
+without one) are given their place in the automatic layout by the first viewport
+query that finds them, once and for good: every node is then in the R*Tree, and
+a viewport only ever reads the nodes it shows.
+"""
+from flask import abort
+from sqlalchemy import text
+from app.extensions import db
+from app.services.layout_service import get_story_layout
+from app.services.stories_service import get_story_by_id, get_story_shard
+from app.utils.shards import routed
+from app.utils.transactions import in_transaction, transactional
+
+
+# size of a node drawn in the editor, nodes are indexed by their whole box
+NODE_WIDTH = 150
+NODE_HEIGHT = 80
+
+_NODE_BOX = f"{{row}}.id, {{row}}.story_id, {{row}}.story_id, {{row}}.x, {{row}}.x + {NODE_WIDTH}, {{row}}.y, {{row}}.y + {NODE_HEIGHT}"
+
+SPATIAL_TABLES = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS story_nodes_rtree USING rtree(
+        id, min_story, max_story, min_x, max_x, min_y, max_y
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS story_nodes_rtree_insert AFTER INSERT ON story_nodes
+        WHEN new.x IS NOT NULL AND new.y IS NOT NULL BEGIN
+        INSERT INTO story_nodes_rtree VALUES ({_NODE_BOX.format(row="new")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS story_nodes_rtree_update AFTER UPDATE OF x, y, story_id ON story_nodes BEGIN
+        DELETE FROM story_nodes_rtree WHERE id = old.id;
+        INSERT INTO story_nodes_rtree SELECT {_NODE_BOX.format(row="new")} WHERE new.x IS NOT NULL AND new.y IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS story_nodes_rtree_delete AFTER DELETE ON story_nodes BEGIN
+        DELETE FROM story_nodes_rtree WHERE id = old.id;
+    END""",
+]
+
+# the rtree stores 32-bit floats, so its story bounds are only approximate for large IDs:
+# the join on story_nodes keeps the exact ones
+_VISIBLE_NODES = """
+    SELECT n.id FROM story_nodes_rtree AS r JOIN story_nodes AS n ON n.id = r.id
+    WHERE r.min_story <= :story_id AND r.max_story >= :story_id
+      AND r.max_x >= :x0 AND r.min_x <= :x1 AND r.max_y >= :y0 AND r.min_y <= :y1
+      AND n.story_id = :story_id"""
+# over the partial index of the unplaced nodes
+_HAS_UNPLACED = "SELECT 1 FROM story_nodes WHERE story_id = :story_id AND x IS NULL LIMIT 1"
+# a node the author placed meanwhile keeps its position
+_PLACE_NODE = "UPDATE story_nodes SET x = :x, y = :y WHERE id = :id AND x IS NULL"
+
+
+def create_spatial_index() -> None:
+    """
+    Create the spatial index of the node positions and fill it if it is empty.
+
+    Side Effects:
+        Creates the `story_nodes_rtree` table and the triggers keeping it in sync
+        with `story_nodes` and, on first run, indexes every placed node.
+
+    Example:
+        >>> create_spatial_index()
+    """
+    for statement in SPATIAL_TABLES:
+        db.session.execute(text(statement))
+    indexed = db.session.execute(text("SELECT count(*) FROM story_nodes_rtree")).scalar()
+    if not indexed:
+        db.session.execute(text(
+            f"INSERT INTO story_nodes_rtree SELECT {_NODE_BOX.format(row='story_nodes')} "
+            "FROM story_nodes WHERE x IS NOT NULL AND y IS NOT NULL"
+        ))
+    db.session.commit()
+
+
+def parse_bbox(value: str | None) -> tuple[float, float, float, float]:
+    """
+    Parse a `bbox=x0,y0,x1,y1` viewport parameter.
+
+    Raises:
+        400 Bad Request: If the box is missing or malformed.
+
+    Example:
+        >>> parse_bbox("0,0,1200,800")
+        (0.0, 0.0, 1200.0, 800.0)
+    """
+    try:
+        x0, y0, x1, y1 = (float(coordinate) for coordinate in (value or "").split(","))
+    except ValueError:
+        abort(400, description="Expected bbox=x0,y0,x1,y1")
+    if x1 < x0 or y1 < y0:
+        abort(400, description="Empty bbox")
+    return x0, y0, x1, y1
+
+
+@routed("story_id", get_story_shard)
+def place_unplaced_nodes(story_id: int) -> None:
+    """
+    Move the nodes of a story that have no position to their position in the automatic layout.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Side Effects:
+        Updates the positions of the unplaced nodes, and so the spatial index, in a
+        transaction of its own unless called within one.
+
+    Example:
+        >>> place_unplaced_nodes(1)
+    """
+    positions = get_story_layout(story_id)
+    if not in_transaction():
+        # end the read transaction: the update must be the first statement of its own
+        db.session.commit()
+    _place_nodes(story_id, positions)
+
+
+@routed("story_id", get_story_shard)
+@transactional
+def _place_nodes(story_id: int, positions: dict[int, tuple[float, float]]) -> None:
+    if positions:
+        db.session.execute(text(_PLACE_NODE), [{"id": node_id, "x": x, "y": y} for node_id, (x, y) in positions.items()])
+
+
+@routed("story_id", get_story_shard)
+def get_story_graph(story_id: int, bbox: tuple[float, float, float, float]) -> dict:
+    """
+    Retrieve the part of a story graph visible in a viewport of the editor.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+        bbox (tuple[float, float, float, float]): The viewport, as (x0, y0, x1, y1).
+
+    Returns:
+        dict: "nodes", the nodes overlapping the viewport; "edges", the edges leaving or reaching them; "neighbors", the position of
+              the other ends of these edges, by node ID; and "extent", the (width, height)
+              of the whole graph.
+
+    Raises:
+        404 Not Found: If no story exists with the provided ID.
+
+    Side Effects:
+        Places the nodes without a position first, see `place_unplaced_nodes`.
+
+    Example:
+        >>> get_story_graph(1, (0, 0, 1200, 800))
+        {"nodes": [{"id": 1, "node_type": "START", "speaker": "...", "x": 50.0, "y": 50.0}, ...],
+         "edges": [{"from": 1, "to": 3, "condition": "SUCCESS"}, ...],
+         "neighbors": {"7": [1850.0, 50.0]},
+         "extent": [1400.0, 530.0]}
+    """
+    get_story_by_id(story_id)
+    x0, y0, x1, y1 = bbox
+    parameters = {"story_id": story_id, "x0": x0, "y0": y0, "x1": x1, "y1": y1}
+    if db.session.execute(text(_HAS_UNPLACED), parameters).first() is not None:
+        place_unplaced_nodes(story_id)
+    nodes = db.session.execute(text(f"""
+        SELECT id, node_type, speaker, x, y FROM story_nodes WHERE id IN ({_VISIBLE_NODES})
+    """), parameters).mappings().all()
+    edges = db.session.execute(text(f"""
+        WITH visible(id) AS ({_VISIBLE_NODES})
+        SELECT from_node_id, to_node_id, condition FROM story_edges WHERE from_node_id IN visible
+        UNION
+        SELECT from_node_id, to_node_id, condition FROM story_edges WHERE to_node_id IN visible
+    """), parameters).all()
+
+    loaded = {node["id"] for node in nodes}
+    outside = {end for edge in edges for end in edge[:2] if end not in loaded}
+    neighbors = {}
+    if outside:
+        neighbors = {
+            node_id: [x, y] for node_id, x, y in db.session.execute(
+                text("SELECT id, x, y FROM story_nodes WHERE id IN (SELECT value FROM json_each(:ids))"),
+                {"ids": f"[{','.join(map(str, outside))}]"}
+            )
+        }
+    extent = db.session.execute(text("""
+        SELECT max(r.max_x), max(r.max_y) FROM story_nodes_rtree AS r JOIN story_nodes AS n ON n.id = r.id
+        WHERE r.min_story <= :story_id AND r.max_story >= :story_id AND n.story_id = :story_id
+    """), parameters).one()
+    return {
+        "nodes": [dict(node) for node in nodes],
+        "edges": [{"from": from_node, "to": to_node, "condition": condition} for from_node, to_node, condition in edges],
+        "neighbors": neighbors,
+        "extent": [extent[0] or 0, extent[1] or 0],
+    }
@@ -0,0 +1,162 @@
+"""
+Import of stories written with Twine, from Twee source or Twine 2 HTML archives.
+
+Passages become nodes and their links become edges. The source is parsed as a
+stream (`app.utils.twine`) and the nodes are inserted in batches of
+`IMPORT_BATCH` as it is read: only the node IDs by passage name and the links
+waiting for their target are kept until the end.
+"""
+import html
+import itertools
+import re
+from typing import IO
+from flask import abort
+from sqlalchemy import insert, update
+from app.models import Story, StoryEdge, StoryNode
+from app.extensions import cache, db, shards
+from app.services.search_service import index_new_nodes, index_story
+from app.services.stories_service import _NODES, bump_catalog_version
+from app.utils.shards import use_shard
+from app.utils.transactions import on_commit, transactional
+from app.utils.twine import LINK, Passage, TwineError, TwineStory, parse_twine, split_link
+
+# nodes inserted per statement
+IMPORT_BATCH = 500
+_PARAGRAPHS = re.compile(r"\n[ \t]*\n+")
+
+
+def passage_content(passage: Passage) -> tuple[str, list[tuple[str, int]]]:
+    """
+    Convert the text of a passage to the HTML content of a node.
+
+    Blank lines separate paragraphs. Each link becomes an option of the node
+    (`<button data-choice="N">`), which the reader follows along a `choice == N` edge.
+
+    Args:
+        passage (Passage): The passage to convert.
+
+    Returns:
+        tuple[str, list[tuple[str, int]]]: The content, and the target and source line
+                                           of each link, in the order of the options.
+
+    Example:
+        >>> passage_content(Passage("Start", "Go [[north->Cave]]", 1, 2))
+        ('<p>Go <button data-choice="1">north</button></p>', [('Cave', 2)])
+    """
+    links: list[tuple[str, int]] = []
+
+    def option(match: re.Match) -> str:
+        label, target = split_link(match.group(1))
+        links.append((target, passage.text_line + passage.text.count("\n", 0, match.start())))
+        return f'<button data-choice="{len(links)}">{html.escape(label)}</button>'
+
+    text = LINK.sub(option, passage.text)
+    paragraphs = [paragraph.strip() for paragraph in _PARAGRAPHS.split(text) if paragraph.strip()]
+    return "".join(f"<p>{paragraph.replace(chr(10), '<br>')}</p>" for paragraph in paragraphs), links
+
+
+def _edge_conditions(links: list[tuple[str, int]]) -> dict[str, tuple[str, int]]:
+    # one edge per target: its condition holds for every option leading there
+    targets = {target for target, _ in links}
+    conditions: dict[str, tuple[str, int]] = {}
+    for choice, (target, line) in enumerate(links, 1):
+        if len(targets) == 1:
+            conditions[target] = ("ALWAYS", line)
+        elif target in conditions:
+            conditions[target] = (f"{conditions[target][0]} or choice == {choice}", conditions[target][1])
+        else:
+            conditions[target] = (f"choice == {choice}", line)
+    return conditions
+
+
+@transactional
+def import_twine_story(file: IO[str], title: str | None = None) -> tuple[Story, dict]:
+    """
+    Create a story from a Twine source, Twee or Twine 2 HTML.
+
+    Every passage becomes a node: its text the content, its links the options of
+    the node and its edges (see `passage_content`), its position in Twine the
+    position in the editor. The starting passage becomes the START node,
+    passages without links END nodes and the others DIALOG nodes. Code
+    passages (scripts, stylesheets) are left out.
+
+    Args:
+        file (IO[str]): The source, in text mode. It is read once, from its current position.
+        title (str | None): The title of the story, by default the one of the Twine story.
+
+    Returns:
+        tuple[Story, dict]: The new story, and the numbers of "nodes" and "edges" imported.
+
+    Raises:
+        400 Bad Request: If the source can't be parsed, has two passages with the same name,
+                         no passage, or links to a passage it doesn't have;
+                         the description gives the line of the error.
+
+    Side Effects:
+        Inserts the story, its nodes and its edges and indexes them for search within the
+        current transaction, in the shard of the story when sharding is on. Nothing is kept
+        if the source is invalid. The catalog version is bumped once committed.
+
+    Example:
+        >>> with open("cave.twee", encoding="utf-8") as file:
+        ...     story, counts = import_twine_story(file)
+        >>> counts
+        {"nodes": 42, "edges": 57}
+    """
+    twine = TwineStory()
+    story = Story(title=title or "Imported story", description="Imported from Twine")
+    db.session.add(story)
+    db.session.flush()
+    story.shard = shard = shards.shard_for_new_story(story.id)
+    node_ids: dict[str, int] = {}
+    # links waiting for all the passages to be read: (from node ID, target, condition, line)
+    links: list[tuple[int, str, str, int]] = []
+    try:
+        with use_shard(shard):
+            connection = db.session.connection(bind_arguments=_NODES)
+            passages = parse_twine(file, twine)
+            while batch := list(itertools.islice(passages, IMPORT_BATCH)):
+                rows, conditions, names = [], [], set()
+                for passage in batch:
+                    if passage.name in node_ids or passage.name in names:
+                        raise TwineError(f"Duplicate passage {passage.name!r}", passage.line)
+                    names.add(passage.name)
+                    content, options = passage_content(passage)
+                    x, y = passage.position or (None, None)
+                    rows.append({"name": passage.name, "story_id": story.id, "content": content, "speaker": "",
+                                 "node_type": "DIALOG" if options else "END", "x": x, "y": y})
+                    conditions.append(_edge_conditions(options))
+                # new rows get increasing IDs in the order of the values: sorted, the IDs match the rows
+                # (asking SQLAlchemy to keep the order would insert them one at a time)
+                ids = sorted(connection.execute(
+                    insert(StoryNode).returning(StoryNode.id),
+                    [{key: value for key, value in row.items() if key != "name"} for row in rows]
+                ).scalars())
+                for node_id, row, targets in zip(ids, rows, conditions):
+                    node_ids[row["name"]] = node_id
+                    links.extend((node_id, target, condition, line) for target, (condition, line) in targets.items())
+                index_new_nodes([{"id": node_id, "content": row["content"], "speaker": "", "story_id": story.id}
+                                 for node_id, row in zip(ids, rows)])
+            if not node_ids:
+                raise TwineError("No passages", 1)
+            for start in range(0, len(links), IMPORT_BATCH):
+                edges = []
+                for from_node_id, target, condition, line in links[start:start + IMPORT_BATCH]:
+                    if target not in node_ids:
+                        raise TwineError(f"Link to the unknown passage {target!r}", line)
+                    edges.append({"from_node_id": from_node_id, "to_node_id": node_ids[target], "condition": condition})
+                connection.execute(insert(StoryEdge), edges)
+            # without a known starting passage, the story starts with the first one
+            start_id = node_ids.get(twine.start, next(iter(node_ids.values())))
+            connection.execute(update(StoryNode).where(StoryNode.id == start_id).values(node_type="START"))
+    except TwineError as error:
+        abort(400, description=f"Invalid Twine story: {error}")
+    except UnicodeDecodeError:
+        abort(400, description="Invalid Twine story: not UTF-8 text")
+    if title is None and twine.title:
+        story.title = twine.title
+    index_story(story)
+    story_id = story.id
+    on_commit(lambda: cache.set(f"shard:{story_id}", shard, timeout=0))
+    on_commit(bump_catalog_version)
+    return story, {"nodes": len(node_ids), "edges": len(links)}
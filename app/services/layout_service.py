@@ -0,0 +1,222 @@
+"""
+Automatic layout of story graphs, Sugiyama style: nodes are ranked in layers by
+their distance from the start, layers are ordered to reduce edge crossings, then
+coordinates are assigned. Layers go from left to right, like the story reads.
+"""
+import hashlib
+from collections import deque
+from dataclasses import dataclass, field
+from sqlalchemy import select, update
+from app.models import StoryEdge, StoryNode
+from app.extensions import cache, db
+from app.services.stories_service import get_story_by_id, get_story_shard, _story_namespace
+from app.utils.shards import routed
+from app.utils.transactions import transactional
+
+
+LAYER_SPACING = 300
+NODE_SPACING = 150
+MARGIN = 50
+# barycenter sweeps (down then up) of the crossing reduction
+SWEEPS = 4
+# at most this share of changed layers is re-ordered incrementally, above it the whole graph is
+INCREMENTAL_RATIO = 0.25
+
+
+@dataclass
+class LayoutState:
+    """The ranks and orders of a layout, kept to lay out the next version of the graph incrementally."""
+    rank: dict[int, int] = field(default_factory=dict)
+    order: dict[int, int] = field(default_factory=dict)
+    signatures: list[str] = field(default_factory=list)
+
+
+def _rank(nodes: list[int], successors: dict[int, list[int]], roots: list[int]) -> dict[int, int]:
+    # breadth-first distance from the roots: every edge goes at most one layer forward
+    rank: dict[int, int] = {}
+    for root in [*roots, *nodes]:
+        if root in rank:
+            continue
+        rank[root] = 0
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            for successor in successors.get(node, ()):
+                if successor not in rank:
+                    rank[successor] = rank[node] + 1
+                    queue.append(successor)
+    return rank
+
+
+def _signature(layer: list[int], predecessors: dict[int, list[int]]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for node in sorted(layer):
+        digest.update(f"{node}:{sorted(predecessors.get(node, ()))};".encode())
+    return digest.hexdigest()
+
+
+def _reorder(layer: list[int], neighbors: dict[int, list[int]], position: dict[int, int]) -> None:
+    # barycenter heuristic: sort a layer by the mean position of its neighbors in the adjacent layer
+    def barycenter(node: int) -> float:
+        adjacent = neighbors.get(node)
+        if not adjacent:
+            return position[node]
+        return sum(position[other] for other in adjacent) / len(adjacent)
+    layer.sort(key=barycenter)
+    for index, node in enumerate(layer):
+        position[node] = index
+
+
+def compute_layout(nodes: list[int], edges: list[tuple[int, int]], roots: list[int],
+                   previous: LayoutState | None = None) -> tuple[dict[int, tuple[float, float]], LayoutState]:
+    """
+    Lay out a directed graph in layers.
+
+    1. Ranking: each node goes in the layer of its breadth-first distance from
+       the roots (then from any node left unreached), so edges either join
+       adjacent layers or go backwards. Backward edges are ignored by the next steps.
+    2. Crossing reduction: layers are sorted by the barycenter of their neighbors
+       in the adjacent layer, sweeping down then up `SWEEPS` times.
+    3. Coordinates: a node is placed level with the median of its predecessors,
+       then pushed down to keep `NODE_SPACING` with the node above it.
+
+    With a `previous` state, layers keep their previous order and only the layers
+    whose nodes or incoming edges changed (and their neighbors) are re-ordered,
+    unless more than `INCREMENTAL_RATIO` of them changed.
+
+    Args:
+        nodes (list[int]): The node IDs.
+        edges (list[tuple[int, int]]): The (from, to) edges.
+        roots (list[int]): The nodes of the first layer, e.g. the START node.
+        previous (LayoutState | None): The state of the layout of the previous version of the graph.
+
+    Returns:
+        tuple[dict[int, tuple[float, float]], LayoutState]: The (x, y) position of every node,
+                                                             and the state to pass for the next version.
+
+    Example:
+        >>> positions, state = compute_layout([1, 2, 3], [(1, 2), (1, 3)], roots=[1])
+        >>> positions[2]
+        (350, 50)
+    """
+    successors: dict[int, list[int]] = {}
+    for from_node, to_node in edges:
+        successors.setdefault(from_node, []).append(to_node)
+    rank = _rank(nodes, successors, roots)
+
+    # only the edges between adjacent layers are laid out
+    down: dict[int, list[int]] = {}
+    up: dict[int, list[int]] = {}
+    for from_node, to_node in edges:
+        if rank.get(to_node) == rank.get(from_node, -2) + 1:
+            down.setdefault(to_node, []).append(from_node)
+            up.setdefault(from_node, []).append(to_node)
+
+    layers: list[list[int]] = [[] for _ in range(max(rank.values(), default=-1) + 1)]
+    for node in sorted(rank, key=lambda node: (previous.order.get(node, len(nodes)) if previous else 0)):
+        layers[rank[node]].append(node)
+    position = {node: index for layer in layers for index, node in enumerate(layer)}
+    signatures = [_signature(layer, down) for layer in layers]
+
+    if previous is None:
+        changed = set(range(len(layers)))
+    else:
+        changed = {index for index, signature in enumerate(signatures)
+                   if index >= len(previous.signatures) or previous.signatures[index] != signature}
+    if len(changed) > INCREMENTAL_RATIO * len(layers):
+        changed = set(range(len(layers)))
+    swept = {index for layer in changed for index in (layer - 1, layer, layer + 1) if 0 <= index < len(layers)}
+
+    for _ in range(SWEEPS if swept else 0):
+        for index in range(1, len(layers)):
+            if index in swept:
+                _reorder(layers[index], down, position)
+        for index in range(len(layers) - 2, -1, -1):
+            if index in swept:
+                _reorder(layers[index], up, position)
+
+    y: dict[int, float] = {}
+    for layer in layers:
+        bottom = None
+        for node in layer:
+            parents = sorted(y[parent] for parent in down.get(node, ()))
+            wanted = parents[len(parents) // 2] if parents else 0
+            y[node] = wanted if bottom is None else max(wanted, bottom + NODE_SPACING)
+            bottom = y[node]
+    top = min(y.values(), default=0)
+    positions = {node: (MARGIN + rank[node] * LAYER_SPACING, MARGIN + y[node] - top) for node in rank}
+    return positions, LayoutState(rank, position, signatures)
+
+
+def _load_graph(story_id: int) -> tuple[list[int], list[tuple[int, int]], list[int]]:
+    nodes = db.session.execute(
+        select(StoryNode.id, StoryNode.node_type).where(StoryNode.story_id == story_id).order_by(StoryNode.id)
+    ).all()
+    edges = db.session.execute(
+        select(StoryEdge.from_node_id, StoryEdge.to_node_id)
+        .join(StoryNode, StoryEdge.from_node_id == StoryNode.id)
+        .where(StoryNode.story_id == story_id)
+    ).all()
+    roots = [node_id for node_id, node_type in nodes if node_type == "START"]
+    return [node_id for node_id, _ in nodes], [tuple(edge) for edge in edges], roots
+
+
+@routed("story_id", get_story_shard)
+def get_story_layout(story_id: int) -> dict[int, tuple[float, float]]:
+    """
+    Compute the automatic layout of a story graph.
+
+    The layout is cached for the current version of the graph. When the graph
+    changed, it is computed incrementally from the layout of the previous version.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict[int, tuple[float, float]]: The (x, y) position of every node, by node ID.
+
+    Raises:
+        404 Not Found: If no story exists with the provided ID.
+
+    Example:
+        >>> get_story_layout(1)
+        {1: (50, 50), 3: (350, 50), ...}
+    """
+    get_story_by_id(story_id)
+
+    def load() -> dict[int, tuple[float, float]]:
+        previous: LayoutState | None = cache.get(f"layout_state:{story_id}")
+        positions, state = compute_layout(*_load_graph(story_id), previous=previous)
+        cache.set(f"layout_state:{story_id}", state, timeout=0)
+        return positions
+    return cache.get_or_set("layout", load, namespace=_story_namespace(story_id))
+
+
+@routed("story_id", get_story_shard)
+@transactional(immediate=True)
+def apply_story_layout(story_id: int) -> dict[int, tuple[float, float]]:
+    """
+    Move every node of a story to its position in the automatic layout.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict[int, tuple[float, float]]: The new (x, y) position of every node, by node ID.
+
+    Raises:
+        404 Not Found: If no story exists with the provided ID.
+
+    Side Effects:
+        Updates the positions of the nodes within the current transaction.
+
+    Example:
+        >>> positions = apply_story_layout(1)
+    """
+    positions = get_story_layout(story_id)
+    if positions:
+        db.session.execute(
+            update(StoryNode),
+            [{"id": node_id, "x": x, "y": y} for node_id, (x, y) in positions.items()]
+        )
+    return positions
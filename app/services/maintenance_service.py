@@ -0,0 +1,228 @@
+"""
+Database upkeep and cache warm-up, run periodically by the maintenance scheduler
+(`app.utils.maintenance`) or once with `flask --app run maintenance`.
+
+Each job does a bounded amount of work and returns a summary of what it did,
+which the scheduler logs. The database jobs go over the central database and
+every shard.
+"""
+import logging
+from collections import Counter
+from typing import Callable
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+from app.models import StoryNode, UserStory
+from app.extensions import db, shards
+from app.services.branching_service import get_draft_branches
+from app.services.stories_service import get_story_next_nodes_ids, get_story_node
+
+
+logger = logging.getLogger(__name__)
+
+# rows sampled per index by ANALYZE, enough for the planner and bounded on large tables
+ANALYSIS_LIMIT = 1000
+# free pages released per step of the incremental vacuum
+VACUUM_STEP_PAGES = 256
+WARM_STORIES = 20
+WARM_NODES = 200
+
+
+def _engines() -> list[Engine]:
+    return [db.engine, *(shards.engine(shard) for shard in shards.existing())]
+
+
+def optimize_database() -> dict:
+    """
+    Refresh the statistics of the query planner.
+
+    ANALYZE samples at most `ANALYSIS_LIMIT` rows per index, so its cost doesn't
+    grow with the tables; `PRAGMA optimize` then lets SQLite do whatever else it
+    finds worthwhile.
+
+    Returns:
+        dict: "databases", the number of databases analyzed; "tables", the number of tables with statistics.
+
+    Side Effects:
+        Writes the `sqlite_stat1` table of every database.
+
+    Example:
+        >>> optimize_database()
+        {"databases": 1, "tables": 12}
+    """
+    engines = _engines()
+    tables = 0
+    for engine in engines:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+            connection.exec_driver_sql("ANALYZE")
+            connection.exec_driver_sql("PRAGMA optimize")
+            tables += connection.exec_driver_sql("SELECT count(DISTINCT tbl) FROM sqlite_stat1").scalar()
+    return {"databases": len(engines), "tables": tables}
+
+
+def checkpoint_wal(mode: str = "PASSIVE") -> dict:
+    """
+    Copy the pages of the write-ahead log back into the database.
+
+    A PASSIVE checkpoint never waits for readers or writers: it copies what it
+    can, and the next run copies the rest.
+
+    Args:
+        mode (str): "PASSIVE", "FULL", "RESTART" or "TRUNCATE".
+
+    Returns:
+        dict: "busy", the number of blocked checkpoints; "log", the pages in the logs;
+              "checkpointed", the pages copied back.
+
+    Example:
+        >>> checkpoint_wal()
+        {"busy": 0, "log": 812, "checkpointed": 812}
+    """
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Unknown checkpoint mode {mode!r}")
+    totals = Counter(busy=0, log=0, checkpointed=0)
+    for engine in _engines():
+        # a checkpoint can't run inside a transaction: use the DB-API connection directly
+        with engine.connect() as connection:
+            busy, log, checkpointed = connection.connection.dbapi_connection.execute(
+                f"PRAGMA wal_checkpoint({mode})").fetchone()
+        totals.update(busy=busy, log=max(log, 0), checkpointed=max(checkpointed, 0))
+    return dict(totals)
+
+
+def vacuum_free_pages(max_pages: int | None = None, should_stop: Callable[[], bool] | None = None) -> dict:
+    """
+    Give the free pages of the database back to the file system, a few at a time.
+
+    Only databases in incremental auto-vacuum mode can do so; the others are left
+    untouched until `vacuum_database` converts them.
+
+    Args:
+        max_pages (int | None): The most pages released by this run, None for all of them.
+        should_stop (Callable[[], bool] | None): Checked between steps, to stop early.
+
+    Returns:
+        dict: "released", the pages given back; "free", the free pages left.
+
+    Example:
+        >>> vacuum_free_pages(max_pages=1024)
+        {"released": 1024, "free": 310}
+    """
+    released = free_left = 0
+    for engine in _engines():
+        with engine.connect() as connection:
+            cursor = connection.connection.dbapi_connection
+            free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:  # 2 is INCREMENTAL
+                if free:
+                    logger.info("%d free pages in %s, run `flask maintenance vacuum_full` to vacuum incrementally",
+                                free, engine.url.database)
+                free_left += free
+                continue
+            while free and (max_pages is None or released < max_pages):
+                if should_stop is not None and should_stop():
+                    break
+                step = min(VACUUM_STEP_PAGES, free if max_pages is None else min(free, max_pages - released))
+                cursor.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+                left = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+                released += free - left
+                if left >= free:
+                    break
+                free = left
+            free_left += free
+    return {"released": released, "free": free_left}
+
+
+def vacuum_database() -> dict:
+    """
+    Rebuild the whole databases, which also switches them to incremental auto-vacuum.
+
+    VACUUM locks a database for its whole duration and needs as much free disk
+    as the database takes: it is never scheduled, only run by hand.
+
+    Returns:
+        dict: "pages", the size of the databases in pages afterwards.
+
+    Example:
+        >>> vacuum_database()
+        {"pages": 5120}
+    """
+    pages = 0
+    for engine in _engines():
+        with engine.connect() as connection:
+            cursor = connection.connection.dbapi_connection
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+            pages += cursor.execute("PRAGMA page_count").fetchone()[0]
+    return {"pages": pages}
+
+
+def get_most_read_stories(limit: int = WARM_STORIES) -> list[int]:
+    """
+    Return the IDs of the stories with the most readers, most read first.
+
+    Example:
+        >>> get_most_read_stories(3)
+        [4, 1, 7]
+    """
+    # the readers of a story are all in its shard: the top of each shard holds the overall top
+    counts = Counter()
+    for _ in shards.each():
+        counts.update(dict(db.session.execute(
+            select(UserStory.story_id, func.count()).group_by(UserStory.story_id)
+            .order_by(func.count().desc(), UserStory.story_id).limit(limit)
+        ).all()))
+    return [story_id for story_id, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+
+def get_busiest_nodes(limit: int = WARM_NODES) -> list[int]:
+    """
+    Return the IDs of the nodes where the most readers currently are, busiest first.
+
+    Example:
+        >>> get_busiest_nodes(3)
+        [12, 3, 40]
+    """
+    counts = Counter()
+    for _ in shards.each():
+        counts.update(dict(db.session.execute(
+            select(UserStory.progress, func.count()).join(StoryNode, StoryNode.id == UserStory.progress)
+            .group_by(UserStory.progress).order_by(func.count().desc(), UserStory.progress).limit(limit)
+        ).all()))
+    return [node_id for node_id, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+
+def warm_caches(stories: int = WARM_STORIES, nodes: int = WARM_NODES) -> dict:
+    """
+    Load the caches the readers of the most read stories hit first.
+
+    For the `stories` stories with the most readers, the 'next' node IDs and the
+    branch table; for the `nodes` nodes where the most readers are, the node
+    itself and the nodes after it, which are the next ones they will ask for.
+
+    Branch tables are kept per process, as are the other caches with the "lru"
+    cache backend: they are only warmed in the process running this job.
+
+    Args:
+        stories (int): The number of stories to warm.
+        nodes (int): The number of nodes to warm.
+
+    Returns:
+        dict: "stories" and "nodes", the numbers of stories and nodes loaded.
+
+    Example:
+        >>> warm_caches()
+        {"stories": 20, "nodes": 412}
+    """
+    story_ids = get_most_read_stories(stories)
+    next_ids: dict[int, list[int]] = {}
+    for story_id in story_ids:
+        next_ids.update(get_story_next_nodes_ids(story_id))
+        get_draft_branches(story_id)
+    node_ids = dict.fromkeys(get_busiest_nodes(nodes))
+    for node_id in list(node_ids):
+        node_ids.update(dict.fromkeys(next_ids.get(node_id, ())))
+    for node_id in node_ids:
+        get_story_node(node_id)
+    db.session.remove()
+    return {"stories": len(story_ids), "nodes": len(node_ids)}
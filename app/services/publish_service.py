@@ -0,0 +1,202 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from flask import abort, current_app
+from sqlalchemy import func, select
+from app.models import Story, StoryEdge, StoryNode, StoryVersion
+from app.extensions import db
+from app.services.assets_service import collect_assets
+from app.services.stories_service import get_start_node, get_story_by_id, get_story_shard
+from app.utils.shards import routed
+from app.utils.transactions import in_transaction, transactional
+
+
+def get_publish_folder() -> str:
+    """Return the folder holding the published bundles (`PUBLISH_FOLDER`, instance/published by default)."""
+    return current_app.config.get("PUBLISH_FOLDER") or os.path.join(current_app.instance_path, "published")
+
+
+def get_bundle_path(digest: str) -> str:
+    """Return the path of the bundle file with the given content hash."""
+    return os.path.join(get_publish_folder(), f"{digest}.json.gz")
+
+
+@routed("story_id", get_story_shard)
+def compile_story(story_id: int) -> dict:
+    """
+    Compile the current draft of a story into a self-contained bundle.
+
+    The bundle holds everything a reader needs: every node with its 'next' node IDs,
+    the edges with their conditions, the start node and the paths of the pictures.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict: The bundle, ready to be serialized as JSON.
+
+    Raises:
+        404 Not Found: If no story exists with the provided ID.
+
+    Example:
+        >>> bundle = compile_story(1)
+        >>> bundle["nodes"]["1"]["next"]
+        [3]
+    """
+    story: Story = get_story_by_id(story_id)
+    nodes = StoryNode.query.filter(StoryNode.story_id == story_id).order_by(StoryNode.id).all()
+    edges = db.session.execute(
+        select(StoryEdge.from_node_id, StoryEdge.to_node_id, StoryEdge.condition)
+        .join(StoryNode, StoryEdge.from_node_id == StoryNode.id)
+        .where(StoryNode.story_id == story_id)
+        .order_by(StoryEdge.from_node_id, StoryEdge.to_node_id)
+    ).all()
+    serialized = {node.id: {**node.serialize(), "next": []} for node in nodes}
+    for from_node_id, to_node_id, _ in edges:
+        serialized[from_node_id]["next"].append(to_node_id)
+    return {
+        "story": story.serialize(),
+        "start": get_start_node(story_id).id,
+        "nodes": {str(node_id): node for node_id, node in serialized.items()},
+        "edges": [list(edge) for edge in edges],
+        "assets": {str(asset_id): path for asset_id, path in sorted(collect_assets(serialized.values()).items())}
+    }
+
+
+def _write_bundle(data: bytes, path: str) -> None:
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    # write then rename, so that a bundle is never served half-written
+    descriptor, temporary = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def publish_story(story_id: int) -> StoryVersion:
+    """
+    Publish the current draft of a story as a new immutable version.
+
+    The story is compiled into a gzipped JSON bundle named after the first 128 bits
+    of the SHA-256 of its content (32 hex digits). Publishing a draft identical to
+    the latest version creates nothing and returns that version.
+
+    The bundle is compiled and written before the version is recorded: only the
+    recording takes the write lock of the database (see `_record_version`).
+
+    Args:
+        story_id (int): The unique identifier of the story to publish.
+
+    Returns:
+        StoryVersion: The published version.
+
+    Raises:
+        404 Not Found: If no story exists with the provided ID.
+
+    Side Effects:
+        Writes the bundle into the publish folder and records the version, within the
+        current transaction if there is one.
+
+    Example:
+        >>> version = publish_story(1)
+        >>> version.version
+        2
+    """
+    bundle = compile_story(story_id)
+    # mtime=0 and sorted keys: the same content always gives the same file and hash
+    data = gzip.compress(
+        json.dumps(bundle, sort_keys=True, separators=(",", ":")).encode(),
+        compresslevel=9,
+        mtime=0
+    )
+    # 128 bits are plenty to tell bundles apart, and keep the URLs short
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    path = get_bundle_path(digest)
+    # named after its content: a bundle left by a version that wasn't recorded is reused or harmless
+    if not os.path.exists(path):
+        _write_bundle(data, path)
+    if not in_transaction():
+        # end the read transaction of the compilation, so that the recording starts its own
+        db.session.commit()
+    return _record_version(story_id, digest, len(data))
+
+
+@transactional(immediate=True)
+def _record_version(story_id: int, digest: str, size: int) -> StoryVersion:
+    # takes the write lock as it starts: concurrent publishes of a story get
+    # consecutive version numbers one after the other instead of failing
+    latest = get_latest_version(story_id)
+    if latest is not None and latest.digest == digest:
+        return latest
+    number = db.session.execute(
+        select(func.coalesce(func.max(StoryVersion.version), 0)).where(StoryVersion.story_id == story_id)
+    ).scalar() + 1
+    version = StoryVersion(story_id=story_id, version=number, digest=digest, size=size)
+    db.session.add(version)
+    db.session.flush()
+    return version
+
+
+def get_latest_version(story_id: int) -> StoryVersion | None:
+    """
+    Retrieve the latest published version of a story.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        StoryVersion | None: The latest version, or None if the story was never published.
+
+    Example:
+        >>> latest = get_latest_version(1)
+    """
+    return (StoryVersion.query
+        .filter(StoryVersion.story_id == story_id)
+        .order_by(StoryVersion.version.desc())
+        .first())
+
+
+def get_story_version(story_id: int, version: int) -> StoryVersion:
+    """
+    Retrieve a published version of a story.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+        version (int): The version number.
+
+    Returns:
+        StoryVersion: The requested version.
+
+    Raises:
+        404 Not Found: If the story has no such version.
+
+    Example:
+        >>> story_version = get_story_version(1, 2)
+    """
+    story_version = (StoryVersion.query
+        .filter(StoryVersion.story_id == story_id, StoryVersion.version == version)
+        .one_or_none())
+    if story_version is None:
+        abort(404, description="Story version not found")
+    return story_version
+
+
+def get_story_versions(story_id: int) -> list[StoryVersion]:
+    """
+    Retrieve every published version of a story, the latest first.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        list[StoryVersion]: The published versions.
+
+    Example:
+        >>> versions = get_story_versions(1)
+    """
+    return (StoryVersion.query
+        .filter(StoryVersion.story_id == story_id)
+        .order_by(StoryVersion.version.desc())
+        .all())
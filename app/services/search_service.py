@@ -0,0 +1,284 @@
+import heapq
+import html
+import re
+from html.parser import HTMLParser
+from flask import abort
+from sqlalchemy import text
+from app.models import Story, StoryNode
+from app.extensions import db, shards
+
+
+# Snippet highlight markers, replaced by <mark> tags once the snippet is HTML-escaped
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# the nodes are indexed in the database of their story, central or shard (see `app.utils.shards`)
+NODE_SEARCH_TABLES = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS story_nodes_search USING fts5(
+        content, speaker, story_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+]
+SEARCH_TABLES = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS stories_search USING fts5(
+        title, description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    *NODE_SEARCH_TABLES,
+]
+
+# bm25 weights: a hit in a title outranks a hit in a description or in a dialog line
+_SEARCH_QUERIES = {
+    "stories": f"""
+        SELECT 'story' AS kind, rowid AS id, rowid AS story_id,
+               snippet(stories_search, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS snippet,
+               bm25(stories_search, 10.0, 2.0) AS score
+        FROM stories_search WHERE stories_search MATCH :query""",
+    "nodes": f"""
+        SELECT 'node' AS kind, rowid AS id, story_id,
+               snippet(story_nodes_search, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS snippet,
+               bm25(story_nodes_search, 1.0, 2.0) AS score
+        FROM story_nodes_search WHERE story_nodes_search MATCH :query""",
+}
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: list[str] = []
+
+    def handle_data(self, data: str):
+        self.chunks.append(data)
+
+
+def strip_markup(content: str) -> str:
+    """
+    Extract the readable text of a node's HTML content.
+
+    Tags and their attributes (such as quiz solutions) are dropped and character
+    references are decoded.
+
+    Args:
+        content (str): The HTML content of a node.
+
+    Returns:
+        str: The text content, with whitespace collapsed.
+
+    Example:
+        >>> strip_markup("<div><span>What is the first greek letter ?</span></div>")
+        'What is the first greek letter ?'
+    """
+    extractor = _TextExtractor()
+    extractor.feed(content or "")
+    extractor.close()
+    return " ".join("".join(extractor.chunks).split())
+
+
+def create_search_index() -> None:
+    """
+    Create the full-text search tables and fill them if they are empty.
+
+    Side Effects:
+        Creates the `stories_search` and `story_nodes_search` FTS5 tables and, on
+        first run, indexes every existing story and node.
+
+    Example:
+        >>> create_search_index()
+    """
+    for statement in SEARCH_TABLES:
+        db.session.execute(text(statement))
+    indexed = db.session.execute(text("SELECT count(*) FROM stories_search")).scalar()
+    if not indexed:
+        rebuild_search_index()
+    db.session.commit()
+
+
+def rebuild_search_index() -> None:
+    """
+    Re-index every story and node from scratch.
+
+    Side Effects:
+        Replaces the content of the search tables. The caller commits.
+
+    Example:
+        >>> rebuild_search_index()
+    """
+    db.session.execute(text("DELETE FROM stories_search"))
+    for story in Story.query.all():
+        index_story(story)
+    for _ in shards.each():
+        db.session.execute(text("DELETE FROM story_nodes_search"))
+        for node in StoryNode.query.yield_per(1000):
+            index_node(node)
+
+
+def index_story(story: Story) -> None:
+    """
+    Add or refresh the search entry of a story.
+
+    Args:
+        story (Story): The story to index. Its id must already be assigned.
+
+    Side Effects:
+        Writes to the search table within the current transaction.
+
+    Example:
+        >>> index_story(story)
+    """
+    db.session.execute(text("DELETE FROM stories_search WHERE rowid = :id"), {"id": story.id})
+    db.session.execute(
+        text("INSERT INTO stories_search (rowid, title, description) VALUES (:id, :title, :description)"),
+        {"id": story.id, "title": story.title, "description": story.description}
+    )
+
+
+def index_node(node: StoryNode) -> None:
+    """
+    Add or refresh the search entry of a story node, with its HTML markup stripped.
+
+    Args:
+        node (StoryNode): The node to index. Its id must already be assigned.
+
+    Side Effects:
+        Writes to the search table within the current transaction.
+
+    Example:
+        >>> index_node(node)
+    """
+    unindex_node(node.id)
+    db.session.execute(
+        text("INSERT INTO story_nodes_search (rowid, content, speaker, story_id) "
+             "VALUES (:id, :content, :speaker, :story_id)"),
+        {"id": node.id, "content": strip_markup(node.content), "speaker": node.speaker, "story_id": node.story_id}
+    )
+
+
+def index_new_nodes(rows: list[dict]) -> None:
+    """
+    Add the search entries of nodes that were never indexed, in one statement.
+
+    Args:
+        rows (list[dict]): The "id", "content", "speaker" and "story_id" of each node.
+
+    Side Effects:
+        Writes to the search table within the current transaction.
+
+    Example:
+        >>> index_new_nodes([{"id": 8, "content": "<p>Hello</p>", "speaker": "Ann", "story_id": 2}])
+    """
+    if not rows:
+        return
+    db.session.execute(
+        text("INSERT INTO story_nodes_search (rowid, content, speaker, story_id) "
+             "VALUES (:id, :content, :speaker, :story_id)"),
+        [{**row, "content": strip_markup(row["content"])} for row in rows]
+    )
+
+
+def unindex_node(node_id: int) -> None:
+    """
+    Remove the search entry of a story node.
+
+    Args:
+        node_id (int): The unique identifier of the node.
+
+    Example:
+        >>> unindex_node(3)
+    """
+    db.session.execute(text("DELETE FROM story_nodes_search WHERE rowid = :id"), {"id": node_id})
+
+
+def index_cloned_nodes(id_map: str, story_id: int) -> None:
+    """
+    Copy the search entries of cloned nodes to their copies.
+
+    Args:
+        id_map (str): Name of the temporary table mapping original node ids (old_id)
+                      to the ids of their copies (new_id).
+        story_id (int): The unique identifier of the story the copies belong to.
+
+    Example:
+        >>> index_cloned_nodes("node_id_map", 7)
+    """
+    db.session.execute(
+        text("INSERT INTO story_nodes_search (rowid, content, speaker, story_id) "
+             "SELECT map.new_id, search.content, search.speaker, :story_id "
+             f"FROM story_nodes_search AS search JOIN temp.{id_map} AS map ON map.old_id = search.rowid"),
+        {"story_id": story_id}
+    )
+
+
+def build_match_query(query: str) -> str:
+    """
+    Turn free user input into an FTS5 query.
+
+    Every word becomes a quoted prefix term, so that FTS5 operators typed by the
+    user are matched literally instead of being interpreted.
+
+    Example:
+        >>> build_match_query('greek lett')
+        '"greek"* "lett"*'
+    """
+    return " ".join(f'"{token}"*' for token in _TOKEN.findall(query))
+
+
+def _highlight(snippet: str) -> str:
+    escaped = html.escape(snippet)
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search(query: str, page: int = 1, per_page: int = 20, scope: str = "all") -> dict:
+    """
+    Search stories and node content, best matches first.
+
+    The nodes of sharded stories are indexed in their shard: every database returns
+    its best matches up to the requested page, and these are merged. Their scores
+    are computed per database, so the ranking across databases is approximate.
+
+    Args:
+        query (str): The words to look for. The last one may be incomplete.
+        page (int): The 1-based page number.
+        per_page (int): The number of results per page.
+        scope (str): "stories", "nodes", or "all" for both.
+
+    Returns:
+        dict: The page of results, each with its kind ("story" or "node"), id,
+              story id and title, and an HTML snippet where matches are wrapped in <mark>.
+
+    Raises:
+        400 Bad Request: If the query contains no searchable word or the scope is unknown.
+
+    Example:
+        >>> search("greek letter")
+        {"results": [{"kind": "node", "id": 4, "story_id": 1, ...}], "page": 1, "per_page": 20, "has_more": False}
+    """
+    match = build_match_query(query)
+    if not match:
+        abort(400, description="Empty search query")
+    if scope not in (*_SEARCH_QUERIES, "all"):
+        abort(400, description="Unknown search scope")
+    # fetch one extra row to know whether there is a next page without counting every match
+    parameters = {"query": match, "limit": page * per_page + 1}
+    rows = []
+    if scope in ("stories", "all"):
+        rows += db.session.execute(text(f"{_SEARCH_QUERIES['stories']} ORDER BY score LIMIT :limit"),
+                                   parameters).mappings().all()
+    if scope in ("nodes", "all"):
+        for _ in shards.each():
+            rows += db.session.execute(text(f"{_SEARCH_QUERIES['nodes']} ORDER BY score LIMIT :limit"),
+                                       parameters).mappings().all()
+    rows = heapq.nsmallest(parameters["limit"], rows, key=lambda row: row["score"])[(page - 1) * per_page:]
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    titles = dict(db.session.query(Story.id, Story.title)
+        .filter(Story.id.in_({row["story_id"] for row in rows}))
+        .all())
+    results = [{
+        "kind": row["kind"],
+        "id": row["id"],
+        "story_id": row["story_id"],
+        "story_title": titles.get(row["story_id"]),
+        "snippet": _highlight(row["snippet"])
+    } for row in rows]
+    return {"results": results, "page": page, "per_page": per_page, "has_more": has_more}
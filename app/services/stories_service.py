@@ -1,6 +1,113 @@
+import functools
 from flask import abort
+from sqlalchemy import Column, Integer, MetaData, Select, Table, bindparam, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import load_only
 from app.models import Story, StoryNode, StoryEdge
-from app.extensions import db
+from app.extensions import cache, db, shards
+from app.services.assets_service import get_or_create_asset
+from app.services.search_service import index_story, index_node, unindex_node, index_cloned_nodes
+from app.utils.conditions import ConditionError, compile_condition
+from app.utils.shards import node_shard, routed, use_shard
+from app.utils.transactions import on_commit, transactional
+
+
+# Per-connection mapping from the ids of a cloned story's nodes to the ids of their copies
+_node_id_map = Table(
+    "node_id_map", MetaData(),
+    Column("old_id", Integer, primary_key=True),
+    Column("new_id", Integer, nullable=False),
+    prefixes=["TEMPORARY"]
+)
+
+
+# Core statements of the reader's hot reads. They are built once, return plain rows instead of
+# identity-mapped objects, and their compiled SQL is reused from the engine's statement cache.
+# The ORM stays in use for writes.
+_nodes = StoryNode.__table__
+_edges = StoryEdge.__table__
+_NEXT_NODE_IDS = select(_edges.c.to_node_id).where(_edges.c.from_node_id == bindparam("node_id"))
+_START_NODE = (
+    select(_nodes.c.id, *(_nodes.c[column] for column in StoryNode.FIELDS))
+    .where(_nodes.c.story_id == bindparam("story_id"), _nodes.c.node_type == "START")
+)
+
+
+# routes the Core statements on the node tables to the shard of the story
+_NODES = {"mapper": StoryNode}
+
+
+@functools.lru_cache(maxsize=64)
+def _node_statement(columns: tuple[str, ...]) -> Select:
+    return select(_nodes.c.id, *(_nodes.c[column] for column in columns)).where(_nodes.c.id == bindparam("node_id"))
+
+
+def _story_namespace(story_id: int) -> str:
+    """Cache namespace of the data derived from the graph of a story."""
+    return f"story:{story_id}"
+
+
+def _invalidate_story(story_id: int) -> None:
+    on_commit(lambda: cache.bump(_story_namespace(story_id)))
+
+
+def _invalidate_node(node_id: int) -> None:
+    on_commit(lambda: cache.delete(f"node:{node_id}"))
+
+
+def get_story_shard(story_id: int) -> int | None:
+    """
+    Retrieve the shard holding the nodes, edges and readers of a story.
+
+    A story keeps its shard for good, so the answer is kept in the application cache without expiry.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        int | None: The shard, or None if the story is in the central database (or doesn't exist).
+
+    Example:
+        >>> get_story_shard(7)
+        8
+    """
+    if not shards.in_use:
+        return None
+    return cache.get_or_set(
+        f"shard:{story_id}",
+        lambda: db.session.scalar(select(Story.shard).where(Story.id == story_id)),
+        timeout=0
+    )
+
+
+def get_catalog_version() -> int:
+    """
+    Retrieve the current version of the story catalog.
+
+    The version changes every time a story is created or its title or description
+    is updated, so anything rendered from the catalog can be cached under it. It is
+    kept in the application cache, so that every worker sees the same version.
+
+    Returns:
+        int: The current catalog version.
+
+    Example:
+        >>> version = get_catalog_version()
+    """
+    return cache.version("catalog")
+
+
+def bump_catalog_version() -> int:
+    """
+    Invalidate everything cached under the current catalog version.
+
+    Returns:
+        int: The new catalog version.
+
+    Example:
+        >>> bump_catalog_version()
+    """
+    return cache.bump("catalog")
 
 
 def get_all_stories() -> list[Story]:
@@ -38,6 +145,7 @@ def get_story_by_id(story_id: int) -> Story:
     return story
 
 
+@transactional
 def update_story(story_id: int, data: dict) -> Story:
     """
     Update the details of an existing story.
@@ -48,10 +156,11 @@ def update_story(story_id: int, data: dict) -> Story:
                      Expected keys include "title" and "description".
 
     Returns:
-        Story: The updated Story instance after committing changes.
+        Story: The updated Story instance.
 
     Side Effects:
-        Commits the updated story to the database.
+        Updates the story in the current transaction, refreshes its search entry
+        and bumps the catalog version once committed.
 
     Example:
         >>> updated_story = update_story(1, {"title": "New Title", "description": "Updated description"})
@@ -59,26 +168,79 @@ def update_story(story_id: int, data: dict) -> Story:
     story = get_story_by_id(story_id)
     story.title = data.get("title", story.title)
     story.description = data.get("description", story.description)
-    db.session.commit()
+    index_story(story)
+    on_commit(bump_catalog_version)
     return story
 
 
-def get_story_nodes(story_id: int) -> list[StoryNode]:
+def parse_node_fields(fields: str | None, extra: tuple[str, ...] = ()) -> list[str] | None:
+    """
+    Parse a `fields=` projection parameter of the node endpoints.
+
+    Args:
+        fields (str | None): Comma-separated field names, e.g. "node_type,speaker,next".
+                             The node id is always included, the position ("x", "y") only on request.
+        extra (tuple[str, ...]): Names accepted besides the node columns (e.g. "next").
+
+    Returns:
+        list[str] | None: The requested names, or None when every field is requested.
+
+    Raises:
+        400 Bad Request: If a field name is unknown.
+
+    Example:
+        >>> parse_node_fields("id,node_type,next", extra=("next",))
+        ['node_type', 'next']
+    """
+    if fields is None:
+        return None
+    names = [name for name in (name.strip() for name in fields.split(",")) if name and name != "id"]
+    unknown = set(names) - set(StoryNode.FIELDS) - set(StoryNode.POSITION) - set(extra)
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return names
+
+
+def _node_columns(fields: list[str] | None) -> list[str]:
+    if fields is None:
+        return list(StoryNode.FIELDS)
+    return [field for field in fields if field in StoryNode.FIELDS or field in StoryNode.POSITION]
+
+
+def _set_images(node: StoryNode, data: dict) -> None:
+    # pictures are given either as asset ids or as paths
+    for field, column in StoryNode.IMAGES.items():
+        if column in data:
+            setattr(node, column, data[column])
+        elif field in data:
+            setattr(node, column, get_or_create_asset(data[field]))
+
+
+@routed("story_id", get_story_shard)
+def get_story_nodes(story_id: int, fields: list[str] | None = None) -> list[StoryNode]:
     """
     Retrieve all nodes associated with a specific story.
 
     Args:
         story_id (int): The unique identifier of the story.
+        fields (list[str] | None): The columns to load (see `StoryNode.FIELDS`), or None for all.
+                                   Other columns are not read from the database.
 
     Returns:
         List[StoryNode]: A list of StoryNode instances that belong to the story.
 
     Example:
-        >>> nodes = get_story_nodes(1)
+        >>> nodes = get_story_nodes(1, fields=["node_type", "speaker"])
     """
-    return StoryNode.query.filter(StoryNode.story_id == story_id).all()
+    columns = [getattr(StoryNode, column) for column in _node_columns(fields)]
+    return (StoryNode.query
+        .options(load_only(StoryNode.id, *columns))
+        .filter(StoryNode.story_id == story_id)
+        .all())
 
 
+@routed("story_id", get_story_shard)
+@transactional(immediate=True)
 def create_story_node(story_id: int, data: dict) -> StoryNode:
     """
     Create a new story node for a given story.
@@ -90,15 +252,17 @@ def create_story_node(story_id: int, data: dict) -> StoryNode:
                         - "node_type": Type of the node (default is "DIALOG")
                         - "content": The content of the node
                         - "speaker": The speaker associated with the node
-                        - "left_img": Left-side image URL or path
-                        - "right_img": Right-side image URL or path
-                        - "background_img": Background image URL or path
+                        - "left_img": Left-side image URL or path (or "left_img_id", an asset ID)
+                        - "right_img": Right-side image URL or path (or "right_img_id")
+                        - "background_img": Background image URL or path (or "background_img_id")
+                        - "x", "y": Position in the editor (optional)
 
     Returns:
         StoryNode: The newly created StoryNode instance.
 
     Side Effects:
-        The new node is added to the database and the session is committed.
+        The new node is added to the database and to the search index within the current transaction.
+        The cached graph of the story is dropped once committed.
 
     Example:
         >>> new_node = create_story_node(1, {"content": "Hello World", "speaker": "Narrator"})
@@ -108,15 +272,19 @@ def create_story_node(story_id: int, data: dict) -> StoryNode:
         node_type=data.get("node_type", "DIALOG"),
         content=data.get("content", ""),
         speaker=data.get("speaker", ""),
-        left_img=data.get("left_img", ""),
-        right_img=data.get("right_img", ""),
-        background_img=data.get("background_img", "")
+        x=data.get("x"),
+        y=data.get("y")
     )
+    _set_images(new_node, data)
     db.session.add(new_node)
-    db.session.commit()
+    db.session.flush()
+    index_node(new_node)
+    _invalidate_story(story_id)
     return new_node
 
 
+@routed("node_id", node_shard)
+@transactional(immediate=True)
 def update_story_node(node_id: int, data: dict) -> StoryNode:
     """
     Update an existing story node with new data.
@@ -125,28 +293,37 @@ def update_story_node(node_id: int, data: dict) -> StoryNode:
         node_id (int): The unique identifier of the story node to update.
         data (dict): A dictionary containing the updated node information.
                      Possible keys include "node_type", "content", "speaker",
-                     "left_img", "right_img", and "background_img".
+                     "left_img", "right_img", and "background_img" (picture paths),
+                     or "left_img_id", "right_img_id" and "background_img_id" (asset IDs),
+                     and "x" and "y", its position in the editor.
 
     Returns:
         StoryNode: The updated StoryNode instance.
 
     Side Effects:
-        Commits the changes to the database.
+        Updates the node in the current transaction and refreshes its search entry if its text changed.
+        Its cached form is dropped once committed, and the cached graph of its story if its type changed.
 
     Example:
         >>> updated_node = update_story_node(2, {"content": "Updated content"})
     """
     node = StoryNode.query.get_or_404(node_id)
+    if data.get("node_type", node.node_type) != node.node_type:
+        _invalidate_story(node.story_id)  # a new start node changes the layout of the graph
     node.node_type = data.get("node_type", node.node_type)
     node.content = data.get("content", node.content)
     node.speaker = data.get("speaker", node.speaker)
-    node.left_img = data.get("left_img", node.left_img)
-    node.right_img = data.get("right_img", node.right_img)
-    node.background_img = data.get("background_img", node.background_img)
-    db.session.commit()
+    node.x = data.get("x", node.x)
+    node.y = data.get("y", node.y)
+    _set_images(node, data)
+    if "content" in data or "speaker" in data:
+        index_node(node)
+    _invalidate_node(node_id)
     return node
 
 
+@routed("node_id", node_shard)
+@transactional(immediate=True)
 def delete_story_node(node_id: int):
     """
     Delete a story node from the database.
@@ -155,7 +332,8 @@ def delete_story_node(node_id: int):
         node_id (int): The unique identifier of the story node to delete.
 
     Side Effects:
-        Removes the node from the database and commits the change.
+        Removes the node from the database and from the search index within the current transaction.
+        Its cached form and the cached graph of its story are dropped once committed.
 
     Raises:
         404 Not Found: If the node with the specified ID does not exist.
@@ -165,9 +343,12 @@ def delete_story_node(node_id: int):
     """
     node = StoryNode.query.get_or_404(node_id)
     db.session.delete(node)
-    db.session.commit()
+    unindex_node(node_id)
+    _invalidate_node(node_id)
+    _invalidate_story(node.story_id)
 
 
+@routed("story_id", get_story_shard)
 def get_story_edges(story_id: int) -> list[StoryEdge]:
     """
     Retrieve all edges for a specific story.
@@ -188,9 +369,15 @@ def get_story_edges(story_id: int) -> list[StoryEdge]:
             .filter(StoryNode.story_id == story_id).all()
 
 
+@routed("data", lambda data: node_shard(data.get("from_node_id") or 0))
+@transactional
 def create_story_edge(data: dict) -> StoryEdge:
     """
-    Create a new edge between two story nodes.
+    Create a new edge between two story nodes, or change the condition of the existing one.
+
+    The edge is written by a single `INSERT ... ON CONFLICT DO UPDATE` statement,
+    so creating the same edge twice, even concurrently, leaves one edge with the
+    last condition instead of failing.
 
     Args:
         data (dict): A dictionary containing edge details.
@@ -198,27 +385,47 @@ def create_story_edge(data: dict) -> StoryEdge:
                         - "from_node_id": The ID of the starting node.
                         - "to_node_id": The ID of the target node.
                      Optional key:
-                        - "condition": The condition for the edge (default is "SUCCESS").
+                        - "condition": The condition for the edge (default is "SUCCESS"),
+                          see `app.utils.conditions` for the syntax.
 
     Returns:
-        StoryEdge: The newly created StoryEdge instance.
+        StoryEdge: The created or updated StoryEdge instance.
+
+    Raises:
+        400 Bad Request: If the condition doesn't compile.
 
     Side Effects:
-        Adds the new edge to the database and commits the session.
+        Adds or updates the edge within the current transaction.
+        The cached graph of the story is dropped once committed.
 
     Example:
         >>> edge = create_story_edge({"from_node_id": 1, "to_node_id": 2})
     """
-    new_edge = StoryEdge(
+    condition = data.get("condition", "SUCCESS")
+    try:
+        compile_condition(condition)
+    except ConditionError as error:
+        abort(400, description=f"Invalid condition: {error}")
+    statement = sqlite_insert(StoryEdge).values(
         from_node_id=data["from_node_id"],
         to_node_id=data["to_node_id"],
-        condition=data.get("condition", "SUCCESS")
+        condition=condition
     )
-    db.session.add(new_edge)
-    db.session.commit()
+    new_edge: StoryEdge = db.session.execute(
+        statement
+        .on_conflict_do_update(index_elements=["from_node_id", "to_node_id"],
+                               set_={"condition": statement.excluded.condition})
+        .returning(StoryEdge),
+        execution_options={"populate_existing": True}
+    ).scalar_one()
+    from_node: StoryNode | None = db.session.get(StoryNode, new_edge.from_node_id)
+    if from_node is not None:
+        _invalidate_story(from_node.story_id)
     return new_edge
 
 
+@routed("from_node_id", node_shard)
+@transactional(immediate=True)
 def delete_story_edge(from_node_id: int, to_node_id: int):
     """
     Delete an edge between two story nodes from the database.
@@ -228,7 +435,8 @@ def delete_story_edge(from_node_id: int, to_node_id: int):
         to_node_id (int): The unique identifier of the target node of the edge.
 
     Side Effects:
-        Removes the edge from the database and commits the change.
+        Removes the edge from the database within the current transaction.
+        The cached graph of the story is dropped once committed.
 
     Raises:
         404 Not Found: If no edge exists between the specified nodes.
@@ -240,15 +448,19 @@ def delete_story_edge(from_node_id: int, to_node_id: int):
     if not edge:
         abort(404, description="Edge not found")
     db.session.delete(edge)
-    db.session.commit()
+    _invalidate_story(db.session.get(StoryNode, from_node_id).story_id)
 
 
-def get_story_node(story_node_id: int) -> StoryNode:
+@routed("story_node_id", node_shard)
+def get_story_node(story_node_id: int, fields: list[str] | None = None) -> StoryNode:
     """
     Retrieve a single story node by its unique identifier and return its serialized form.
 
+    The complete form is kept in the application cache until the node is updated or deleted.
+
     Args:
         story_node_id (int): The unique identifier of the story node.
+        fields (list[str] | None): The columns to load and serialize, or None for all.
 
     Returns:
         dict or None: A dictionary representing the serialized story node if found;
@@ -257,12 +469,21 @@ def get_story_node(story_node_id: int) -> StoryNode:
     Example:
         >>> node_data = get_story_node(3)
     """
-    node: StoryNode | None = StoryNode.query.get(story_node_id)
-    if not node:
+    if fields is None:
+        serialized = cache.get(f"node:{story_node_id}")
+        if serialized is not None:
+            return serialized
+    columns = _node_columns(fields)
+    row = db.session.connection(bind_arguments=_NODES).execute(_node_statement(tuple(columns)), {"node_id": story_node_id}).first()
+    if row is None:
         return None
-    return node.serialize()
+    serialized = StoryNode.serialize_row(row, columns)
+    if fields is None:
+        cache.set(f"node:{story_node_id}", serialized)
+    return serialized
 
 
+@routed("story_node_id", node_shard)
 def get_next_nodes_id(story_node_id: int) -> list[int]:
     """
     Retrieve the identifiers of all nodes that follow a given story node.
@@ -276,10 +497,41 @@ def get_next_nodes_id(story_node_id: int) -> list[int]:
     Example:
         >>> next_ids = get_next_nodes_id(3)
     """
-    next_nodes: list[StoryEdge] | None = StoryEdge.query.filter(StoryEdge.from_node_id.is_(story_node_id)).all()
-    return [node.to_node_id for node in next_nodes]
+    return list(db.session.connection(bind_arguments=_NODES).execute(_NEXT_NODE_IDS, {"node_id": story_node_id}).scalars())
+
+
+@routed("story_id", get_story_shard)
+def get_story_next_nodes_ids(story_id: int) -> dict[int, list[int]]:
+    """
+    Retrieve the identifiers of the 'next' nodes of every node of a story, in a single query.
 
+    The result is kept in the application cache until a node or an edge of the story changes.
 
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict[int, list[int]]: The 'next' node IDs by node ID. Nodes without outgoing edges are missing.
+
+    Example:
+        >>> next_ids = get_story_next_nodes_ids(1)
+        >>> next_ids.get(3, [])
+        [4, 5]
+    """
+    def load() -> dict[int, list[int]]:
+        rows = db.session.execute(
+            select(StoryEdge.from_node_id, StoryEdge.to_node_id)
+            .join(StoryNode, StoryEdge.from_node_id == StoryNode.id)
+            .where(StoryNode.story_id == story_id)
+        )
+        next_ids: dict[int, list[int]] = {}
+        for from_node_id, to_node_id in rows:
+            next_ids.setdefault(from_node_id, []).append(to_node_id)
+        return next_ids
+    return cache.get_or_set("next_ids", load, namespace=_story_namespace(story_id))
+
+
+@routed("story_id", get_story_shard)
 def get_start_node(story_id: int) -> StoryNode:
     """
     Retrieve the starting node of a specific story.
@@ -304,29 +556,133 @@ def get_start_node(story_id: int) -> StoryNode:
     return result
 
 
+@routed("story_id", get_story_shard)
+def get_start_node_data(story_id: int) -> dict:
+    """
+    Retrieve the serialized starting node of a story, without loading it through the ORM.
+
+    Args:
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict: The serialized starting node, as `StoryNode.serialize` returns it.
+
+    Raises:
+        sqlalchemy.exc.NoResultFound: If no starting node is found for the story.
+
+    Example:
+        >>> get_start_node_data(1)["type"]
+        'START'
+    """
+    row = db.session.connection(bind_arguments=_NODES).execute(_START_NODE, {"story_id": story_id}).one()
+    return StoryNode.serialize_row(row)
+
+
+@transactional
 def create_new_empty_story() -> Story:
     """
     Create a new empty story with default values and an associated starting node.
 
     This function performs the following steps:
       1. Creates a new Story instance with default values.
-      2. Commits the new story to the database.
+      2. Flushes it to get its id.
       3. Creates a new StoryNode instance as the starting node (with node_type "START") for the story.
-      4. Commits the starting node to the database.
+      4. Indexes both for search.
 
     Returns:
         Story: The newly created Story instance, which includes its starting node.
 
     Side Effects:
-        Two new records are added to the database: one for the story and one for its starting node.
+        Two new records are added to the database in one transaction: one for the story
+        and one for its starting node, in the shard of the story when sharding is on.
+        The catalog version is bumped once committed.
 
     Example:
         >>> new_story = create_new_empty_story()
     """
     story: Story = Story.default()
     db.session.add(story)
-    db.session.commit()
-    story_node: StoryNode = StoryNode.default(story.id, "START")
-    db.session.add(story_node)
-    db.session.commit()
-    return story
\ No newline at end of file
+    db.session.flush()
+    story.shard = shard = shards.shard_for_new_story(story.id)
+    with use_shard(shard):
+        story_node: StoryNode = StoryNode.default(story.id, "START")
+        _set_images(story_node, StoryNode.DEFAULT_IMAGES)
+        db.session.add(story_node)
+        db.session.flush()
+        index_node(story_node)
+    index_story(story)
+    story_id = story.id
+    on_commit(lambda: cache.set(f"shard:{story_id}", shard, timeout=0))
+    on_commit(bump_catalog_version)
+    return story
+
+
+@transactional
+def clone_story(story_id: int) -> Story:
+    """
+    Create a deep copy of a story: the story itself, all its nodes and all its edges.
+
+    The copy is made with set-based `INSERT ... SELECT` statements in the current
+    transaction. New node ids are allocated in a temporary `node_id_map` table
+    (old id -> new id) that the node, edge and search index copies are joined with,
+    so no ORM object is built per node or edge. The copy goes in the shard of the
+    original, so that its nodes can be copied within one database.
+
+    Args:
+        story_id (int): The unique identifier of the story to clone.
+
+    Returns:
+        Story: The new Story instance.
+
+    Raises:
+        404 Not Found: If no story exists with the provided ID.
+
+    Side Effects:
+        Inserts the copies and indexes them for search within the current transaction,
+        and bumps the catalog version once committed.
+
+    Example:
+        >>> copy = clone_story(1)
+    """
+    source = get_story_by_id(story_id)
+    story = Story(title=f"{source.title} (copy)", description=source.description, shard=source.shard)
+    db.session.add(story)
+    # the insert takes the database write lock, so the ids above MAX(id) stay free until commit
+    # (in a shard, a node inserted meanwhile makes the copy fail with a busy snapshot instead)
+    db.session.flush()
+    with use_shard(story.shard):
+        _copy_nodes(story_id, story.id)
+    index_story(story)
+    copy_id = story.id
+    on_commit(lambda: cache.set(f"shard:{copy_id}", source.shard, timeout=0))
+    on_commit(bump_catalog_version)
+    return story
+
+
+def _copy_nodes(story_id: int, copy_id: int) -> None:
+    connection = db.session.connection(bind_arguments=_NODES)
+    _node_id_map.drop(connection, checkfirst=True)
+    _node_id_map.create(connection)
+    last_id = select(func.coalesce(func.max(StoryNode.id), 0)).scalar_subquery()
+    connection.execute(insert(_node_id_map).from_select(
+        ["old_id", "new_id"],
+        select(StoryNode.id, last_id + func.row_number().over(order_by=StoryNode.id))
+        .where(StoryNode.story_id == story_id)
+    ))
+    columns = [*StoryNode.FIELDS, *StoryNode.POSITION]
+    connection.execute(insert(StoryNode).from_select(
+        ["id", "story_id", *columns],
+        select(_node_id_map.c.new_id, copy_id, *(getattr(StoryNode, column) for column in columns))
+        .join(_node_id_map, _node_id_map.c.old_id == StoryNode.id)
+    ))
+    from_map = _node_id_map.alias("from_map")
+    to_map = _node_id_map.alias("to_map")
+    connection.execute(insert(StoryEdge).from_select(
+        ["from_node_id", "to_node_id", "condition"],
+        select(from_map.c.new_id, to_map.c.new_id, StoryEdge.condition)
+        .join(from_map, from_map.c.old_id == StoryEdge.from_node_id)
+        .join(to_map, to_map.c.old_id == StoryEdge.to_node_id)
+    ))
+    # the search index is in the database of the nodes, with the mapping
+    index_cloned_nodes(_node_id_map.name, copy_id)
+    _node_id_map.drop(connection)
\ No newline at end of file
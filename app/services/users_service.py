@@ -1,6 +1,49 @@
-from app.models import User, UserStory, Story, StoryNode
-from app.extensions import bcrypt, db
-from app.services.stories_service import get_start_node
+from flask import abort
+from sqlalchemy import Integer, bindparam, func, select
+from sqlalchemy.dialects.sqlite import insert
+from app.models import User, UserStory, Story, StoryNode, StoryVersion
+from app.extensions import bcrypt, cache, db, shards
+from app.services.stories_service import get_story_shard
+from app.services.publish_service import get_latest_version, get_story_version
+from app.services.events_service import record_enrollment
+from app.utils.instrumentation import timing
+from app.utils.metrics import bcrypt_duration, bcrypt_in_progress
+from app.utils.shards import routed
+from app.utils.transactions import in_transaction, on_commit, transactional
+
+
+# Core statements of the reader's progress lookup and enrollment, see the hot reads of stories_service
+_user_stories = UserStory.__table__
+_nodes = StoryNode.__table__
+_versions = StoryVersion.__table__
+# routes the Core statements on the readers to the shard of the story
+_READERS = {"mapper": UserStory}
+_USER_STORY = (
+    select(_user_stories.c.story_id, _user_stories.c.progress, _user_stories.c.health, _user_stories.c.story_version)
+    .where(_user_stories.c.user_id == bindparam("user_id"), _user_stories.c.story_id == bindparam("story_id"))
+)
+# the published version new readers start with, in the central database
+_LATEST_VERSION = select(func.max(_versions.c.version)).where(_versions.c.story_id == bindparam("story_id"))
+# enrollment of a reader on the starting node, a no-op for a reader of the story
+_ENROLL = (
+    insert(_user_stories).from_select(
+        ["user_id", "story_id", "progress", "story_version"],
+        select(bindparam("user_id", type_=Integer), _nodes.c.story_id, _nodes.c.id,
+               bindparam("story_version", type_=Integer))
+        .where(_nodes.c.story_id == bindparam("story_id"), _nodes.c.node_type == "START")
+        .limit(1)
+    )
+    .on_conflict_do_nothing(index_elements=["user_id", "story_id"])
+    .returning(_user_stories.c.progress)
+)
+# pins the version of a reader who started before the story was published, unless another request did
+_PIN_VERSION = (
+    _user_stories.update()
+    # bind names of their own: those of the columns are reserved for the SET clause of an UPDATE
+    .where(_user_stories.c.user_id == bindparam("reader_id"), _user_stories.c.story_id == bindparam("read_story_id"),
+           _user_stories.c.story_version.is_(None))
+    .values(story_version=bindparam("version", type_=Integer))
+)
 
 
 def get_user_by_id(user_id: int) -> User:
@@ -20,12 +63,13 @@ def get_user_by_id(user_id: int) -> User:
     return user
 
 
+@transactional
 def create_user(username: str, password: str) -> None:
     """
     Create a new user with the given username and password.
 
-    This function hashes the provided password, creates a new User instance,
-    and commits it to the database.
+    This function hashes the provided password and adds a new User instance
+    to the database.
 
     Args:
         username (str): The desired username for the new user.
@@ -35,17 +79,19 @@ def create_user(username: str, password: str) -> None:
         None
 
     Side Effects:
-        A new user record is added to the database and the session is committed.
+        A new user record is added to the database within the current transaction.
 
     Example:
         >>> create_user("john_doe", "secure_password123")
     """
-    password_hash = bcrypt.generate_password_hash(password)
+    with timing("bcrypt"), bcrypt_in_progress.track_in_progress(), bcrypt_duration.time():
+        password_hash = bcrypt.generate_password_hash(password)
     user: User = User(username=username, password=password_hash)
     db.session.add(user)
-    db.session.commit()
+    db.session.flush()
 
 
+@transactional
 def delete_user(user_id: int) -> None:
     """
     Delete a user by their unique identifier.
@@ -59,13 +105,14 @@ def delete_user(user_id: int) -> None:
         None
 
     Side Effects:
-        The specified user is removed from the database. Note that this function
-        does not commit the deletion; you may need to call db.session.commit() afterwards.
+        The specified user is removed from the database within the current transaction.
+        Their cached data is invalidated once committed.
 
     Example:
         >>> delete_user(1)
     """
     User.query.filter(User.id == user_id).delete()
+    on_commit(lambda: cache.bump(f"user:{user_id}"))
 
 
 def user_auth(username: str, password: str) -> int | None:
@@ -89,7 +136,11 @@ def user_auth(username: str, password: str) -> int | None:
     user: User = (User.query
         .filter(User.username == username)
         .one_or_none())
-    if user is not None and bcrypt.check_password_hash(user.password, password):
+    if user is None:
+        return None
+    with timing("bcrypt"), bcrypt_in_progress.track_in_progress(), bcrypt_duration.time():
+        valid = bcrypt.check_password_hash(user.password, password)
+    if valid:
         return user.id
 
 
@@ -130,37 +181,68 @@ def update_user_progress(user_id: int, story_node_id: int) -> None:
     pass
 
 
-def add_story_to_user(user_id: int, story_id: int) -> None:
+@routed("story_id", get_story_shard)
+@transactional
+def add_story_to_user(user_id: int, story_id: int) -> bool:
     """
-    Associate a story with a user by creating a new UserStory record.
+    Associate a story with a user by creating a new UserStory record, unless there is one.
 
-    This function determines the starting node of the story (using get_start_node)
-    and creates a new UserStory instance linking the user and the story, initializing
-    the user's progress at the starting node.
+    The record is created complete by a single `INSERT ... SELECT ... ON CONFLICT DO NOTHING`
+    statement that finds the starting node of the story itself, starts the user's
+    progress there and pins the latest published version. Two requests enrolling
+    the same reader at once (e.g. two tabs) both succeed, and only one creates the
+    record and counts the reader.
+
+    Readers known to read the story (see `user_reads_story`) are answered from the
+    cache, without a write. Otherwise the insert is the first statement of the
+    transaction on the readers' database: it takes the write lock (waiting for it if
+    need be) without a read snapshot that another writer could invalidate. The
+    latest version is read beforehand on a connection of its own for that reason.
 
     Args:
         user_id (int): The unique identifier of the user.
         story_id (int): The unique identifier of the story to be followed by the user.
 
     Returns:
-        None
+        bool: Whether the user was enrolled by this call, False if they already read the story.
+
+    Raises:
+        404 Not Found: If the story has no starting node.
 
     Side Effects:
-        A new UserStory record is added to the database and the session is committed.
+        A new UserStory record is added to the database and the reader is counted in
+        the reading statistics, within the current transaction. The user's cached data
+        is invalidated once committed.
 
     Example:
         >>> add_story_to_user(1, 2)
+        True
     """
-    start_node: StoryNode = get_start_node(story_id)
-    user_story = UserStory(user_id=user_id, story_id=story_id, progress=start_node.id)
-    db.session.add(user_story)
-    db.session.commit()
-
-
+    namespace = f"user:{user_id}"
+    if cache.get(f"reads:{story_id}", namespace=namespace):
+        return False
+    with db.engine.connect() as connection:
+        story_version: int | None = connection.execute(_LATEST_VERSION, {"story_id": story_id}).scalar()
+    start_node_id: int | None = db.session.connection(bind_arguments=_READERS).execute(
+        _ENROLL, {"user_id": user_id, "story_id": story_id, "story_version": story_version}
+    ).scalar()
+    if start_node_id is None:
+        if get_user_story_data(user_id, story_id) is None:
+            abort(404, description="Story not found")
+    else:
+        record_enrollment(story_id, start_node_id)
+        on_commit(lambda: cache.bump(namespace))
+    on_commit(lambda: cache.set(f"reads:{story_id}", True, namespace=namespace))
+    return start_node_id is not None
+
+
+@routed("story_id", get_story_shard)
 def user_reads_story(user_id: int, story_id: int) -> bool:
     """
     Check if a user is currently following a given story.
 
+    The answer is kept in the application cache until the user starts another story.
+
     Args:
         user_id (int): The unique identifier of the user.
         story_id (int): The unique identifier of the story to check.
@@ -172,9 +254,38 @@ def user_reads_story(user_id: int, story_id: int) -> bool:
         >>> if user_reads_story(1, 2):
         ...     print("User is reading this story.")
     """
-    return UserStory.query.get((user_id, story_id)) is not None
+    return cache.get_or_set(
+        f"reads:{story_id}",
+        lambda: UserStory.query.get((user_id, story_id)) is not None,
+        namespace=f"user:{user_id}"
+    )
 
 
+def get_user_stories(user_id: int) -> list[Story]:
+    """
+    Retrieve the stories a user reads.
+
+    The readers of each story are in the database of the story, so every shard is asked.
+
+    Args:
+        user_id (int): The unique identifier of the user.
+
+    Returns:
+        list[Story]: The stories the user reads.
+
+    Example:
+        >>> stories = get_user_stories(1)
+    """
+    story_ids = [
+        story_id for _ in shards.each()
+        for story_id in db.session.scalars(select(UserStory.story_id).where(UserStory.user_id == user_id))
+    ]
+    if not story_ids:
+        return []
+    return Story.query.filter(Story.id.in_(story_ids)).order_by(Story.id).all()
+
+
+@routed("story_id", get_story_shard)
 def get_user_story_info(user_id: int, story_id: int) -> UserStory:
     """
     Retrieve the UserStory record that links a user to a story.
@@ -193,28 +304,103 @@ def get_user_story_info(user_id: int, story_id: int) -> UserStory:
     return UserStory.query.get((user_id, story_id))
 
 
+@routed("story_id", get_story_shard)
+def get_user_story_data(user_id: int, story_id: int) -> dict | None:
+    """
+    Retrieve the serialized UserStory record that links a user to a story, without loading it through the ORM.
+
+    Args:
+        user_id (int): The unique identifier of the user.
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        dict | None: The record, as `UserStory.serialize` returns it, or None if the user doesn't read the story.
+
+    Example:
+        >>> get_user_story_data(1, 2)
+        {"story_id": 2, "progress": 5, "health": 100, "story_version": 1}
+    """
+    row = db.session.connection(bind_arguments=_READERS).execute(_USER_STORY, {"user_id": user_id, "story_id": story_id}).first()
+    return row._asdict() if row is not None else None
+
+
+@routed("story_id", get_story_shard)
+@transactional(immediate=True)
 def update_user_story_info(user_id: int, story_id: int, **data) -> None:
     """
     Update the user-specific story information for a given user and story.
 
-    This function updates fields such as health and progress in the UserStory record.
+    This function updates fields such as health in the UserStory record. The progress
+    is not one of them: it only moves along the edges of the story (see `advance_reader`).
 
     Args:
         user_id (int): The unique identifier of the user whose information is to be updated.
         story_id (int): The unique identifier of the story associated with the UserStory record.
         **data: Arbitrary keyword arguments representing the fields to update.
-                Expected keys include "health" and "progress".
+                Expected keys include "health".
 
     Returns:
         None
 
+    Raises:
+        400 Bad Request: If the progress is given.
+
     Side Effects:
-        The UserStory record is updated in the database and the session is committed.
+        The UserStory record is updated within the current transaction.
 
     Example:
-        >>> update_user_story_info(1, 2, health=80, progress=10)
+        >>> update_user_story_info(1, 2, health=80)
     """
+    if "progress" in data:
+        abort(400, description="The progress only moves with /advance")
     information: UserStory = get_user_story_info(user_id, story_id)
     information.health = data.get("health", information.health)
-    information.progress = data.get("progress", information.progress)
-    db.session.commit()
+
+
+@routed("story_id", get_story_shard)
+def get_reading_version(user_id: int, story_id: int) -> StoryVersion | None:
+    """
+    Retrieve the published version of a story a user reads.
+
+    Readers stay on the version pinned when they started (see `add_story_to_user`),
+    so that publishing never changes a story under their feet. Readers who started
+    before the story was first published are pinned to the latest version the first
+    time they read it: from then on they advance along the edges of that version,
+    not along the draft's.
+
+    Args:
+        user_id (int): The unique identifier of the user.
+        story_id (int): The unique identifier of the story.
+
+    Returns:
+        StoryVersion | None: The version to read, or None if the story was never published.
+
+    Side Effects:
+        Pins the latest version on a reader without one, in a transaction of its own
+        unless called within one.
+
+    Example:
+        >>> version = get_reading_version(1, 2)
+    """
+    information: dict | None = get_user_story_data(user_id, story_id)
+    if information is not None and information["story_version"] is not None:
+        return get_story_version(story_id, information["story_version"])
+    latest: StoryVersion | None = get_latest_version(story_id)
+    if information is None or latest is None:
+        return latest
+    if not in_transaction():
+        # end the read transaction: the pin must be the first statement of its own
+        db.session.commit()
+    return get_story_version(story_id, _pin_version(user_id, story_id, latest.version))
+
+
+@routed("story_id", get_story_shard)
+@transactional
+def _pin_version(user_id: int, story_id: int, version: int) -> int:
+    """Pin a version on a reader without one, and return the version the reader is pinned to."""
+    connection = db.session.connection(bind_arguments=_READERS)
+    if connection.execute(_PIN_VERSION, {"reader_id": user_id, "read_story_id": story_id, "version": version}).rowcount:
+        on_commit(lambda: cache.bump(f"user:{user_id}"))
+        return version
+    # pinned meanwhile by another request
+    return connection.execute(_USER_STORY, {"user_id": user_id, "story_id": story_id}).one().story_version
\ No newline at end of file
@@ -7,9 +7,9 @@
   const CONFIG = {
     API_BASE: "/api/stories",
     NODE_DIMENSIONS: { halfWidth: 75, halfHeight: 40 },
-    SPACING: { x: 300, y: 150 },
-    COLUMNS: 5,
     MARKER_OFFSET: 15,
+    VIEWPORT_MARGIN: 300,
+    MIN_GRAPH_SIZE: 3000,
   };
 
   const Utils = {
@@ -180,6 +180,7 @@
       this.edgesSvg = document.getElementById("edges-svg");
       this.nodes = [];
       this.edges = [];
+      this.neighbors = new Map();
       this.isDragging = false;
       this.dragCandidate = null;
       this.dragNode = null;
@@ -221,6 +222,7 @@
         }
       });
       this.fetchStoryData();
+      this.fetchPublishedVersion();
     }
 
     setupAutoSync(fields, syncFunction) {
@@ -265,6 +267,11 @@
     }
 
     setupGraphEvents() {
+      let scrollTimer = null;
+      this.graphContainer.addEventListener("scroll", () => {
+        clearTimeout(scrollTimer);
+        scrollTimer = setTimeout(() => this.loadViewport(), 150);
+      });
       document.addEventListener("mousemove", (evt) => this.handleMouseMove(evt));
       document.addEventListener("mouseup", (evt) => this.handleMouseUp(evt));
     }
@@ -272,6 +279,32 @@
     setupFormEvents() {
       document.getElementById("add-node-btn").onclick = () => this.createNode();
       document.getElementById("save-node-btn").onclick = () => this.saveNode();
+      document.getElementById("publish-story-btn").onclick = () => this.publishStory();
+      document.getElementById("auto-layout-btn").onclick = () => this.applyAutoLayout();
+    }
+
+    showPublishedVersion(version) {
+      document.getElementById("story-version").innerText = version
+        ? `v${version.version} (${new Date(version.published_at).toLocaleString()})`
+        : "Draft only";
+    }
+
+    async fetchPublishedVersion() {
+      try {
+        const { versions } = await ApiService.get(`${CONFIG.API_BASE}/${this.storyId}/versions`);
+        this.showPublishedVersion(versions[0]);
+      } catch (error) {
+        console.error("Error fetching published versions:", error);
+      }
+    }
+
+    async publishStory() {
+      try {
+        const response = await ApiService.post(`${CONFIG.API_BASE}/${this.storyId}/versions`, {});
+        this.showPublishedVersion(await response.json());
+      } catch (error) {
+        console.error("Error publishing story:", error);
+      }
     }
 
     setDragCandidate(node, evt) {
@@ -303,6 +336,7 @@
     handleMouseUp(evt) {
       if (this.isDragging) {
         this.isDragging = false;
+        this.saveNodePosition(this.dragNode);
         this.dragNode = null;
         this.dragCandidate = null;
         return;
@@ -332,60 +366,78 @@
       this.render();
     }
 
+    async saveNodePosition(node) {
+      try {
+        await ApiService.put(`${CONFIG.API_BASE}/nodes/${node.id}`, { x: node.x, y: node.y });
+      } catch (error) {
+        console.error("Error saving node position:", error);
+      }
+    }
+
+    async applyAutoLayout() {
+      try {
+        await ApiService.post(`${CONFIG.API_BASE}/${this.storyId}/layout`, {});
+        await this.loadViewport();
+      } catch (error) {
+        console.error("Error applying layout:", error);
+      }
+    }
+
     async fetchStoryData() {
       try {
         const storyData = await ApiService.get(`${CONFIG.API_BASE}/${this.storyId}`);
         document.getElementById("story-name").value = storyData.title;
         document.getElementById("story-description").value = storyData.description;
+        await this.loadViewport();
+      } catch (error) {
+        console.error("Error fetching story data:", error);
+      }
+    }
 
-        const nodesData = await ApiService.get(`${CONFIG.API_BASE}/${this.storyId}/nodes`);
-        const fetchedNodes = nodesData.nodes;
-        const fetchedNodesMap = new Map(fetchedNodes.map((n) => [n.id, n]));
+    // only the nodes on screen (and around it) are loaded, so large stories open as fast as small ones
+    async loadViewport() {
+      const margin = CONFIG.VIEWPORT_MARGIN;
+      const left = this.graphContainer.scrollLeft;
+      const top = this.graphContainer.scrollTop;
+      const bbox = [
+        left - margin,
+        top - margin,
+        left + this.graphContainer.clientWidth + margin,
+        top + this.graphContainer.clientHeight + margin,
+      ].join(",");
+      try {
+        // nodes never placed are given their place in the automatic layout by the server
+        const graph = await ApiService.get(`${CONFIG.API_BASE}/${this.storyId}/graph?bbox=${bbox}`);
 
-        fetchedNodes.forEach((nodeData) => {
-          let node = this.getNodeById(nodeData.id);
+        this.nodes = graph.nodes.map((nodeData) => {
+          const node = this.getNodeById(nodeData.id);
+          if (node && node === this.dragNode) return node;
           if (node) {
-            const { x, y } = node;
             node.update(nodeData);
-            node.x = x;
-            node.y = y;
-          } else {
-            const index = this.nodes.length;
-            nodeData.x =
-              nodeData.x != null
-                ? nodeData.x
-                : (index % CONFIG.COLUMNS) * CONFIG.SPACING.x + 50;
-            nodeData.y =
-              nodeData.y != null
-                ? nodeData.y
-                : Math.floor(index / CONFIG.COLUMNS) * CONFIG.SPACING.y + 50;
-            node = new GraphNode(nodeData, this);
-            this.nodes.push(node);
+            return node;
           }
+          return new GraphNode(nodeData, this);
         });
-        this.nodes = this.nodes.filter((node) => fetchedNodesMap.has(node.id));
+        // off-screen ends of the loaded edges, only needed to draw them
+        this.neighbors = new Map(
+          Object.entries(graph.neighbors).map(([id, [x, y]]) => [Number(id), { id: Number(id), x, y }])
+        );
 
-        const edgesData = await ApiService.get(`${CONFIG.API_BASE}/${this.storyId}/edges`);
-        const fetchedEdges = edgesData.edges;
         const edgeKey = (edge) => `${edge.from}-${edge.to}`;
-        const fetchedEdgesMap = new Map(
-          fetchedEdges.map((e) => [edgeKey(e), e])
-        );
-        fetchedEdges.forEach((edgeData) => {
-          let edge = this.edges.find((e) => edgeKey(e) === edgeKey(edgeData));
-          if (edge) {
-            edge.update(edgeData);
-          } else {
-            edge = new GraphEdge(edgeData, this);
-            this.edges.push(edge);
-          }
+        const selectedKey = this.selectedEdge && edgeKey(this.selectedEdge);
+        this.edges = graph.edges.map((edgeData) => {
+          const edge = new GraphEdge(edgeData, this);
+          if (edgeKey(edge) === selectedKey) this.selectedEdge = edge;
+          return edge;
         });
-        this.edges = this.edges.filter((edge) =>
-          fetchedEdgesMap.has(edgeKey(edge))
-        );
+
+        // the graph area scrolls over the whole story, not just what is loaded
+        const [width, height] = graph.extent;
+        this.edgesSvg.setAttribute("width", Math.max(CONFIG.MIN_GRAPH_SIZE, width + margin));
+        this.edgesSvg.setAttribute("height", Math.max(CONFIG.MIN_GRAPH_SIZE, height + margin));
         this.render();
       } catch (error) {
-        console.error("Error fetching story data:", error);
+        console.error("Error loading the graph:", error);
       }
     }
 
@@ -451,13 +503,20 @@
     }
 
     async createEdge(fromNodeId, toNodeId) {
+      // e.g. SUCCESS, FAIL, "FAIL and health > 0" or "choice == 2"
+      const condition = prompt("Condition of the edge", "SUCCESS");
+      if (condition === null) return;
       const payload = {
         from_node_id: fromNodeId,
         to_node_id: toNodeId,
-        condition: "SUCCESS",
+        condition: condition,
       };
       try {
-        await ApiService.post(`${CONFIG.API_BASE}/${this.storyId}/edges`, payload);
+        const response = await ApiService.post(`${CONFIG.API_BASE}/${this.storyId}/edges`, payload);
+        if (response.status === 400) {
+          alert(`Invalid condition: ${condition}`);
+          return;
+        }
         await this.fetchStoryData();
       } catch (error) {
         console.error("Error creating edge:", error);
@@ -475,9 +534,26 @@
       }
     }
 
-    loadNodeForm(nodeId) {
+    async loadNodeForm(nodeId) {
       const node = this.getNodeById(nodeId);
       if (!node) return;
+      try {
+        const { data, assets } = await ApiService.get(
+          `${CONFIG.API_BASE}/nodes/${nodeId}?fields=content,left_img_id,right_img_id,background_img_id`
+        );
+        // pictures are referenced by asset id, the form edits their paths
+        node.update({
+          content: data.content,
+          left_img: assets[data.left_img_id] || "",
+          right_img: assets[data.right_img_id] || "",
+          background_img: assets[data.background_img_id] || "",
+        });
+      } catch (error) {
+        console.error("Error fetching node:", error);
+        return;
+      }
+      // another node may have been selected in the meantime
+      if (!this.selectedNode || this.selectedNode.id !== nodeId) return;
       document.getElementById("node-id").value = node.id;
       document.getElementById("node-id-display").innerText = node.id;
       document.getElementById("node-type").value = node.node_type;
@@ -611,8 +687,8 @@
     }
 
     render() {
-      const fromNode = this.editor.getNodeById(this.from);
-      const toNode = this.editor.getNodeById(this.to);
+      const fromNode = this.editor.getNodeById(this.from) || this.editor.neighbors.get(this.from);
+      const toNode = this.editor.getNodeById(this.to) || this.editor.neighbors.get(this.to);
       if (!fromNode || !toNode) return null;
       const fromCenter = {
         x: fromNode.x + CONFIG.NODE_DIMENSIONS.halfWidth,
@@ -641,6 +717,10 @@
       line.setAttribute("x2", endPoint.x);
       line.setAttribute("y2", endPoint.y);
       line.style.pointerEvents = "stroke";
+      if (this.condition !== "SUCCESS") line.setAttribute("stroke-dasharray", "6 4");
+      const title = document.createElementNS("http://www.w3.org/2000/svg", "title");
+      title.textContent = this.condition;
+      line.appendChild(title);
       if (
         this.editor.selectedEdge &&
         this.editor.selectedEdge.from === this.from &&
@@ -10,11 +10,19 @@ let storyReader = null;
  */
 let user = null;
 
+/**
+ * Global EventQueue instance.
+ * @type {EventQueue|null}
+ */
+let readingEvents = null;
+
 document.addEventListener("DOMContentLoaded", async () => {
     const storyID = Number.parseInt(document.querySelector("#storyID").textContent, 10);
+    const bundleURL = document.querySelector("#bundleURL").textContent.trim();
+    readingEvents = new EventQueue();
     storyReader = new StoryReader();
     user = new StoryUser(storyID);
-    await storyReader.loadStory(storyID);
+    await storyReader.loadStory(storyID, null, bundleURL || null);
     await user.fetchUserData();
 });
 
@@ -31,13 +39,78 @@ const getReader = () => storyReader;
 const getUser = () => user;
 
 
+/**
+ * Batches reading events and sends them to the API.
+ *
+ * Events are sent when enough of them are pending, after a few seconds, and
+ * when the page is hidden (with sendBeacon, so that they survive the page being closed).
+ */
+class EventQueue {
+    /**
+     * @param {number} [maxBatch=20] - Number of pending events triggering a send.
+     * @param {number} [delay=5000] - Milliseconds before pending events are sent.
+     */
+    constructor(maxBatch = 20, delay = 5000) {
+        this.url = "/api/events";
+        this.maxBatch = maxBatch;
+        this.delay = delay;
+        this.pending = [];
+        this.timer = null;
+        document.addEventListener("visibilitychange", () => {
+            if (document.visibilityState === "hidden") {
+                this.flush(true);
+            }
+        });
+    }
+
+    /**
+     * Queues an event.
+     * @param {number} storyID
+     * @param {number} nodeID
+     * @param {string} kind - "view", "correct", "wrong" or "complete"
+     */
+    push(storyID, nodeID, kind) {
+        this.pending.push({ story_id: storyID, node_id: nodeID, kind: kind });
+        if (this.pending.length >= this.maxBatch) {
+            this.flush();
+        } else if (this.timer === null) {
+            this.timer = setTimeout(() => this.flush(), this.delay);
+        }
+    }
+
+    /**
+     * Sends the pending events.
+     * @param {boolean} [unloading=false] - Whether the page may be closing.
+     */
+    flush(unloading = false) {
+        clearTimeout(this.timer);
+        this.timer = null;
+        if (this.pending.length === 0) {
+            return;
+        }
+        const body = JSON.stringify({ events: this.pending });
+        this.pending = [];
+        if (unloading && navigator.sendBeacon) {
+            navigator.sendBeacon(this.url, new Blob([body], { type: "application/json" }));
+            return;
+        }
+        fetch(this.url, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: body,
+            keepalive: true,
+        }).catch((error) => console.error("Error sending reading events:", error));
+    }
+}
+
+
 /**
  * Class representing a user within a story context.
  *
  * This class manages the user’s data such as health and progress,
  * and updates a visual health bar element on the page. It fetches user
- * data from an API endpoint, adjusts the health on wrong answers, and renders
- * the current state to the health bar.
+ * data from an API endpoint, moves the user through the story (the server
+ * applies the damage of wrong answers), and renders the current state to the health bar.
  */
 class StoryUser {
     /**
@@ -87,13 +160,28 @@ class StoryUser {
     }
 
     /**
-     * Processes a wrong answer by decrementing the user's health.
+     * Moves the user past a node. The server picks the next node from the conditions
+     * of the node's edges and the user's state, and returns the new health and progress.
      *
-     * Decreases the health property by 10 points and then updates the UI by calling render.
+     * @param {number} nodeID - The node the user leaves.
+     * @param {string|null} outcome - "correct" or "wrong" after a quiz, null otherwise.
+     * @param {number|null} choice - The option picked by the user, if any.
+     * @returns {Promise<number|null>} The next node ID, or null to stay on the node.
      */
-    wrongAnswer() {
-        this.health -= 10;
+    async advance(nodeID, outcome, choice) {
+        const response = await fetch(`/api/userinfo/${this.storyID}/advance`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ node_id: nodeID, outcome: outcome, choice: choice }),
+        });
+        if (!response.ok) {
+            throw new Error("HTTP error " + response.status);
+        }
+        const data = await response.json();
+        this.health = data["health"];
+        this.progress = data["progress"];
         this.render();
+        return data["next"];
     }
 
     /**
@@ -121,15 +209,26 @@ class StoryReader {
         this.currentNodeID = null;
         this.currentNode = null;
         this.nextNodesID = [];
+        this.bundle = null;
     }
 
     /**
      * Loads the story by storyID and optionally a specific node.
+     * Published stories are loaded at once from their bundle, the nodes are then read from memory.
      * @param {number} storyID 
      * @param {number|null} [nodeID=null] 
+     * @param {string|null} [bundleURL=null] - URL of the published bundle, null to read the draft
      */
-    async loadStory(storyID, nodeID = null) {
+    async loadStory(storyID, nodeID = null, bundleURL = null) {
         this.storyID = storyID;
+        if (bundleURL !== null) {
+            const response = await fetch(bundleURL);
+            if (!response.ok) {
+                throw new Error("HTTP error " + response.status);
+            }
+            this.bundle = await response.json();
+            this.assets = this.bundle.assets;
+        }
         this.currentNodeID = nodeID === null ? await this.fetchStartNode() : nodeID;
         await this.fetchData();
     }
@@ -139,23 +238,29 @@ class StoryReader {
      * @returns {Promise<number>}
      */
     async fetchStartNode() {
-        const url = `/api/stories/${this.storyID}/nodes`;
+        if (this.bundle !== null) {
+            return this.bundle.start;
+        }
+        const url = `/api/stories/${this.storyID}/start`;
         const response = await fetch(url);
         if (!response.ok) {
             throw new Error("HTTP error " + response.status);
         }
-        const { nodes } = await response.json();
-        const startNode = nodes.find(node => node.node_type === "START");
-        if (startNode) {
-            return startNode.id;
-        }
-        throw new Error("Not Found");
+        const { data } = await response.json();
+        return data.id;
     }
 
     /**
      * Fetches data for the current node and updates the display.
      */
     async fetchData() {
+        if (this.bundle !== null) {
+            const { next, ...node } = this.bundle.nodes[this.currentNodeID];
+            this.currentNode = node;
+            this.nextNodesID = next;
+            this.display();
+            return;
+        }
         const url = `/api/stories/nodes/${this.currentNodeID}`;
         const response = await fetch(url);
         if (!response.ok) {
@@ -165,6 +270,7 @@ class StoryReader {
         // retrieve current node and next nodes id
         this.currentNode = json.data;
         this.nextNodesID = json.next;
+        this.assets = json.assets;
         this.display();
     }
 
@@ -172,6 +278,10 @@ class StoryReader {
      * Updates the UI elements with the current node's content.
      */
     display() {
+        readingEvents.push(this.storyID, this.currentNodeID, "view");
+        if (this.currentNode["type"] == "END") {
+            readingEvents.push(this.storyID, this.currentNodeID, "complete");
+        }
         if (this.currentNode["type"] == "QUIZ") {
             this.contentSection.innerHTML = "";
             const quizParser = new QuizParser(this.currentNode["content"]);
@@ -179,38 +289,54 @@ class StoryReader {
         } else {
             this.contentSection.innerHTML = this.currentNode["content"];
         }
-        this.leftImgSection.src = "../static/pictures/" + this.currentNode["left_img"];
-        this.rightImgSection.src = "../static/pictures/" + this.currentNode["right_img"];
-        if (this.currentNode["background_img"]) {
+        const leftImg = this.picture("left_img_id");
+        const rightImg = this.picture("right_img_id");
+        const backgroundImg = this.picture("background_img_id");
+        this.leftImgSection.src = "../static/pictures/" + leftImg;
+        this.rightImgSection.src = "../static/pictures/" + rightImg;
+        if (backgroundImg) {
             // Construct the URL using a root-relative path
-            const bgImageUrl = `/static/pictures/${this.currentNode["background_img"]}`;
+            const bgImageUrl = `/static/pictures/${backgroundImg}`;
             document.body.style.backgroundImage = `url('${bgImageUrl}')`;
         } else {
             // Optional: Set a default background or clear it if no image is specified
             document.body.style.backgroundImage = 'none'; // Or set to a default CSS color/gradient
         }
         this.speakerSection.innerHTML = this.currentNode["speaker"];
-        document.body.style.backgroundImage = `url(${"../static/pictures/" + this.currentNode["background_img"]})`;
+        // options of a choice node, e.g. <button data-choice="2">, lead along `choice == 2` edges
+        for (const option of this.contentSection.querySelectorAll("[data-choice]")) {
+            option.addEventListener("click", (event) => {
+                event.preventDefault();
+                this.next(Number.parseInt(option.dataset.choice, 10));
+            });
+        }
+        document.body.style.backgroundImage = `url(${"../static/pictures/" + backgroundImg})`;
+    }
+
+    /**
+     * Returns the path of one of the current node's pictures.
+     * @param {string} column - "left_img_id", "right_img_id" or "background_img_id"
+     * @returns {string}
+     */
+    picture(column) {
+        return this.assets[this.currentNode[column]] || "";
     }
 
     /**
      * Moves to the next node and updates the UI.
+     * The next node is chosen by the server, from the edge conditions of the current node.
+     * @param {number|null} [choice=null] - The option picked by the reader, if any.
      */
-    async next() {
-        let needFetch = true;
-        if (this.currentNode["type"] == "QUIZ") {
-            if (this.correctAnswer() && this.nextNodesID.length > 0) {
-                this.currentNodeID = this.nextNodesID[0];
-            } else {
-                needFetch = false;
-            }
-        } else if (this.currentNode["type"] != "END" && this.nextNodesID.length > 0) {
-            this.currentNodeID = this.nextNodesID[0]; // take the first one, for the moment
+    async next(choice = null) {
+        if (this.currentNode["type"] == "END" || this.nextNodesID.length == 0) {
+            return;
         }
-        if(needFetch) { // fetch the data only if we changed
+        const outcome = this.currentNode["type"] == "QUIZ" ? (this.correctAnswer() ? "correct" : "wrong") : null;
+        const nextID = await getUser().advance(this.currentNodeID, outcome, choice);
+        if (nextID !== null) { // fetch the data only if we changed
+            this.currentNodeID = nextID;
             await this.fetchData();
         }
-        
     }
 
     correctAnswer() {
@@ -226,8 +352,8 @@ class StoryReader {
                 quiz.classList.remove("quiz-error");
             }
         };
+        readingEvents.push(this.storyID, this.currentNodeID, result ? "correct" : "wrong");
         if(!result) { // display a modal box
-            getUser().wrongAnswer();
             document.getElementById('wrong-modal').style.display = 'block';
         }
         return result;
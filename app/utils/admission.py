@@ -0,0 +1,162 @@
+"""
+Admission control: per-class concurrency limits with bounded wait queues.
+
+Every request is sorted into a concurrency class (`auth`, `editor-write`,
+`reader-read`, `bulk`). A class runs at most `limit` requests at once; up to
+`queue` more wait at most `timeout` seconds for a slot, and anything beyond is
+rejected at once with a `503` and a `Retry-After` header. A signup storm (bcrypt)
+or a large export can then only saturate its own class, and the reader endpoints
+keep their latency.
+
+Configuration:
+    ADMISSION_CONTROL (bool): Whether requests are admitted through the classes at all.
+    ADMISSION_CLASSES (dict[str, dict]): `limit`, `queue`, `timeout` and `retry_after` of each
+        class, merged into DEFAULT_CLASSES.
+    ADMISSION_ENDPOINTS (dict[str, str | None]): Class by endpoint ("api.story_clone") or by method
+        and endpoint ("POST login.signup"), merged into DEFAULT_ENDPOINTS. None exempts an endpoint.
+
+Endpoints missing from ADMISSION_ENDPOINTS are `editor-write` for write methods
+and `reader-read` otherwise.
+"""
+import threading
+import time
+from flask import Flask, Request, g, jsonify, request
+from app.utils.metrics import registry
+
+
+DEFAULT_CLASSES = {
+    "auth": {"limit": 2, "queue": 8, "timeout": 1.0, "retry_after": 2},
+    "editor-write": {"limit": 4, "queue": 16, "timeout": 2.0, "retry_after": 1},
+    "reader-read": {"limit": 32, "queue": 64, "timeout": 1.0, "retry_after": 1},
+    "bulk": {"limit": 1, "queue": 2, "timeout": 5.0, "retry_after": 10},
+}
+
+DEFAULT_ENDPOINTS = {
+    "POST login.login": "auth",
+    "POST login.signup": "auth",
+    "PUT api.new_user": "auth",
+    "POST api.events": "reader-read",
+    "POST api.user_story_advance": "reader-read",
+    "api.story_clone": "bulk",
+    "POST api.story_versions": "bulk",
+    "POST api.story_layout": "bulk",
+    "static": None,
+    "metrics": None,
+}
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+admission_wait = registry.histogram(
+    "admission_wait_seconds", "Time requests waited in the queue of their concurrency class.", ("class",))
+admission_rejected = registry.counter(
+    "admission_rejected", "Requests rejected because their concurrency class was saturated.", ("class",))
+
+
+class ConcurrencyClass:
+    """
+    Counting semaphore with a bounded, time-limited wait queue.
+
+    Args:
+        name (str): The name of the class.
+        limit (int): The number of requests running at once.
+        queue (int): The number of requests allowed to wait for a slot.
+        timeout (float): Seconds a request waits for a slot before being rejected.
+        retry_after (int): Seconds sent to rejected clients in `Retry-After`.
+    """
+
+    def __init__(self, name: str, limit: int, queue: int, timeout: float, retry_after: int = 1):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed. Return False if the request is rejected."""
+        start = time.perf_counter()
+        with self._condition:
+            if self.in_flight < self.limit and self.waiting == 0:
+                self.in_flight += 1
+                return True
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self.in_flight < self.limit, self.timeout)
+                if admitted:
+                    self.in_flight += 1
+            finally:
+                self.waiting -= 1
+        admission_wait.observe(time.perf_counter() - start, (self.name,))
+        return admitted
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class AdmissionControl:
+    """
+    Flask extension admitting requests through their concurrency class.
+    Must be initialized before the other extensions, so that rejected requests cost nothing.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.classes: dict[str, ConcurrencyClass] = {}
+        self.endpoints: dict[str, str | None] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("ADMISSION_CONTROL", True)
+        app.config.setdefault("ADMISSION_CLASSES", {})
+        app.config.setdefault("ADMISSION_ENDPOINTS", {})
+        settings = {name: dict(values) for name, values in DEFAULT_CLASSES.items()}
+        for name, values in app.config["ADMISSION_CLASSES"].items():
+            settings.setdefault(name, {}).update(values)
+        self.classes = {name: ConcurrencyClass(name, **values) for name, values in settings.items()}
+        self.endpoints = {**DEFAULT_ENDPOINTS, **app.config["ADMISSION_ENDPOINTS"]}
+        if app.config["ADMISSION_CONTROL"]:
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+        registry.callback("gauge", "admission_in_flight", "Requests running, by concurrency class.", ("class",),
+                          lambda: {(name,): c.in_flight for name, c in self.classes.items()})
+        registry.callback("gauge", "admission_queued", "Requests waiting for a slot, by concurrency class.",
+                          ("class",), lambda: {(name,): c.waiting for name, c in self.classes.items()})
+        registry.callback("gauge", "admission_limit", "Concurrency limit, by concurrency class.", ("class",),
+                          lambda: {(name,): c.limit for name, c in self.classes.items()})
+        app.extensions["admission"] = self
+
+    def classify(self, request: Request) -> str | None:
+        """Return the name of the concurrency class of a request, None if it is exempt."""
+        endpoint = request.endpoint or ""
+        for key in (f"{request.method} {endpoint}", endpoint):
+            if key in self.endpoints:
+                return self.endpoints[key]
+        # a listing of every node with their full content is an export
+        if endpoint == "api.story_nodes" and request.method == "GET" and "fields" not in request.args:
+            return "bulk"
+        return "editor-write" if request.method in WRITE_METHODS else "reader-read"
+
+    def _before_request(self):
+        name = self.classify(request)
+        if name is None:
+            return None
+        concurrency_class = self.classes[name]
+        if not concurrency_class.acquire():
+            admission_rejected.inc(1, (name,))
+            response = jsonify({"message": "Server busy, please retry later"})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(concurrency_class.retry_after)
+            return response
+        g.admission_class = concurrency_class
+        return None
+
+    def _teardown_request(self, exception):
+        concurrency_class = g.pop("admission_class", None)
+        if concurrency_class is not None:
+            concurrency_class.release()
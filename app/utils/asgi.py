@@ -0,0 +1,177 @@
+"""
+Minimal ASGI plumbing: request parsing, JSON responses, and an adapter running a
+WSGI application (the Flask app) on a thread pool for every request the async
+routes don't handle.
+
+asgiref's `WsgiToAsgi` is not used for the adapter: it runs the application
+with a thread-sensitive `sync_to_async`, so outside of Django every request
+shares one thread and the Flask requests would be served one at a time; it
+also never closes the response iterable, which skips the response's
+`call_on_close` callbacks.
+"""
+import asyncio
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from tempfile import SpooledTemporaryFile
+from typing import Awaitable, Callable
+from urllib.parse import parse_qs
+
+
+class Request:
+    """The parts of an ASGI HTTP scope the async routes need."""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.method: str = scope["method"]
+        self.path: str = scope["path"]
+        self.headers: dict[str, str] = {}
+        for name, value in scope["headers"]:
+            self.headers[name.decode("latin-1")] = value.decode("latin-1")
+        self.args: dict[str, list[str]] = parse_qs(scope["query_string"].decode("latin-1"))
+        cookie = SimpleCookie()
+        cookie.load(self.headers.get("cookie", ""))
+        self.cookies: dict[str, str] = {name: morsel.value for name, morsel in cookie.items()}
+
+
+async def send_json(send: Callable, data: object, status: int = 200, headers: dict[str, str] | None = None):
+    """Send a complete JSON response."""
+    body = json.dumps(data, separators=(",", ":")).encode()
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    raw_headers.extend((name.encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items())
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+# request bodies larger than this are spooled to disk
+MAX_MEMORY_BODY = 64 * 1024
+
+Handler = Callable[..., Awaitable[bool | None]]
+
+
+class Router:
+    """
+    Routes requests to async handlers by method and path pattern.
+
+    A handler receives the request, the ASGI `send` callable and the groups of the
+    pattern as ints. It returns False to let the request fall through to the
+    WSGI application instead.
+    """
+
+    def __init__(self):
+        self._routes: list[tuple[str, re.Pattern, Handler]] = []
+
+    def route(self, method: str, pattern: str):
+        def decorator(handler: Handler) -> Handler:
+            self._routes.append((method, re.compile(f"^{pattern}$"), handler))
+            return handler
+        return decorator
+
+    def match(self, method: str, path: str) -> tuple[Handler, list[int]] | None:
+        for route_method, pattern, handler in self._routes:
+            if route_method == method:
+                match = pattern.match(path)
+                if match:
+                    return handler, [int(group) for group in match.groups()]
+        return None
+
+
+class WSGIAdapter:
+    """
+    Serve a WSGI application from ASGI, one request per thread of a bounded pool.
+    The request body is read before the application is called, in memory or
+    spooled to disk past `MAX_MEMORY_BODY`, and the response body is sent as the
+    application produces it.
+
+    Args:
+        wsgi_app: The WSGI application.
+        threads (int): The number of threads running the application.
+    """
+
+    def __init__(self, wsgi_app, threads: int = 8):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        with SpooledTemporaryFile(max_size=MAX_MEMORY_BODY) as body:
+            while True:
+                message = await receive()
+                body.write(message.get("body", b""))
+                if not message.get("more_body"):
+                    break
+            length = body.tell()
+            body.seek(0)
+            environ = self._environ(scope, body, length)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._run, environ, send, loop)
+
+    def _run(self, environ: dict, send: Callable, loop: asyncio.AbstractEventLoop) -> None:
+        response = {}
+
+        def send_now(message: dict) -> None:
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get("started"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["start"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            }
+
+        def start() -> None:
+            if not response.get("started"):
+                response["started"] = True
+                send_now(response["start"])
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if chunk:
+                    start()
+                    send_now({"type": "http.response.body", "body": chunk, "more_body": True})
+            start()
+            send_now({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+
+    @staticmethod
+    def _environ(scope: dict, body: SpooledTemporaryFile, length: int) -> dict:
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+            "PATH_INFO": scope["path"].encode().decode("latin-1"),
+            "QUERY_STRING": scope["query_string"].decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "CONTENT_LENGTH": str(length),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name == "CONTENT_TYPE":
+                environ["CONTENT_TYPE"] = value
+            elif name != "CONTENT_LENGTH":
+                key = f"HTTP_{name}"
+                separator = "; " if name == "COOKIE" else ","
+                environ[key] = f"{environ[key]}{separator}{value}" if key in environ else value
+        return environ
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,419 @@
+"""
+Application cache shared by the services, with interchangeable backends.
+
+    CACHE_BACKEND = "lru"      in-process LRU: every worker has its own copy (`flask serve` with
+                               several processes uses "shared" instead)
+    CACHE_BACKEND = "shared"   files in a shared-memory folder (/dev/shm), seen by every worker of the host
+    CACHE_BACKEND = "redis"    a network server (needs the redis package), seen by every host
+
+Values are pickled, so callers always get their own copy of a cached object.
+
+Keys can be versioned by a namespace: `get_or_set("next_ids", loader, namespace="story:1")`
+stores the value under the current version of `story:1`, and `bump("story:1")`
+invalidates everything stored under it at once, in every worker, with a single
+counter increment. Stale versions are never read again and age out of the backend.
+
+Configuration:
+    CACHE_BACKEND (str): "lru", "shared" or "redis". Defaults to "lru".
+    CACHE_DEFAULT_TIMEOUT (int): Seconds entries are kept. Defaults to 300.
+    CACHE_MAX_ENTRIES (int): Entries kept by the "lru" and "shared" backends. Defaults to 4096.
+    CACHE_DIR (str): Folder of the "shared" backend. Defaults to a folder of /dev/shm,
+        or of the instance folder when /dev/shm is missing.
+    CACHE_URL (str): URL of the "redis" backend. Defaults to redis://localhost:6379/0.
+    CACHE_CLIENT (object): Client used instead of connecting to CACHE_URL, such as an `InMemoryClient`.
+    CACHE_KEY_PREFIX (str): Prefix of every key, so that several applications can share a backend.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from flask import Flask
+
+try:
+    import redis
+except ImportError:  # redis is optional, only needed by the "redis" backend
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LRUBackend:
+    """
+    In-process store evicting the least recently used entries. Counters are
+    kept apart and never evicted, so that a namespace version never goes back.
+
+    Args:
+        max_entries (int): The number of entries kept.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float | None, bytes]] = OrderedDict()
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if key in self._counters:
+                return str(self._counters[key]).encode()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, timeout: int | None = None) -> None:
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class SharedFileBackend:
+    """
+    Store shared by every process of a host: one file per entry, in a folder that
+    lives in memory when it is under /dev/shm.
+
+    Entries are written to a temporary file then renamed, so readers never see a
+    half-written entry and need no lock. Counters live in their own folder and are
+    incremented under an `fcntl` lock. Once there are more than `max_entries`
+    entries, the least recently written are removed.
+
+    Args:
+        directory (str): The folder of the store, created with owner-only permissions.
+        max_entries (int): The number of entries kept.
+    """
+
+    _HEADER = struct.Struct("<d")  # expiry timestamp, 0 for none
+    _PRUNE_EVERY = 256
+
+    def __init__(self, directory: str, max_entries: int = 4096):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = os.path.join(directory, "entries")
+        self._counters = os.path.join(directory, "counters")
+        os.makedirs(self._entries, mode=0o700, exist_ok=True)
+        os.makedirs(self._counters, mode=0o700, exist_ok=True)
+        self._writes = 0
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    @staticmethod
+    def _replace(folder: str, name: str, data: bytes) -> None:
+        descriptor, temporary = tempfile.mkstemp(dir=folder, prefix=".")
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+        os.replace(temporary, os.path.join(folder, name))
+
+    def get(self, key: str) -> bytes | None:
+        name = self._name(key)
+        for folder in (self._entries, self._counters):
+            try:
+                with open(os.path.join(folder, name), "rb") as file:
+                    data = file.read()
+            except FileNotFoundError:
+                continue
+            if folder == self._counters:
+                return data
+            (expires,) = self._HEADER.unpack_from(data)
+            if expires and expires < time.time():
+                return None
+            return data[self._HEADER.size:]
+        return None
+
+    def set(self, key: str, value: bytes, timeout: int | None = None) -> None:
+        expires = time.time() + timeout if timeout else 0
+        self._replace(self._entries, self._name(key), self._HEADER.pack(expires) + value)
+        self._writes += 1
+        if self._writes % self._PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(os.path.join(self._entries, self._name(key)))
+        except FileNotFoundError:
+            pass
+
+    def incr(self, key: str) -> int:
+        name = self._name(key)
+        with open(os.path.join(self._counters, f".{name}.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(os.path.join(self._counters, name), "rb") as file:
+                    value = int(file.read()) + 1
+            except FileNotFoundError:
+                value = 1
+            self._replace(self._counters, name, str(value).encode())
+            return value
+
+    def prune(self) -> None:
+        """Remove the least recently written entries beyond `max_entries`."""
+        entries = []
+        with os.scandir(self._entries) as iterator:
+            for entry in iterator:
+                if entry.name.startswith("."):  # being written
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        for folder in (self._entries, self._counters):
+            for name in os.listdir(folder):
+                try:
+                    os.unlink(os.path.join(folder, name))
+                except FileNotFoundError:
+                    pass
+
+
+class NetworkBackend:
+    """
+    Store on a cache server, through a redis-compatible client: any object with
+    `get`, `set(key, value, ex=seconds)`, `delete` and `incr`.
+
+    Args:
+        client: The client.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, timeout: int | None = None) -> None:
+        self.client.set(key, value, ex=timeout or None)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(key)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+    def clear(self) -> None:
+        self.client.flushdb()
+
+
+class InMemoryClient:
+    """
+    Stand-in for a redis client, implementing the commands `NetworkBackend` uses.
+    Lets tests and benchmarks run the network backend without a server.
+
+    Example:
+        >>> create_app({"CACHE_BACKEND": "redis", "CACHE_CLIENT": InMemoryClient()})
+    """
+
+    def __init__(self):
+        self._data: dict[str, tuple[float | None, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            expires, value = self._data.get(key, (None, None))
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ex: int | None = None) -> bool:
+        with self._lock:
+            self._data[key] = (time.time() + ex if ex else None, value)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            expires, value = self._data.get(key, (None, b"0"))
+            value = int(value) + 1
+            self._data[key] = (expires, str(value).encode())
+            return value
+
+    def flushdb(self) -> bool:
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+class Cache:
+    """
+    Flask extension exposing the configured backend to the services, with
+    pickled values and versioned namespaces. Backend errors are logged and
+    treated as misses, so that the cache going away only slows requests down.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.backend = LRUBackend()
+        self.prefix = ""
+        self.default_timeout = 300
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("CACHE_BACKEND", "lru")
+        app.config.setdefault("CACHE_DEFAULT_TIMEOUT", 300)
+        app.config.setdefault("CACHE_MAX_ENTRIES", 4096)
+        app.config.setdefault("CACHE_DIR", None)
+        app.config.setdefault("CACHE_URL", "redis://localhost:6379/0")
+        app.config.setdefault("CACHE_CLIENT", None)
+        app.config.setdefault("CACHE_KEY_PREFIX", "stories:")
+        self.backend = self._create_backend(app)
+        self.prefix = app.config["CACHE_KEY_PREFIX"]
+        self.default_timeout = app.config["CACHE_DEFAULT_TIMEOUT"]
+        app.extensions["cache"] = self
+
+    @staticmethod
+    def _create_backend(app: Flask):
+        name = app.config["CACHE_BACKEND"]
+        max_entries = app.config["CACHE_MAX_ENTRIES"]
+        if name == "lru":
+            return LRUBackend(max_entries)
+        if name == "shared":
+            directory = app.config["CACHE_DIR"]
+            if directory is None:
+                folder = app.config["CACHE_KEY_PREFIX"].strip(":") or "cache"
+                if os.path.isdir("/dev/shm"):
+                    directory = os.path.join("/dev/shm", f"{folder}-{os.getuid()}")
+                else:
+                    directory = os.path.join(app.instance_path, "cache")
+            return SharedFileBackend(directory, max_entries)
+        if name == "redis":
+            client = app.config["CACHE_CLIENT"]
+            if client is None:
+                if redis is None:
+                    raise RuntimeError("The redis cache backend requires the redis package")
+                client = redis.Redis.from_url(app.config["CACHE_URL"])
+            return NetworkBackend(client)
+        raise ValueError(f"Unknown cache backend: {name}")
+
+    def _key(self, key: str, namespace: str | None) -> str:
+        if namespace is None:
+            return self.prefix + key
+        return f"{self.prefix}{namespace}@{self.version(namespace)}:{key}"
+
+    def get(self, key: str, default: Any = None, namespace: str | None = None) -> Any:
+        """Return the value stored under `key` (in the current version of `namespace`), or `default`."""
+        try:
+            data = self.backend.get(self._key(key, namespace))
+        except Exception:
+            self.errors += 1
+            logger.warning("Cache read failed", exc_info=True)
+            data = None
+        if data is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key: str, value: Any, timeout: int | None = None, namespace: str | None = None) -> None:
+        """Store a value under `key` (in the current version of `namespace`) for `timeout` seconds."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            self.backend.set(self._key(key, namespace), data,
+                             self.default_timeout if timeout is None else timeout)
+        except Exception:
+            self.errors += 1
+            logger.warning("Cache write failed", exc_info=True)
+
+    def delete(self, key: str) -> None:
+        """Remove the entry stored under `key`."""
+        try:
+            self.backend.delete(self.prefix + key)
+        except Exception:
+            self.errors += 1
+            logger.warning("Cache delete failed", exc_info=True)
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], timeout: int | None = None,
+                   namespace: str | None = None) -> Any:
+        """
+        Return the cached value, calling `loader` and storing its result on a miss.
+
+        Example:
+            >>> cache.get_or_set("next_ids", lambda: load_next_ids(1), namespace="story:1")
+        """
+        if namespace is not None:
+            # one version read for both the lookup and the store
+            key, namespace = self._key(key, namespace)[len(self.prefix):], None
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value, timeout)
+        return value
+
+    def version(self, namespace: str) -> int:
+        """Return the current version of a namespace, 0 until it is first bumped."""
+        try:
+            value = self.backend.get(f"{self.prefix}version:{namespace}")
+        except Exception:
+            self.errors += 1
+            logger.warning("Cache read failed", exc_info=True)
+            return 0
+        return int(value) if value is not None else 0
+
+    def bump(self, namespace: str) -> int:
+        """
+        Invalidate everything stored under a namespace, in every worker.
+
+        Returns:
+            int: The new version of the namespace, 0 if the backend failed.
+
+        Example:
+            >>> on_commit(lambda: cache.bump("story:1"))
+        """
+        try:
+            return self.backend.incr(f"{self.prefix}version:{namespace}")
+        except Exception:
+            self.errors += 1
+            logger.warning("Cache invalidation failed", exc_info=True)
+            return 0
+
+    def clear(self) -> None:
+        """Remove every entry and counter of the backend."""
+        self.backend.clear()
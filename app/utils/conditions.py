@@ -0,0 +1,185 @@
+"""
+Edge conditions.
+
+An edge is followed when its condition holds for the reader's state. Conditions
+are small expressions over three variables:
+
+    outcome   "correct" or "wrong" after a quiz, None otherwise
+    health    the reader's health, after the damage of a wrong answer
+    choice    the option picked by the reader, None if there was none
+
+with comparisons (`== != < <= > >=`), `and`, `or`, `not`, parentheses, numbers
+and quoted strings. `SUCCESS` (the default, no wrong answer), `FAIL` (a wrong
+answer) and `ALWAYS` are shortcuts; an empty condition is `ALWAYS`:
+
+    FAIL and health > 0
+    choice == 2
+    outcome == "correct" or health < 30
+
+A condition is compiled once into a tree of closures, so evaluating it costs a
+few function calls and never re-reads the source.
+"""
+import functools
+import operator
+import re
+from typing import Any, Callable
+
+Predicate = Callable[[dict], bool]
+_Operand = Callable[[dict], Any]
+
+VARIABLES = ("outcome", "health", "choice")
+
+_TOKEN = re.compile(r"""\s*(?:(?P<number>\d+(?:\.\d+)?)|(?P<string>"[^"]*"|'[^']*')|(?P<name>[A-Za-z_]\w*)|(?P<op>==|!=|<=|>=|<|>|\(|\)))""")
+_COMPARISONS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+_SHORTCUTS: dict[str, Predicate] = {
+    "SUCCESS": lambda state: state.get("outcome") != "wrong",
+    "FAIL": lambda state: state.get("outcome") == "wrong",
+    "ALWAYS": lambda state: True,
+}
+_CONSTANTS = {"true": True, "false": False, "none": None}
+
+
+class ConditionError(ValueError):
+    """A condition that can't be parsed, with the offset of the error in its source."""
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at position {position}")
+        self.position = position
+
+
+def _tokenize(source: str) -> list[tuple[str, str, int]]:
+    tokens = []
+    position = 0
+    while position < len(source):
+        if source[position:].isspace():
+            break
+        match = _TOKEN.match(source, position)
+        if match is None:
+            position += len(source[position:]) - len(source[position:].lstrip())
+            raise ConditionError(f"Unexpected character {source[position]!r}", position)
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        position = match.end()
+    tokens.append(("end", "", len(source)))
+    return tokens
+
+
+class _Parser:
+    # expression := and ("or" and)*
+    # and        := not ("and" not)*
+    # not        := "not" not | comparison
+    # comparison := operand (op operand)?
+    # operand    := number | string | variable | constant | shortcut | "(" expression ")"
+
+    def __init__(self, source: str):
+        self.tokens = _tokenize(source)
+        self.index = 0
+
+    def peek(self) -> tuple[str, str, int]:
+        return self.tokens[self.index]
+
+    def take(self) -> tuple[str, str, int]:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def keyword(self, word: str) -> bool:
+        kind, value, _ = self.peek()
+        if kind == "name" and value == word:
+            self.index += 1
+            return True
+        return False
+
+    def parse(self) -> Predicate:
+        predicate = self.expression()
+        kind, value, position = self.peek()
+        if kind != "end":
+            raise ConditionError(f"Unexpected {value!r}", position)
+        return predicate
+
+    def expression(self) -> _Operand:
+        operands = [self.conjunction()]
+        while self.keyword("or"):
+            operands.append(self.conjunction())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda state: any(operand(state) for operand in operands)
+
+    def conjunction(self) -> _Operand:
+        operands = [self.negation()]
+        while self.keyword("and"):
+            operands.append(self.negation())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda state: all(operand(state) for operand in operands)
+
+    def negation(self) -> _Operand:
+        if self.keyword("not"):
+            operand = self.negation()
+            return lambda state: not operand(state)
+        return self.comparison()
+
+    def comparison(self) -> _Operand:
+        left = self.operand()
+        kind, value, _ = self.peek()
+        if kind != "op" or value not in _COMPARISONS:
+            return left
+        self.take()
+        compare = _COMPARISONS[value]
+        right = self.operand()
+
+        def evaluate(state: dict) -> bool:
+            try:
+                return compare(left(state), right(state))
+            except TypeError:  # e.g. `choice > 1` when no option was picked
+                return False
+        return evaluate
+
+    def operand(self) -> _Operand:
+        kind, value, position = self.take()
+        if kind == "number":
+            number = float(value) if "." in value else int(value)
+            return lambda state: number
+        if kind == "string":
+            text = value[1:-1]
+            return lambda state: text
+        if kind == "name":
+            if value in _SHORTCUTS:
+                return _SHORTCUTS[value]
+            if value.lower() in _CONSTANTS:
+                constant = _CONSTANTS[value.lower()]
+                return lambda state: constant
+            if value in VARIABLES:
+                return lambda state: state.get(value)
+            raise ConditionError(f"Unknown name {value!r}", position)
+        if value == "(":
+            inner = self.expression()
+            kind, closing, position = self.take()
+            if closing != ")":
+                raise ConditionError("Expected ')'", position)
+            return inner
+        raise ConditionError("Unexpected end of condition" if kind == "end" else f"Unexpected {value!r}", position)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_condition(source: str | None) -> Predicate:
+    """
+    Compile an edge condition into a predicate over the reader's state.
+
+    Args:
+        source (str | None): The condition, e.g. "FAIL and health > 0". Empty or None means ALWAYS.
+
+    Returns:
+        Predicate: A function of the state ({"outcome", "health", "choice"}) returning whether the edge is followed.
+
+    Raises:
+        ConditionError: If the condition is malformed or uses an unknown name.
+
+    Example:
+        >>> compile_condition("FAIL and health > 0")({"outcome": "wrong", "health": 40, "choice": None})
+        True
+    """
+    if not source or not source.strip():
+        return _SHORTCUTS["ALWAYS"]
+    predicate = _Parser(source).parse()
+    return lambda state: bool(predicate(state))
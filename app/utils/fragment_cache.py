@@ -0,0 +1,135 @@
+"""
+Versioned cache for rendered template fragments.
+
+Templates wrap an expensive fragment in a `cache` block keyed by a name and an
+explicit version:
+
+    {% cache "story_grid", catalog_version %}
+        {% include "components/story_grid.html" %}
+    {% endcache %}
+
+The block body is only rendered when the cached entry is missing or was stored
+for another version. Entries are evicted least-recently-used once the cache
+exceeds `FRAGMENT_CACHE_MAX_SIZE` bytes.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from flask import Flask
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """
+    Memory-bounded LRU of rendered HTML fragments, exposed to Jinja as the `cache` tag.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.max_size = 8 * 1024 * 1024
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[Hashable, str, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        self.max_size = app.config.setdefault("FRAGMENT_CACHE_MAX_SIZE", self.max_size)
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        app.extensions["fragment_cache"] = self
+
+    def get(self, key: str, version: Hashable) -> str | None:
+        """Return the fragment stored under `key` for `version`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, version: Hashable, fragment: str):
+        """Store a fragment, replacing any other version of it and evicting old entries."""
+        size = len(fragment.encode())
+        if size > self.max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            self._entries[key] = (version, fragment, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def get_or_render(self, key: str, version: Hashable, render: Callable[[], str]) -> str:
+        """Return the cached fragment, rendering and storing it on a miss."""
+        fragment = self.get(key, version)
+        if fragment is None:
+            fragment = render()
+            self.set(key, version, fragment)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension implementing `{% cache key, version %}...{% endcache %}`."""
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        parser.stream.expect("comma")
+        version = parser.parse_expression()
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render_fragment", [key, version])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, key: str, version: Hashable, caller: Callable[[], str]) -> Markup:
+        cache: FragmentCache | None = self.environment.fragment_cache
+        if cache is None:
+            return Markup(caller())
+        return Markup(cache.get_or_render(key, version, caller))
+
+
+class Deferred:
+    """
+    Iterable running a loader on first use, so that the data behind a cached
+    fragment is only fetched when the fragment actually has to be rendered.
+
+    Example:
+        >>> render_template("index.html", stories=Deferred(get_all_stories))
+    """
+
+    def __init__(self, loader: Callable[[], list]):
+        self._loader = loader
+        self._items: list | None = None
+
+    def _load(self) -> list:
+        if self._items is None:
+            self._items = self._loader()
+        return self._items
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __bool__(self):
+        return bool(self._load())
@@ -0,0 +1,162 @@
+"""
+Per-request performance instrumentation.
+
+For every request this records the wall time, the number and total time of the
+SQL statements (through SQLAlchemy cursor events), the template render time and
+any phase timed with `timing(...)` (serialization, bcrypt...). The breakdown is
+returned in a `Server-Timing` header, aggregated per endpoint, and checked
+against per-endpoint query budgets so that N+1 regressions show up in the logs.
+
+Configuration:
+    SLOW_QUERY_THRESHOLD (float): Seconds above which a statement is logged with its parameters.
+    QUERY_BUDGETS (dict[str, int]): Maximum queries per request, by endpoint name.
+    DEFAULT_QUERY_BUDGET (int | None): Budget of the endpoints missing from QUERY_BUDGETS.
+    SERVER_TIMING (bool): Whether to add the `Server-Timing` header.
+"""
+import contextlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from flask import Flask, g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestStats:
+    """Measurements of the request being processed."""
+    start: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    query_time: float = 0.0
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def add(self, name: str, duration: float):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+
+@dataclass
+class EndpointStats:
+    """Aggregated measurements of an endpoint since the process started."""
+    requests: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    total_queries: int = 0
+    budget_exceeded: int = 0
+
+
+def current_stats() -> RequestStats | None:
+    """Return the measurements of the current request, if any is being instrumented."""
+    if not has_app_context():
+        return None
+    return g.get("request_stats")
+
+
+@contextlib.contextmanager
+def timing(name: str):
+    """
+    Time a phase of the current request (e.g. "serialize" or "bcrypt").
+
+    Outside of an instrumented request the block simply runs untimed.
+
+    Example:
+        >>> with timing("serialize"):
+        ...     payload = [node.serialize() for node in nodes]
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.add(name, time.perf_counter() - start)
+
+
+class Instrumentation:
+    """
+    Flask extension collecting per-request timings. Must be initialized after the database.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.endpoints: dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("SLOW_QUERY_THRESHOLD", 0.1)
+        app.config.setdefault("QUERY_BUDGETS", {})
+        app.config.setdefault("DEFAULT_QUERY_BUDGET", 20)
+        app.config.setdefault("SERVER_TIMING", True)
+        self.slow_query_threshold = app.config["SLOW_QUERY_THRESHOLD"]
+        self.query_budgets = app.config["QUERY_BUDGETS"]
+        self.default_query_budget = app.config["DEFAULT_QUERY_BUDGET"]
+        self.server_timing = app.config["SERVER_TIMING"]
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        with app.app_context():
+            from app.extensions import db
+            self.instrument_engine(db.engine)
+        app.extensions["instrumentation"] = self
+
+    def instrument_engine(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_stats()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_time += duration
+        if duration >= self.slow_query_threshold:
+            logger.warning("Slow query (%.1f ms): %s | parameters: %.1000r",
+                           duration * 1000, statement, parameters)
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = current_stats()
+        if stats is not None:
+            g.setdefault("render_starts", []).append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = current_stats()
+        starts = g.get("render_starts")
+        if stats is not None and starts:
+            stats.add("render", time.perf_counter() - starts.pop())
+
+    def _before_request(self):
+        g.request_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats: RequestStats | None = g.pop("request_stats", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.start
+        endpoint = request.endpoint or "<unmatched>"
+        budget = self.query_budgets.get(endpoint, self.default_query_budget)
+        exceeded = budget is not None and stats.queries > budget
+        if exceeded:
+            logger.warning("Query budget exceeded on %s %s (%s): %d queries, budget is %d",
+                           request.method, request.path, endpoint, stats.queries, budget)
+        with self._lock:
+            totals = self.endpoints.setdefault(endpoint, EndpointStats())
+            totals.requests += 1
+            totals.total_time += elapsed
+            totals.max_time = max(totals.max_time, elapsed)
+            totals.total_queries += stats.queries
+            totals.budget_exceeded += exceeded
+        if self.server_timing:
+            metrics = [f"app;dur={elapsed * 1000:.2f}",
+                       f'db;dur={stats.query_time * 1000:.2f};desc="{stats.queries} queries"']
+            metrics.extend(f"{name};dur={duration * 1000:.2f}" for name, duration in stats.timings.items())
+            response.headers["Server-Timing"] = ", ".join(metrics)
+        return response
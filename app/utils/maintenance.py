@@ -0,0 +1,236 @@
+"""
+Background scheduler of the maintenance jobs (`app.services.maintenance_service`).
+
+One thread per process runs the jobs that are due, but only in the process
+holding an exclusive lock on `MAINTENANCE_LOCK_FILE`: with the prefork server,
+the first worker to take it runs the jobs for all of them, and another one takes
+over when it exits, since the lock goes with its file descriptor.
+
+The prefork server (`flask serve`) starts the scheduler in each worker after
+forking, and the async entry point (`app.asgi`) when its server starts. Under
+any other server (`flask run`, `run.py`, another WSGI server) it starts with the
+first request the process serves.
+
+Warming the caches is left out with the "lru" cache backend: the entries would
+only land in the cache of the process running the jobs.
+
+Jobs are throttled so that they don't compete with the traffic: a job that is
+due while this process serves more than `MAINTENANCE_MAX_IN_FLIGHT` requests,
+or while the load average per CPU is above `MAINTENANCE_MAX_LOAD`, is put off by
+`MAINTENANCE_RETRY` seconds. The thread also runs at a lower CPU priority.
+
+Configuration:
+    MAINTENANCE_SCHEDULER (bool): Whether `start` runs the scheduler. Defaults to True.
+    MAINTENANCE_JOBS (dict): Seconds between runs, by job name, merged into `DEFAULT_JOBS`.
+        None disables a job.
+    MAINTENANCE_MAX_IN_FLIGHT (int): Requests of this process above which jobs wait. Defaults to 2.
+    MAINTENANCE_MAX_LOAD (float): Load average per CPU above which jobs wait. Defaults to 0.75.
+    MAINTENANCE_RETRY (float): Seconds a throttled job waits before trying again. Defaults to 30.
+    MAINTENANCE_LOCK_FILE (str): The file electing the process running the jobs.
+        Defaults to maintenance.lock in the instance folder.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from flask import Flask
+
+from app.utils.metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+# seconds between runs, None for the jobs only run by hand
+DEFAULT_JOBS: dict[str, float | None] = {
+    "optimize": 6 * 3600,
+    "checkpoint": 300,
+    "vacuum": 3600,
+    "warm_caches": 600,
+    "vacuum_full": None,
+}
+# jobs run as soon as the scheduler starts instead of one interval later
+RUN_AT_START = ("warm_caches",)
+# jobs filling the application cache, pointless when every process has its own
+CACHE_JOBS = ("warm_caches",)
+# nice increment of the scheduler thread
+NICENESS = 10
+
+maintenance_runs = registry.counter(
+    "maintenance_runs", "Maintenance jobs run, by outcome (done, failed, deferred).", ("job", "outcome"))
+maintenance_duration = registry.histogram(
+    "maintenance_duration_seconds", "Duration of the maintenance jobs.", ("job",))
+
+
+def _job_functions() -> dict[str, Callable[["Maintenance"], dict]]:
+    from app.services import maintenance_service as jobs
+    return {
+        "optimize": lambda scheduler: jobs.optimize_database(),
+        "checkpoint": lambda scheduler: jobs.checkpoint_wal(),
+        "vacuum": lambda scheduler: jobs.vacuum_free_pages(should_stop=scheduler.is_busy),
+        "warm_caches": lambda scheduler: jobs.warm_caches(),
+        "vacuum_full": lambda scheduler: jobs.vacuum_database(),
+    }
+
+
+@dataclass
+class Job:
+    """A periodic job and when it runs next."""
+    name: str
+    interval: float | None
+    next_run: float = 0.0
+    last_result: dict | None = None
+
+
+class Maintenance:
+    """
+    Flask extension running the maintenance jobs in a background thread.
+    Must be initialized after the admission control, whose counters tell how busy the process is.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.app: Flask | None = None
+        self.jobs: dict[str, Job] = {}
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._lock_file = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("MAINTENANCE_SCHEDULER", True)
+        app.config.setdefault("MAINTENANCE_JOBS", {})
+        app.config.setdefault("MAINTENANCE_MAX_IN_FLIGHT", 2)
+        app.config.setdefault("MAINTENANCE_MAX_LOAD", 0.75)
+        app.config.setdefault("MAINTENANCE_RETRY", 30.0)
+        app.config.setdefault("MAINTENANCE_LOCK_FILE", os.path.join(app.instance_path, "maintenance.lock"))
+        self.app = app
+        self._thread = None
+        intervals = {**DEFAULT_JOBS, **app.config["MAINTENANCE_JOBS"]}
+        self.jobs = {name: Job(name, interval) for name, interval in intervals.items()}
+        app.before_request(self._before_request)
+        app.extensions["maintenance"] = self
+
+    def _before_request(self):
+        # servers other than the prefork one and the async entry point: start with the first request
+        if self._thread is None:
+            self.start()
+
+    def is_busy(self) -> bool:
+        """Return whether the process or the host is too busy for maintenance."""
+        admission = self.app.extensions.get("admission")
+        if admission is not None:
+            in_flight = sum(c.in_flight + c.waiting for c in admission.classes.values())
+            if in_flight > self.app.config["MAINTENANCE_MAX_IN_FLIGHT"]:
+                return True
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:  # not available on this platform
+            return False
+        return load > self.app.config["MAINTENANCE_MAX_LOAD"]
+
+    def run_job(self, name: str) -> dict:
+        """
+        Run a job now, whatever the load, and return its summary.
+
+        Raises:
+            KeyError: If there is no such job.
+
+        Example:
+            >>> maintenance.run_job("checkpoint")
+            {"busy": 0, "log": 812, "checkpointed": 812}
+        """
+        function = _job_functions()[name]
+        start = time.perf_counter()
+        with self.app.app_context():
+            from app.extensions import db
+            try:
+                result = function(self)
+            except Exception:
+                maintenance_runs.inc(1, (name, "failed"))
+                raise
+            finally:
+                db.session.remove()
+                maintenance_duration.observe(time.perf_counter() - start, (name,))
+        maintenance_runs.inc(1, (name, "done"))
+        if name in self.jobs:
+            self.jobs[name].last_result = result
+        return result
+
+    def start(self) -> bool:
+        """
+        Start the scheduler thread of this process, unless it is disabled or running.
+        Call it in each worker after forking: threads don't survive a fork.
+
+        Returns:
+            bool: Whether a thread was started.
+        """
+        with self._start_lock:
+            if not self.app.config["MAINTENANCE_SCHEDULER"] or (self._thread and self._thread.is_alive()):
+                return False
+            if self.app.config.get("CACHE_BACKEND", "lru") == "lru":
+                for name in CACHE_JOBS:
+                    self.jobs[name].interval = None
+            now = time.monotonic()
+            for job in self.jobs.values():
+                job.next_run = now if job.name in RUN_AT_START else now + (job.interval or 0)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, timeout: float | None = None):
+        """Stop the scheduler thread, after the job it runs if any, and give up the election."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _elected(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        path = self.app.config["MAINTENANCE_LOCK_FILE"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        lock_file = open(path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info("Process %d runs the maintenance jobs", os.getpid())
+        return True
+
+    def _run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICENESS)  # Linux: the thread only
+        except (AttributeError, OSError):
+            pass
+        retry = self.app.config["MAINTENANCE_RETRY"]
+        while not self._stop.is_set():
+            scheduled = [job for job in self.jobs.values() if job.interval is not None]
+            job = min(scheduled, key=lambda job: job.next_run, default=None)
+            if job is None:
+                return
+            if self._stop.wait(max(0.0, job.next_run - time.monotonic())):
+                return
+            if not self._elected():
+                # another process runs the jobs: check again later, in case it exits
+                job.next_run = time.monotonic() + retry
+                continue
+            if self.is_busy():
+                maintenance_runs.inc(1, (job.name, "deferred"))
+                job.next_run = time.monotonic() + retry
+                continue
+            try:
+                result = self.run_job(job.name)
+                logger.info("Maintenance job %s: %s", job.name, result)
+            except Exception:
+                logger.exception("Maintenance job %s failed", job.name)
+            job.next_run = time.monotonic() + (job.interval if job.interval is not None else float("inf"))
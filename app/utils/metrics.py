@@ -0,0 +1,358 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are sharded per thread: a thread only ever
+writes to its own shard, so updates take no lock. Shards are summed when
+`/metrics` is scraped, and the shards of finished threads are folded into a
+single retired shard so short-lived request threads don't accumulate.
+
+Values derived from other objects (pool sizes, cache hit counters...) are
+registered as callbacks evaluated at scrape time.
+"""
+import contextlib
+import threading
+from abc import ABC, abstractmethod
+import time
+from typing import Callable, Iterable
+from flask import Flask, Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[str, ...]
+
+
+class _Shards:
+    """Per-thread dictionaries of values, merged on collection."""
+
+    def __init__(self, merge: Callable):
+        self._merge = merge
+        self._local = threading.local()
+        self._shards: list[tuple[threading.Thread, dict]] = []
+        self._retired: dict = {}
+        self._lock = threading.Lock()
+
+    def shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def collect(self) -> dict:
+        merged: dict = {}
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    # nobody writes to a finished thread's shard anymore
+                    for labels, value in shard.items():
+                        self._retired[labels] = self._merge(self._retired.get(labels), value)
+            self._shards = alive
+            for labels, value in self._retired.items():
+                merged[labels] = self._merge(None, value)
+            shards = [shard.copy() for _, shard in alive]
+        for shard in shards:
+            for labels, value in shard.items():
+                merged[labels] = self._merge(merged.get(labels), value)
+        return merged
+
+
+def _add(total, value):
+    return value if total is None else total + value
+
+
+def _add_lists(total, value):
+    return list(value) if total is None else [a + b for a, b in zip(total, value)]
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterable[tuple[str, Labels, float]]:
+        """Yield the name, labels and value of every sample, as exposed."""
+
+
+class Counter(Metric):
+    """Monotonic counter."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._shards = _Shards(_add)
+
+    def inc(self, amount: float = 1, labels: Labels = ()):
+        shard = self._shards.shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._shards.collect().items():
+            yield self.name + "_total", labels, value
+
+
+class Gauge(Metric):
+    """Value going up and down, such as the number of operations in progress."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._shards = _Shards(_add)
+
+    def inc(self, amount: float = 1, labels: Labels = ()):
+        shard = self._shards.shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: Labels = ()):
+        self.inc(-amount, labels)
+
+    @contextlib.contextmanager
+    def track_in_progress(self, labels: Labels = ()):
+        """Count the block as in progress while it runs."""
+        self.inc(1, labels)
+        try:
+            yield
+        finally:
+            self.dec(1, labels)
+
+    def samples(self):
+        for labels, value in self._shards.collect().items():
+            yield self.name, labels, value
+
+
+class Histogram(Metric):
+    """Distribution of observed values (durations, sizes) in cumulative buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(_add_lists)
+
+    def observe(self, value: float, labels: Labels = ()):
+        shard = self._shards.shard()
+        # one slot per bucket, then +Inf, sum and count
+        slots = shard.get(labels)
+        if slots is None:
+            slots = shard[labels] = [0] * (len(self.buckets) + 3)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                slots[index] += 1
+                break
+        else:
+            slots[len(self.buckets)] += 1
+        slots[-2] += value
+        slots[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, labels: Labels = ()):
+        """Observe the duration of the block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def samples(self):
+        for labels, slots in self._shards.collect().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), slots):
+                cumulative += count
+                yield self.name + "_bucket", labels + (_format_value(bound),), cumulative
+            yield self.name + "_sum", labels, slots[-2]
+            yield self.name + "_count", labels, slots[-1]
+
+
+class CallbackMetric(Metric):
+    """Counter or gauge whose values are read from a callback at scrape time."""
+
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Iterable[str],
+                 callback: Callable[[], dict[Labels, float]]):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self):
+        suffix = "_total" if self.kind == "counter" else ""
+        for labels, value in self.callback().items():
+            yield self.name + suffix, labels, value
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together by the `/metrics` endpoint."""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, kind: str, name: str, documentation: str, labelnames: Iterable[str],
+                 callback: Callable[[], dict[Labels, float]]) -> CallbackMetric:
+        with self._lock:
+            # callbacks are replaced, so that a new app instance rebinds them
+            metric = self._metrics[name] = CallbackMetric(kind, name, documentation, labelnames, callback)
+            return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            labelnames = metric.labelnames + (("le",) if metric.kind == "histogram" else ())
+            for name, labels, value in metric.samples():
+                if labels:
+                    pairs = ",".join(f'{key}="{_escape(label)}"' for key, label in zip(labelnames, labels))
+                    name = f"{name}{{{pairs}}}"
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Request latency.", ("blueprint", "endpoint"))
+request_count = registry.counter(
+    "http_requests", "Requests handled.", ("blueprint", "endpoint", "status"))
+db_pool_checkouts = registry.counter(
+    "db_pool_checkouts", "Connections checked out of the pool.")
+db_connection_hold = registry.histogram(
+    "db_connection_hold_seconds", "Time a connection stays checked out of the pool.")
+db_lock_errors = registry.counter(
+    "db_lock_errors", "Statements that failed because the database was locked.")
+db_commit_duration = registry.histogram(
+    "db_commit_duration_seconds", "Duration of session commits, flush included.")
+bcrypt_in_progress = registry.gauge(
+    "bcrypt_in_progress", "bcrypt hashes and checks being computed or waiting for a CPU.")
+bcrypt_duration = registry.histogram(
+    "bcrypt_duration_seconds", "Duration of bcrypt hashes and checks.")
+
+
+def register_cache(name: str, cache) -> None:
+    """
+    Expose the `hits` and `misses` counters of a cache.
+
+    Example:
+        >>> register_cache("fragments", fragment_cache)
+    """
+    registry.callback("counter", f"cache_{name}_hits", f"Hits of the {name} cache.", (),
+                      lambda: {(): cache.hits})
+    registry.callback("counter", f"cache_{name}_misses", f"Misses of the {name} cache.", (),
+                      lambda: {(): cache.misses})
+
+
+class Metrics:
+    """
+    Flask extension recording request, database and bcrypt metrics and serving
+    them at `/metrics`. Must be initialized after the database.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.registry = registry
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("METRICS_ENDPOINT", "/metrics")
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule(app.config["METRICS_ENDPOINT"], "metrics", self.expose)
+        with app.app_context():
+            from app.extensions import db
+            self.instrument_engine(db.engine)
+            event.listen(db.session, "before_commit", self._before_commit)
+            event.listen(db.session, "after_commit", self._after_commit)
+            event.listen(db.session, "after_rollback", self._after_commit)
+        for name, extension in app.extensions.items():
+            if hasattr(extension, "hits") and hasattr(extension, "misses"):
+                register_cache(name, extension)
+        app.extensions["metrics"] = self
+
+    def instrument_engine(self, engine: Engine, pool_gauges: bool = True):
+        """
+        Count the connections and errors of an engine, and with `pool_gauges`, expose
+        the state of its pool (only one engine's, the central database's, is exposed).
+        """
+        pool = engine.pool
+        event.listen(pool, "checkout", self._checkout)
+        event.listen(pool, "checkin", self._checkin)
+        event.listen(engine, "handle_error", self._handle_error)
+        if pool_gauges and hasattr(pool, "checkedout"):
+            registry.callback("gauge", "db_pool_checked_out", "Connections currently checked out.", (),
+                              lambda: {(): pool.checkedout()})
+            registry.callback("gauge", "db_pool_size", "Configured size of the pool.", (),
+                              lambda: {(): pool.size()})
+            registry.callback("gauge", "db_pool_overflow", "Connections opened beyond the pool size.", (),
+                              lambda: {(): max(pool.overflow(), 0)})
+
+    def expose(self):
+        return Response(self.registry.render(), content_type=CONTENT_TYPE)
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        db_pool_checkouts.inc()
+        connection_record.info["checkout_time"] = time.perf_counter()
+
+    def _checkin(self, dbapi_connection, connection_record):
+        start = connection_record.info.pop("checkout_time", None)
+        if start is not None:
+            db_connection_hold.observe(time.perf_counter() - start)
+
+    def _handle_error(self, context):
+        if "database is locked" in str(context.original_exception):
+            db_lock_errors.inc()
+
+    def _before_commit(self, session):
+        session.info["commit_start"] = time.perf_counter()
+
+    def _after_commit(self, session):
+        start = session.info.pop("commit_start", None)
+        if start is not None:
+            db_commit_duration.observe(time.perf_counter() - start)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+
+    def _after_request(self, response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            labels = (request.blueprint or "", request.endpoint or "<unmatched>")
+            request_duration.observe(time.perf_counter() - start, labels)
+            request_count.inc(1, labels + (str(response.status_code),))
+        return response
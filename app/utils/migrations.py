@@ -0,0 +1,169 @@
+"""
+Schema migrations.
+
+`db.create_all()` only creates missing tables. Changes to existing tables are
+applied here, in order, and the number of applied migrations is stored in the
+database's `PRAGMA user_version`. A database created from scratch by
+`create_all()` already has the latest schema, so it is stamped as up to date.
+
+To change the schema, update the models and append a function to `MIGRATIONS`
+bringing an existing database to the same schema.
+
+The shard files (see `app.utils.shards`) hold the tables of `SHARDED_TABLES`
+only, and are migrated with `migrate(engine, shard=True)` when they are opened:
+the migrations from `FIRST_SHARD_VERSION` on run on them too, and must skip the
+tables a shard doesn't have (`inspect(connection).has_table`). Tables added to
+the shards are created when a shard is opened; their rows are moved by the
+commands rebuilding them (`flask rebuild-stats`, `flask rebuild-search`).
+
+Checking and creating the schema costs a reflection round trip per table, so
+it is skipped at startup when the database is stamped with the fingerprint of
+the current schema (see `is_schema_current`).
+"""
+import hashlib
+import logging
+from typing import Callable, Iterable
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError
+
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_assets(connection: Connection) -> None:
+    # nodes used to store the paths of their pictures, deduplicate them into the assets table
+    connection.exec_driver_sql(
+        "CREATE TABLE assets (id INTEGER NOT NULL, path VARCHAR NOT NULL, PRIMARY KEY (id), UNIQUE (path))"
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO assets (path) "
+        "SELECT left_img FROM story_nodes WHERE left_img != '' "
+        "UNION SELECT right_img FROM story_nodes WHERE right_img != '' "
+        "UNION SELECT background_img FROM story_nodes WHERE background_img != ''"
+    )
+    for column in ("left_img", "right_img", "background_img"):
+        connection.exec_driver_sql(f"ALTER TABLE story_nodes ADD COLUMN {column}_id INTEGER REFERENCES assets (id)")
+        connection.exec_driver_sql(
+            f"UPDATE story_nodes SET {column}_id = (SELECT id FROM assets WHERE path = story_nodes.{column})"
+        )
+        connection.exec_driver_sql(f"ALTER TABLE story_nodes DROP COLUMN {column}")
+        connection.exec_driver_sql(f"CREATE INDEX ix_story_nodes_{column}_id ON story_nodes ({column}_id)")
+
+
+def _add_reader_story_version(connection: Connection) -> None:
+    connection.exec_driver_sql("ALTER TABLE user_stories ADD COLUMN story_version INTEGER")
+
+
+def _add_node_positions(connection: Connection) -> None:
+    connection.exec_driver_sql("ALTER TABLE story_nodes ADD COLUMN x FLOAT")
+    connection.exec_driver_sql("ALTER TABLE story_nodes ADD COLUMN y FLOAT")
+
+
+def _index_editor_graph(connection: Connection) -> None:
+    connection.exec_driver_sql("CREATE INDEX ix_story_edges_to_node_id ON story_edges (to_node_id)")
+    connection.exec_driver_sql("CREATE INDEX ix_story_nodes_unplaced ON story_nodes (story_id) WHERE x IS NULL")
+
+
+def _add_story_shard(connection: Connection) -> None:
+    connection.exec_driver_sql("ALTER TABLE stories ADD COLUMN shard INTEGER")
+
+
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _normalize_assets,
+    _add_reader_story_version,
+    _add_node_positions,
+    _index_editor_graph,
+    _add_story_shard,
+]
+# the schema version the first shard files were created with, before they were stamped
+FIRST_SHARD_VERSION = 5
+
+
+def schema_version(connection: Connection) -> int:
+    """Return the number of migrations applied to the database."""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine: Engine, shard: bool = False) -> int:
+    """
+    Apply the pending migrations, each in its own transaction.
+
+    Args:
+        engine (Engine): The engine of the database to migrate.
+        shard (bool): Whether the database is a shard file.
+
+    Returns:
+        int: The schema version of the database.
+
+    Example:
+        >>> migrate(db.engine)
+        1
+    """
+    latest = len(MIGRATIONS)
+    with engine.begin() as connection:
+        version = schema_version(connection)
+        if version == 0 and not inspect(connection).has_table("story_nodes"):
+            # new database, create_all() builds the latest schema
+            connection.exec_driver_sql(f"PRAGMA user_version = {latest}")
+            return latest
+        if shard and version == 0:
+            version = FIRST_SHARD_VERSION
+            connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+    for index in range(version, latest):
+        migration = MIGRATIONS[index]
+        logger.info("Applying migration %d (%s)", index + 1, migration.__name__)
+        with engine.begin() as connection:
+            migration(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {index + 1}")
+    return max(version, latest)
+
+
+def schema_fingerprint(metadata: MetaData, extra: Iterable[str] = ()) -> str:
+    """
+    Hash the tables, columns and indexes of the models, the number of migrations
+    and any extra DDL (such as virtual tables created outside of the models).
+
+    Example:
+        >>> schema_fingerprint(db.metadata, SEARCH_TABLES)
+        'c1f3...'
+    """
+    digest = hashlib.sha1(str(len(MIGRATIONS)).encode())
+    for table in sorted(metadata.tables.values(), key=lambda table: table.name):
+        digest.update(f"table {table.name}\n".encode())
+        for column in table.columns:
+            digest.update(f"{column.name} {column.type!r} {column.nullable}\n".encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            digest.update(f"index {index.name} {[column.name for column in index.columns]}\n".encode())
+    for statement in extra:
+        digest.update(statement.encode())
+    return digest.hexdigest()
+
+
+def is_schema_current(engine: Engine, fingerprint: str) -> bool:
+    """
+    Check, with a single query, whether the database was stamped with the given schema fingerprint.
+
+    Example:
+        >>> if not is_schema_current(db.engine, fingerprint):
+        ...     migrate(db.engine)
+    """
+    with engine.connect() as connection:
+        try:
+            stored = connection.exec_driver_sql("SELECT fingerprint FROM schema_info").scalar()
+        except OperationalError:  # never stamped
+            return False
+    return stored == fingerprint
+
+
+def stamp_schema(engine: Engine, fingerprint: str) -> None:
+    """
+    Record that the database has the schema of the given fingerprint.
+
+    Example:
+        >>> stamp_schema(db.engine, fingerprint)
+    """
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_info (fingerprint VARCHAR NOT NULL)")
+        connection.exec_driver_sql("DELETE FROM schema_info")
+        connection.exec_driver_sql("INSERT INTO schema_info (fingerprint) VALUES (?)", (fingerprint,))
@@ -0,0 +1,212 @@
+"""
+Production server: a prefork master with threaded workers.
+
+The application is created once in the master, then `processes` workers are
+forked. They share the listening socket and each serves requests from a pool of
+`threads` threads. Every worker disposes of the SQLAlchemy connection pool it
+inherited, so no SQLite connection is ever shared across processes.
+
+Signals handled by the master:
+    SIGTERM, SIGINT: graceful shutdown, in-flight requests are drained.
+    SIGHUP: graceful restart, a new set of workers is started then the old ones are drained.
+    SIGTTIN / SIGTTOU: one more / one less worker.
+Workers that die are replaced.
+
+    flask --app run serve --processes 4 --threads 8 --port 8000
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+logger = logging.getLogger(__name__)
+
+# seconds a connection may stay silent, idle between keep-alive requests included
+KEEPALIVE_TIMEOUT = 5.0
+# connections accepted per thread, the one being served and the ones waiting for it
+CONNECTIONS_PER_THREAD = 2
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # keep-alive connections, without changing werkzeug's own handler class
+    protocol_version = "HTTP/1.1"
+    # an idle client gives its thread back instead of holding it until it disconnects
+    timeout = KEEPALIVE_TIMEOUT
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server handling connections on a bounded pool of threads.
+
+    At most `CONNECTIONS_PER_THREAD` connections per thread are accepted at a time:
+    past that, the worker stops accepting and the connections wait in the listen
+    backlog, where the other workers can take them.
+    """
+    multithread = True
+
+    def __init__(self, host: str, port: int, app: Flask, threads: int, fd: int):
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="worker")
+        self.slots = threading.BoundedSemaphore(threads * CONNECTIONS_PER_THREAD)
+
+    def process_request(self, request, client_address):
+        # freed within KEEPALIVE_TIMEOUT by idle connections at the latest
+        self.slots.acquire()
+        self.executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def drain(self):
+        """
+        Stop accepting connections and wait for the in-flight requests,
+        and for the idle keep-alive connections to time out.
+        """
+        self.shutdown()
+        self.executor.shutdown(wait=True)
+
+
+class PreforkServer:
+    """
+    Master process forking and supervising the workers.
+
+    Args:
+        app (Flask): The preloaded application.
+        host (str): The interface to bind.
+        port (int): The port to bind.
+        processes (int): The number of worker processes.
+        threads (int): The number of request threads per worker.
+        graceful_timeout (float): Seconds given to a worker to drain before it is killed.
+    """
+
+    def __init__(self, app: Flask, host: str, port: int, processes: int, threads: int,
+                 graceful_timeout: float = 30.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.workers: dict[int, float] = {}
+        self.stopping: dict[int, float] = {}
+        self._signals: list[int] = []
+        self._running = True
+
+    def run(self):
+        self.socket = socket.create_server((self.host, self.port), reuse_port=False, backlog=2048)
+        self.socket.set_inheritable(True)
+        logger.info("Listening on http://%s:%d with %d processes x %d threads",
+                    self.host, self.port, self.processes, self.threads)
+        with self.app.app_context():
+            from app.extensions import db, shards
+            # don't let the workers inherit open connections
+            db.engine.dispose()
+            shards.dispose()
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, self._queue_signal)
+        self.spawn_workers()
+        while self._running or self.workers or self.stopping:
+            self.handle_signals()
+            self.reap_workers()
+            self.kill_stragglers()
+            if self._running:
+                self.spawn_workers()
+            time.sleep(0.2)
+        self.socket.close()
+        logger.info("Shutdown complete")
+
+    def _queue_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def handle_signals(self):
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                logger.info("Graceful shutdown")
+                self._running = False
+                self.stop_workers(list(self.workers))
+            elif signum == signal.SIGHUP:
+                logger.info("Graceful restart")
+                old = list(self.workers)
+                self.workers.clear()
+                self.spawn_workers()
+                self.stop_workers(old)
+            elif signum == signal.SIGTTIN:
+                self.processes += 1
+            elif signum == signal.SIGTTOU and self.processes > 1:
+                self.processes -= 1
+                self.stop_workers(list(self.workers)[:len(self.workers) - self.processes])
+
+    def spawn_workers(self):
+        while len(self.workers) < self.processes:
+            pid = os.fork()
+            if pid == 0:
+                self._worker_main()
+            self.workers[pid] = time.monotonic()
+
+    def stop_workers(self, pids: list[int]):
+        for pid in pids:
+            self.workers.pop(pid, None)
+            self.stopping[pid] = time.monotonic()
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.workers.pop(pid, None) is not None:
+                logger.warning("Worker %d exited unexpectedly (status %d)", pid, status)
+            self.stopping.pop(pid, None)
+
+    def kill_stragglers(self):
+        now = time.monotonic()
+        for pid, since in list(self.stopping.items()):
+            if now - since > self.graceful_timeout:
+                logger.warning("Worker %d did not drain in time, killing it", pid)
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _worker_main(self):
+        status = 0
+        try:
+            for signum in (signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(signum, signal.SIG_IGN)
+            with self.app.app_context():
+                from app.extensions import db, maintenance, shards
+                # the pool was copied by fork: forget its connections without closing them
+                db.engine.dispose(close=False)
+                shards.dispose(close=False)
+            maintenance.start()
+            server = PooledWSGIServer(self.host, self.port, self.app, self.threads, self.socket.fileno())
+            # shutdown() blocks until serve_forever() returns, so it can't run in the signal handler
+            signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.drain).start())
+            server.serve_forever()
+            server.executor.shutdown(wait=True)
+            maintenance.stop(self.graceful_timeout)
+        except Exception:
+            logger.exception("Worker %d crashed", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
@@ -0,0 +1,304 @@
+"""
+Per-story database shards.
+
+SQLite lets one writer at a time into a database file. In sharding mode, the
+content of the stories (`story_nodes`, `story_edges`, and their search and
+spatial indexes), the progress of their readers (`user_stories`) and their
+reading events and statistics live in one of `SHARD_BUCKETS` shard files, so
+that writes to stories of different shards don't wait for each other: editing
+a node or advancing a reader writes to the shard of the story only. Users, the
+story catalog and its search index, assets and published versions stay in the
+central database.
+
+A story is placed in a shard when it is created, and keeps it (`Story.shard`,
+None for the stories of the central database). Node IDs carry their shard in
+their high bits (`node_id >> NODE_ID_BITS`), so a node is found from its ID
+alone and IDs stay unique across the shards.
+
+The services choose the shard with the `routed` decorator (or `use_shard`), and
+the session sends the statements on sharded tables to the engine of that shard.
+Outside of a shard, or with sharding off, everything goes to the central
+database. Engines are opened on first use and the `SHARD_POOL_SIZE` most
+recently used are kept open.
+
+Shard engines are configured, instrumented and migrated like the central one
+when they are opened. The async reader (`app.asgi`) reads the central database
+only, and leaves the requests for sharded stories to the Flask application.
+
+Configuration:
+    SHARDING (bool): Whether new stories are placed in shards. Defaults to False.
+    SHARD_BUCKETS (int): The number of shard files, stories are spread over them by ID. Defaults to 64.
+    SHARD_DIR (str): The folder of the shard files. Defaults to shards in the instance folder.
+    SHARD_POOL_SIZE (int): The number of shard engines kept open. Defaults to 16.
+"""
+import contextlib
+import functools
+import inspect
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+from flask import Flask, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import MetaData, Table, TextClause, UpdateBase, create_engine, event, inspect as inspect_mapper, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql.util import find_tables
+
+from app.utils.migrations import migrate
+from app.utils.sqlite import configure_sqlite
+
+
+SHARDED_TABLES = frozenset({
+    "story_nodes", "story_edges", "user_stories", "story_nodes_rtree", "story_nodes_search",
+    "reading_events", "node_stats", "story_stats",
+})
+# node IDs below 2**NODE_ID_BITS are central, the bits above are the shard,
+# leaving room for 8191 shards within the integers JavaScript represents exactly
+NODE_ID_BITS = 40
+MAX_BUCKETS = 2 ** (53 - NODE_ID_BITS) - 1
+
+_SHARDED_NAME = re.compile(rf"\b(?:{'|'.join(sorted(SHARDED_TABLES))})\b")
+_FILE_NAME = re.compile(r"^shard-(\d+)\.db$")
+
+_current: ContextVar[int | None] = ContextVar("shard", default=None)
+
+
+def current_shard() -> int | None:
+    """Return the shard the statements on sharded tables go to, None for the central database."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def use_shard(bucket: int | None):
+    """
+    Send the statements on sharded tables to a shard within the block.
+
+    Example:
+        >>> with use_shard(3):
+        ...     nodes = StoryNode.query.filter(StoryNode.story_id == 7).all()
+    """
+    token = _current.set(bucket)
+    try:
+        yield bucket
+    finally:
+        _current.reset(token)
+
+
+def node_shard(node_id: int) -> int | None:
+    """Return the shard of a node, from its ID."""
+    return (node_id >> NODE_ID_BITS) or None
+
+
+def routed(argument: str, shard_of: Callable[[Any], int | None]) -> Callable:
+    """
+    Run the decorated service in the shard of one of its arguments.
+
+    Put it above `@transactional`, so that the changes are flushed while the shard is in use.
+
+    Args:
+        argument (str): The name of the argument locating the data, e.g. "story_id".
+        shard_of (Callable[[Any], int | None]): Returns the shard from the value of the argument.
+
+    Example:
+        >>> @routed("node_id", node_shard)
+        ... @transactional
+        ... def rename_speaker(node_id: int, speaker: str):
+        ...     db.session.get(StoryNode, node_id).speaker = speaker
+    """
+    def decorator(function: Callable) -> Callable:
+        position = list(inspect.signature(function).parameters).index(argument)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            value = args[position] if position < len(args) else kwargs[argument]
+            with use_shard(shard_of(value)):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _is_sharded(mapper, clause) -> bool:
+    if mapper is not None:
+        return inspect_mapper(mapper).local_table.name in SHARDED_TABLES
+    if clause is None:
+        return False
+    if isinstance(clause, Table):
+        return clause.name in SHARDED_TABLES
+    if isinstance(clause, UpdateBase) and isinstance(clause.table, Table):
+        return clause.table.name in SHARDED_TABLES
+    if isinstance(clause, TextClause):
+        return _SHARDED_NAME.search(clause.text) is not None
+    return any(table.name in SHARDED_TABLES for table in find_tables(clause, include_crud=True)
+               if isinstance(table, Table))
+
+
+class RoutingSession(Session):
+    """
+    Session sending the statements on sharded tables to the engine of the current shard.
+
+    It remembers the shard each sharded object was loaded from or saved to, so
+    that expired attributes (e.g. after a commit) and lazy relationships are
+    loaded from there, whatever the current shard.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, shard=None, **kwargs):
+        bucket = _current.get() if shard is None else shard
+        if bucket is not None and bind is None and _is_sharded(mapper, clause):
+            return current_app.extensions["shards"].engine(bucket)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _remember_shard(session: Session, instance) -> None:
+    bucket = _current.get()
+    if bucket is not None:
+        session.info.setdefault("shards", {})[inspect_mapper(instance).key] = bucket
+
+
+def _route_reload(state) -> None:
+    if not state.is_select:
+        return
+    loaded = state.load_options._refresh_state or state.load_options._lazy_loaded_from
+    if loaded is not None and loaded.key is not None:
+        bucket = state.session.info.get("shards", {}).get(loaded.key)
+        if bucket is not None:
+            state.bind_arguments["shard"] = bucket
+
+
+event.listen(RoutingSession, "loaded_as_persistent", _remember_shard)
+event.listen(RoutingSession, "pending_to_persistent", _remember_shard)
+event.listen(RoutingSession, "do_orm_execute", _route_reload)
+
+
+class ShardRouter:
+    """
+    Flask extension opening the shard databases and keeping the most recently used ones open.
+    Must be initialized after the database.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.app: Flask | None = None
+        self.enabled = False
+        self.in_use = False
+        self.buckets = 0
+        self.directory = ""
+        self.pool_size = 0
+        self._engines: OrderedDict[int, Engine] = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("SHARDING", False)
+        app.config.setdefault("SHARD_BUCKETS", 64)
+        app.config.setdefault("SHARD_DIR", os.path.join(app.instance_path, "shards"))
+        app.config.setdefault("SHARD_POOL_SIZE", 16)
+        if not 0 < app.config["SHARD_BUCKETS"] <= MAX_BUCKETS:
+            raise ValueError(f"SHARD_BUCKETS must be between 1 and {MAX_BUCKETS}")
+        self.app = app
+        self.enabled = app.config["SHARDING"]
+        self.buckets = app.config["SHARD_BUCKETS"]
+        self.directory = app.config["SHARD_DIR"]
+        self.pool_size = app.config["SHARD_POOL_SIZE"]
+        # stories may be left in shards by a previous run with sharding on
+        self.in_use = self.enabled or bool(self.existing())
+        app.extensions["shards"] = self
+
+    def shard_for_new_story(self, story_id: int) -> int | None:
+        """Return the shard of a story being created, None when sharding is off."""
+        if not self.enabled:
+            return None
+        return story_id % self.buckets + 1
+
+    def path(self, bucket: int) -> str:
+        return os.path.join(self.directory, f"shard-{bucket:04d}.db")
+
+    def existing(self) -> list[int]:
+        """Return the shards that have a database file, whether sharding is on or not."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(match.group(1)) for match in map(_FILE_NAME.match, os.listdir(self.directory)) if match)
+
+    def each(self) -> Iterator[int | None]:
+        """
+        Visit the central database then every shard, each in use while the loop body runs.
+
+        Example:
+            >>> story_ids = [story_id for _ in shards.each()
+            ...              for story_id in db.session.scalars(select(UserStory.story_id))]
+        """
+        for bucket in [None, *self.existing()]:
+            with use_shard(bucket):
+                yield bucket
+
+    def engine(self, bucket: int) -> Engine:
+        """
+        Return the engine of a shard, creating its database on first use.
+
+        Side Effects:
+            Disposes of the least recently used engine when more than `SHARD_POOL_SIZE` are open.
+            Connections checked out of it stay usable and are closed when returned.
+        """
+        with self._lock:
+            engine = self._engines.get(bucket)
+            if engine is not None:
+                self._engines.move_to_end(bucket)
+                return engine
+        engine = self._open(bucket)
+        with self._lock:
+            engine = self._engines.setdefault(bucket, engine)
+            self._engines.move_to_end(bucket)
+            while len(self._engines) > self.pool_size:
+                _, evicted = self._engines.popitem(last=False)
+                evicted.dispose()
+        return engine
+
+    def dispose(self, close: bool = True) -> None:
+        """Drop every shard engine, closing their connections unless they were inherited by a fork."""
+        with self._lock:
+            engines, self._engines = list(self._engines.values()), OrderedDict()
+        for engine in engines:
+            engine.dispose(close=close)
+
+    def _open(self, bucket: int) -> Engine:
+        os.makedirs(self.directory, exist_ok=True)
+        engine = create_engine(f"sqlite:///{self.path(bucket)}")
+        configure_sqlite(self.app, engine)
+        if "instrumentation" in self.app.extensions:
+            self.app.extensions["instrumentation"].instrument_engine(engine)
+        if "metrics" in self.app.extensions:
+            self.app.extensions["metrics"].instrument_engine(engine, pool_gauges=False)
+        # a new file is stamped with the latest schema, which the statements below create
+        migrate(engine, shard=True)
+        with engine.begin() as connection:
+            for statement in _shard_schema():
+                connection.execute(statement)
+            # the nodes of the shard get IDs above its first one
+            connection.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'story_nodes', :first "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'story_nodes')"
+            ), {"first": bucket << NODE_ID_BITS})
+        return engine
+
+
+@functools.cache
+def _shard_schema() -> list:
+    from app.extensions import db
+    from app.services.graph_service import SPATIAL_TABLES
+    from app.services.search_service import NODE_SEARCH_TABLES
+    metadata = MetaData()
+    tables = [table.to_metadata(metadata) for name, table in db.metadata.tables.items() if name in SHARDED_TABLES]
+    statements = []
+    for table in tables:
+        if "id" in table.c and table.c.id.primary_key:
+            table.dialect_options["sqlite"]["autoincrement"] = True  # keeps the sequence when the last node goes
+        # foreign keys to the central database can't be declared
+        local = [key for key in table.foreign_key_constraints
+                 if key.elements[0].target_fullname.split(".")[0] in metadata.tables]
+        statements.append(CreateTable(table, include_foreign_key_constraints=local, if_not_exists=True))
+        statements.extend(CreateIndex(index, if_not_exists=True) for index in table.indexes)
+    statements.extend(text(statement) for statement in [*SPATIAL_TABLES, *NODE_SEARCH_TABLES])
+    return statements
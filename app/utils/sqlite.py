@@ -0,0 +1,55 @@
+"""
+SQLite connection settings.
+
+Every new DB-API connection runs the PRAGMAs of `SQLITE_PRAGMAS`. The defaults put
+the database in WAL mode, so readers in other processes aren't blocked by a
+writer, and make a locked database wait instead of failing immediately. New
+databases are created in incremental auto-vacuum mode, so the maintenance jobs
+can give their free pages back a few at a time.
+
+The sqlite3 module's own transaction handling is disabled: it only emits BEGIN
+before data changes, which breaks SAVEPOINTs. SQLAlchemy emits BEGIN itself
+when a transaction starts, or the BEGIN given by the `sqlite_begin` execution
+option of the connection (e.g. "IMMEDIATE", see `transaction(immediate=True)`).
+"""
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    # only takes effect on a new database, or after a VACUUM
+    "auto_vacuum": "INCREMENTAL",
+}
+
+
+def configure_sqlite(app: Flask, engine: Engine) -> None:
+    """
+    Apply the configured PRAGMAs to every connection of a SQLite engine.
+
+    Args:
+        app (Flask): The application, whose `SQLITE_PRAGMAS` extend the defaults.
+        engine (Engine): The engine to configure. Non-SQLite engines are left untouched.
+
+    Example:
+        >>> configure_sqlite(app, db.engine)
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = {**DEFAULT_PRAGMAS, **app.config.get("SQLITE_PRAGMAS", {})}
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _begin(connection):
+        mode = connection.get_execution_options().get("sqlite_begin")
+        connection.exec_driver_sql(f"BEGIN {mode}" if mode else "BEGIN")
@@ -0,0 +1,106 @@
+"""
+Startup timings.
+
+`create_app` records the duration of each of its phases in a `StartupTimer`,
+kept in `app.extensions["startup"]`. The `startup-report` command boots the
+application in a fresh interpreter with `-X importtime` and prints the slowest
+imports next to the factory phases:
+
+    flask --app run startup-report --top 15
+"""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+class StartupTimer:
+    """Durations of the named phases of the application factory, in seconds."""
+
+    def __init__(self):
+        self.phases: list[tuple[str, float]] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    @property
+    def total(self) -> float:
+        return sum(duration for _, duration in self.phases)
+
+
+_BOOT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter() - start
+app = create_app()
+print(json.dumps({"import": imported, "phases": app.extensions["startup"].phases}))
+"""
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, int]]:
+    """
+    Parse the `-X importtime` report of an interpreter.
+
+    Returns:
+        list[tuple[str, int, int]]: The module name, self and cumulative times in microseconds, per import.
+
+    Example:
+        >>> parse_importtime("import time:       691 |      77315 |       app.models")
+        [('app.models', 691, 77315)]
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        imports.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return imports
+
+
+def measure_startup(root: str) -> dict:
+    """
+    Boot the application in a fresh interpreter and measure it.
+
+    Args:
+        root (str): The folder containing the `app` package.
+
+    Returns:
+        dict: The import time of the app package ("import"), the factory phases
+              ("phases") and every import with its own and cumulative times ("imports").
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _BOOT_SCRIPT],
+        cwd=root, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["imports"] = parse_importtime(result.stderr)
+    return report
+
+
+@click.command("startup-report")
+@click.option("--top", default=20, show_default=True, help="Number of imports listed.")
+@with_appcontext
+def startup_report_command(top: int):
+    """Print the slowest imports and the duration of each phase of the application factory."""
+    report = measure_startup(os.path.dirname(current_app.root_path))
+    click.echo(f"{'self ms':>9} {'total ms':>9}  module")
+    for name, own, cumulative in sorted(report["imports"], key=lambda item: item[1], reverse=True)[:top]:
+        click.echo(f"{own / 1000:9.1f} {cumulative / 1000:9.1f}  {name}")
+    click.echo()
+    click.echo(f"{report['import'] * 1000:9.1f} ms  import app")
+    for name, duration in report["phases"]:
+        click.echo(f"{duration * 1000:9.1f} ms  create_app: {name}")
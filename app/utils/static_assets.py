@@ -0,0 +1,190 @@
+"""
+Fingerprinted and precompressed static assets.
+
+`flask assets build` walks the static folder, writes a manifest mapping every
+file to a content-hashed name (`css/base/base.css` -> `css/base/base.3f2a9c0d1e4b.css`)
+and stores gzip/brotli variants of the text assets next to the manifest.
+
+Once a manifest exists, `url_for("static", filename=...)` transparently resolves to
+the fingerprinted name and the static endpoint serves those names with a far-future,
+immutable `Cache-Control`, so repeat visits never revalidate them.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import click
+from flask import Flask, current_app, request, send_file, send_from_directory
+from flask.cli import AppGroup, with_appcontext
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always produced
+    brotli = None
+
+
+MANIFEST_NAME = "manifest.json"
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".html", ".json", ".txt"}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# (Accept-Encoding token, file suffix) by order of preference
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def fingerprint(path: str) -> str:
+    """
+    Compute the content hash used in fingerprinted file names.
+
+    Args:
+        path (str): Path of the file to hash.
+
+    Returns:
+        str: The first 12 hexadecimal digits of the file's SHA-256.
+
+    Example:
+        >>> with tempfile.NamedTemporaryFile() as file:  # empty: the SHA-256 of no bytes is e3b0c442...b855
+        ...     fingerprint(file.name)
+        'e3b0c44298fc'
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def fingerprinted_name(filename: str, digest: str) -> str:
+    """
+    Insert a content hash before the extension of a static file name.
+
+    Example:
+        >>> fingerprinted_name("css/base/base.css", "3f2a9c0d1e4b")
+        'css/base/base.3f2a9c0d1e4b.css'
+    """
+    root, ext = os.path.splitext(filename)
+    return f"{root}.{digest}{ext}"
+
+
+def build_assets(static_folder: str, build_folder: str) -> dict[str, str]:
+    """
+    Build the fingerprint manifest and the precompressed variants of text assets.
+
+    Args:
+        static_folder (str): The folder holding the source assets.
+        build_folder (str): The folder receiving the manifest and compressed files.
+
+    Returns:
+        dict[str, str]: The manifest, mapping each source file name to its fingerprinted name.
+
+    Side Effects:
+        Writes `manifest.json` and, for every compressible asset, `<name>.gz`
+        (and `<name>.br` when brotli is installed) into the build folder.
+
+    Example:
+        >>> manifest = build_assets("app/static", "instance/static-build")
+    """
+    manifest: dict[str, str] = {}
+    for root, _, files in os.walk(static_folder):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            hashed = fingerprinted_name(filename, fingerprint(path))
+            manifest[filename] = hashed
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            with open(path, "rb") as file:
+                data = file.read()
+            target = os.path.join(build_folder, *hashed.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # mtime=0 keeps the gzip output reproducible from one build to another
+            with open(target + ".gz", "wb") as file:
+                file.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target + ".br", "wb") as file:
+                    file.write(brotli.compress(data, quality=11))
+    os.makedirs(build_folder, exist_ok=True)
+    with open(os.path.join(build_folder, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+class StaticAssets:
+    """
+    Flask extension serving the assets produced by `build_assets`.
+
+    Without a manifest (e.g. in development) it does nothing and Flask's default
+    static handling applies.
+    """
+
+    def __init__(self, app: Flask | None = None):
+        self.manifest: dict[str, str] = {}
+        self.sources: dict[str, str] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.config.setdefault("STATIC_BUILD_FOLDER", os.path.join(app.instance_path, "static-build"))
+        self.load_manifest(app.config["STATIC_BUILD_FOLDER"])
+        app.url_defaults(self._inject_fingerprint)
+        app.view_functions["static"] = self.send_static
+        app.cli.add_command(assets_cli)
+        app.extensions["static_assets"] = self
+
+    def load_manifest(self, build_folder: str):
+        """Load (or reload) the manifest written by `build_assets`, if any."""
+        path = os.path.join(build_folder, MANIFEST_NAME)
+        if not os.path.exists(path):
+            self.manifest, self.sources = {}, {}
+            return
+        with open(path) as file:
+            self.manifest = json.load(file)
+        self.sources = {hashed: filename for filename, hashed in self.manifest.items()}
+
+    def _inject_fingerprint(self, endpoint: str, values: dict):
+        if endpoint == "static" and values.get("filename") in self.manifest:
+            values["filename"] = self.manifest[values["filename"]]
+
+    def send_static(self, filename: str):
+        """
+        View function replacing Flask's `static` endpoint.
+
+        Fingerprinted names are served with an immutable `Cache-Control`, from the
+        best precompressed variant accepted by the client when one exists. Any other
+        name (e.g. picture paths built by the JavaScript) falls back to Flask's handler.
+        """
+        source = self.sources.get(filename)
+        if source is None:
+            return current_app.send_static_file(filename)
+        build_folder = current_app.config["STATIC_BUILD_FOLDER"]
+        for encoding, suffix in ENCODINGS:
+            path = os.path.join(build_folder, *filename.split("/")) + suffix
+            if encoding in request.accept_encodings and os.path.exists(path):
+                mimetype = mimetypes.guess_type(source)[0] or "application/octet-stream"
+                response = send_file(
+                    path,
+                    mimetype=mimetype,
+                    download_name=os.path.basename(source),
+                    max_age=IMMUTABLE_MAX_AGE
+                )
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_from_directory(current_app.static_folder, source, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+assets_cli = AppGroup("assets", help="Static assets pipeline.")
+
+
+@assets_cli.command("build")
+@with_appcontext
+def build_command():
+    """Fingerprint and precompress the static assets."""
+    build_folder = current_app.config["STATIC_BUILD_FOLDER"]
+    manifest = build_assets(current_app.static_folder, build_folder)
+    current_app.extensions["static_assets"].load_manifest(build_folder)
+    click.echo(f"Built {len(manifest)} assets into {build_folder}")
@@ -0,0 +1,134 @@
+"""
+Unit of work for the service layer.
+
+Services don't commit: they run inside `transaction()` (or are decorated with
+`@transactional`) and only `flush()` when they need generated ids. Transaction
+scopes nest, and only the outermost one commits, so a route or resource can
+compose several service calls into a single atomic transaction with a single
+commit:
+
+    with transaction():
+        story = create_new_empty_story()
+        create_story_node(story.id, {...})
+
+An inner scope opened with `savepoint=True` runs in a SAVEPOINT: if it raises,
+only its own changes are rolled back and the enclosing transaction can go on.
+
+An outermost scope opened with `immediate=True` takes the write lock of the
+database of the current shard (see `app.utils.shards`), the central one outside
+of a shard, as it starts (BEGIN IMMEDIATE). SQLite refuses the first write of a
+transaction that read a snapshot another writer has since changed: a
+transaction that reads then writes the same rows under contention (allocating
+the next number of a sequence, editing a node...) waits for the lock up front instead.
+
+Work that must only happen once the data is committed (cache invalidation...)
+is registered with `on_commit()`.
+"""
+import contextlib
+import functools
+from typing import Callable
+from app.extensions import db, shards
+from app.utils.shards import current_shard
+
+
+_DEPTH = "transaction_depth"
+_ON_COMMIT = "transaction_on_commit"
+
+
+def in_transaction() -> bool:
+    """Return whether a transaction scope is open in the current session."""
+    return db.session.info.get(_DEPTH, 0) > 0
+
+
+@contextlib.contextmanager
+def transaction(savepoint: bool = False, immediate: bool = False):
+    """
+    Open a transaction scope.
+
+    The outermost scope commits when the block ends and rolls back if it raises.
+    Inner scopes flush; with `savepoint=True` they are wrapped in a SAVEPOINT
+    that is rolled back on error.
+
+    Args:
+        savepoint (bool): Whether a nested scope gets its own SAVEPOINT.
+        immediate (bool): Whether the outermost scope takes the write lock of the database
+                          of the current shard (the central one outside of a shard) as it
+                          starts. Ignored by nested scopes, and when the session already
+                          holds a connection.
+
+    Yields:
+        Session: The current session.
+
+    Example:
+        >>> with transaction():
+        ...     update_story(1, {"title": "New Title"})
+        ...     create_story_node(1, {"content": "Hello World"})
+    """
+    session = db.session
+    depth = session.info.get(_DEPTH, 0)
+    session.info[_DEPTH] = depth + 1
+    try:
+        if depth == 0:
+            try:
+                if immediate and not session().in_transaction():
+                    bucket = current_shard()
+                    bind = {"bind": shards.engine(bucket)} if bucket is not None else None
+                    session.connection(bind_arguments=bind, execution_options={"sqlite_begin": "IMMEDIATE"})
+                yield session
+                session.commit()
+            except BaseException:
+                session.rollback()
+                session.info.pop(_ON_COMMIT, None)
+                raise
+            for callback in session.info.pop(_ON_COMMIT, []):
+                callback()
+        elif savepoint:
+            callbacks = session.info.setdefault(_ON_COMMIT, [])
+            registered = len(callbacks)
+            try:
+                with session.begin_nested():
+                    yield session
+            except BaseException:
+                # the work of the savepoint is undone, and so are its callbacks
+                del callbacks[registered:]
+                raise
+        else:
+            yield session
+            session.flush()
+    finally:
+        session.info[_DEPTH] = depth
+
+
+def transactional(function: Callable | None = None, *, immediate: bool = False) -> Callable:
+    """
+    Run the decorated function in a transaction scope, opened with `immediate` (see `transaction`).
+
+    Example:
+        >>> @transactional
+        ... def rename_story(story_id: int, title: str):
+        ...     get_story_by_id(story_id).title = title
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with transaction(immediate=immediate):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator(function) if function is not None else decorator
+
+
+def on_commit(callback: Callable[[], None]) -> None:
+    """
+    Call `callback` once the current transaction is committed.
+
+    Callbacks are dropped if the transaction is rolled back, or if the savepoint
+    they were registered in is. Outside of a transaction scope the callback is
+    called immediately.
+
+    Example:
+        >>> on_commit(bump_catalog_version)
+    """
+    if not in_transaction():
+        callback()
+        return
+    db.session.info.setdefault(_ON_COMMIT, []).append(callback)
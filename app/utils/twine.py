@@ -0,0 +1,289 @@
+"""
+Streaming parsers of Twine stories, in Twee source or in the HTML archives Twine 2 publishes.
+
+Both yield the passages one at a time as they are read, so that a story of any
+size is imported without holding its text in memory:
+
+    with open("story.twee", encoding="utf-8") as file:
+        for passage in parse_twee(file):
+            ...
+
+The story's title and starting passage are known once the whole source is read
+(Twee puts them in passages that may come anywhere): they are stored in the
+`TwineStory` given to the parser.
+
+Links use the Twine syntax, whatever the story format:
+
+    [[Target]]   [[Label|Target]]   [[Label->Target]]   [[Target<-Label]]
+
+Errors are raised as `TwineError`, with the line of the source they were found on.
+"""
+import io
+import itertools
+import json
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import IO, Iterable, Iterator
+
+# Twee passage header: ":: Name [tags] {metadata}", with \ escaping [ ] { } in the name
+_HEADER = re.compile(r"^::\s*(?P<name>(?:\\.|[^\\\[{])*?)\s*(?:\[(?P<tags>(?:\\.|[^\]\\])*)\])?\s*(?P<metadata>\{.*\})?\s*$")
+_UNESCAPE = re.compile(r"\\(.)")
+LINK = re.compile(r"\[\[(.*?)\]\]")
+# passages holding code rather than text, not part of the story's graph
+CODE_TAGS = frozenset({"script", "stylesheet", "Twine.private"})
+# bytes fed to the HTML parser at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class TwineError(ValueError):
+    """A Twine source that can't be imported, with the line of the error."""
+
+    def __init__(self, message: str, line: int):
+        super().__init__(f"{message} at line {line}")
+        self.line = line
+
+
+@dataclass
+class Passage:
+    """A passage of a Twine story."""
+    name: str
+    text: str
+    line: int
+    # line of the first character of the text
+    text_line: int
+    tags: list[str] = field(default_factory=list)
+    position: tuple[float, float] | None = None
+
+
+@dataclass
+class TwineStory:
+    """What the parser learns about the story besides its passages."""
+    title: str | None = None
+    start: str | None = None
+
+
+def split_link(link: str) -> tuple[str, str]:
+    """
+    Split the inside of a `[[...]]` link (see `LINK`) into its label and target.
+
+    Example:
+        >>> [split_link(match.group(1)) for match in LINK.finditer("Go [[north->Cave]] or [[Home]]")]
+        [('north', 'Cave'), ('Home', 'Home')]
+    """
+    # a setter (Twine 1: [[label|target][$x = 1]]) is not part of the target
+    link = link.split("][", 1)[0]
+    if "|" in link:
+        label, target = link.rsplit("|", 1)
+    elif "->" in link:
+        label, target = link.rsplit("->", 1)
+    elif "<-" in link:
+        target, label = link.split("<-", 1)
+    else:
+        label = target = link
+    return label.strip(), target.strip()
+
+
+def _position(value: str | None, line: int) -> tuple[float, float] | None:
+    if not value:
+        return None
+    try:
+        x, y = (float(coordinate) for coordinate in value.split(","))
+    except ValueError:
+        raise TwineError(f"Invalid passage position {value!r}", line) from None
+    return x, y
+
+
+def parse_twee(lines: Iterable[str], story: TwineStory | None = None) -> Iterator[Passage]:
+    """
+    Parse Twee source (Twee 3, or Twee 1 without metadata) line by line.
+
+    Args:
+        lines (Iterable[str]): The lines of the source, e.g. an open text file.
+        story (TwineStory | None): Receives the title and starting passage once they are read.
+
+    Yields:
+        Passage: The passages of the story, except StoryTitle, StoryData and the code passages.
+
+    Raises:
+        TwineError: If a header, its metadata or the StoryData passage is invalid,
+                    or if text comes before the first passage.
+
+    Example:
+        >>> passages = list(parse_twee([":: Start", "Hello [[World]]", ":: World", "The end"]))
+        >>> [(passage.name, passage.line) for passage in passages]
+        [('Start', 1), ('World', 3)]
+    """
+    story = story if story is not None else TwineStory()
+    current: Passage | None = None
+    body: list[str] = []
+
+    def finish() -> Passage | None:
+        if current is None:
+            return None
+        current.text = "\n".join(body)
+        if current.name == "StoryTitle":
+            story.title = current.text.strip()
+        elif current.name == "StoryData":
+            try:
+                data = json.loads(current.text or "{}")
+            except ValueError as error:
+                raise TwineError(f"Invalid StoryData: {error}", current.line) from None
+            story.start = data.get("start", story.start)
+        elif not CODE_TAGS.intersection(current.tags):
+            return current
+        return None
+
+    number = 0
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.startswith("::"):
+            if current is None:
+                if line.strip():
+                    raise TwineError("Text outside of a passage", number)
+                continue
+            body.append(line)
+            continue
+        passage = finish()
+        if passage is not None:
+            yield passage
+        match = _HEADER.match(line)
+        if match is None or not match.group("name"):
+            raise TwineError("Invalid passage header", number)
+        metadata = {}
+        if match.group("metadata"):
+            try:
+                metadata = json.loads(match.group("metadata"))
+            except ValueError as error:
+                raise TwineError(f"Invalid passage metadata: {error}", number) from None
+        tags = _UNESCAPE.sub(r"\1", match.group("tags") or "").split()
+        current = Passage(_UNESCAPE.sub(r"\1", match.group("name")), "", number, number + 1, tags,
+                          _position(metadata.get("position"), number))
+        body = []
+    passage = finish()
+    if passage is not None:
+        yield passage
+    if story.start is None and number:
+        story.start = "Start"  # the Twee convention without StoryData
+
+
+class _ArchiveParser(HTMLParser):
+    def __init__(self, story: TwineStory):
+        super().__init__(convert_charrefs=True)
+        self.story = story
+        self.passages: list[Passage] = []
+        self.start_pid: str | None = None
+        self.in_story = False
+        self.current: Passage | None = None
+        self.pid: str | None = None
+        self.chunks: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        attributes = dict(attrs)
+        line = self.getpos()[0]
+        if tag == "tw-storydata":
+            if self.in_story:
+                raise TwineError("Nested <tw-storydata>", line)
+            self.in_story = True
+            self.story.title = attributes.get("name") or self.story.title
+            self.start_pid = attributes.get("startnode")
+        elif tag == "tw-passagedata":
+            if not self.in_story:
+                raise TwineError("<tw-passagedata> outside of <tw-storydata>", line)
+            if self.current is not None:
+                raise TwineError("Unclosed <tw-passagedata>", line)
+            name = attributes.get("name")
+            if not name:
+                raise TwineError("Passage without a name", line)
+            self.current = Passage(name, "", line, line, (attributes.get("tags") or "").split(),
+                                   _position(attributes.get("position"), line))
+            self.pid = attributes.get("pid")
+            self.chunks = []
+
+    def handle_endtag(self, tag: str):
+        if tag == "tw-passagedata" and self.current is not None:
+            self.current.text = "".join(self.chunks)
+            if self.pid is not None and self.pid == self.start_pid:
+                self.story.start = self.current.name
+            if not CODE_TAGS.intersection(self.current.tags):
+                self.passages.append(self.current)
+            self.current = None
+        elif tag == "tw-storydata":
+            self.in_story = False
+
+    def handle_data(self, data: str):
+        if self.current is not None:
+            self.chunks.append(data)
+
+
+def parse_twine_html(file: IO[str], story: TwineStory | None = None) -> Iterator[Passage]:
+    """
+    Parse a Twine 2 HTML archive (or published story) chunk by chunk.
+
+    Args:
+        file (IO[str]): The open archive, in text mode.
+        story (TwineStory | None): Receives the title and starting passage once they are read.
+
+    Yields:
+        Passage: The passages of the story, except the code passages.
+
+    Raises:
+        TwineError: If the passage elements are misplaced or invalid, or if there are none.
+
+    Example:
+        >>> with open("story.html", encoding="utf-8") as file:
+        ...     names = [passage.name for passage in parse_twine_html(file)]
+    """
+    story = story if story is not None else TwineStory()
+    parser = _ArchiveParser(story)
+    found = False
+    while chunk := file.read(CHUNK_SIZE):
+        parser.feed(chunk)
+        found = found or bool(parser.passages)
+        yield from parser.passages
+        parser.passages = []
+    parser.close()
+    found = found or bool(parser.passages)
+    yield from parser.passages
+    if parser.current is not None:
+        raise TwineError("Unclosed <tw-passagedata>", parser.current.line)
+    if not found:
+        raise TwineError("No Twine 2 passages (<tw-passagedata>) found", parser.getpos()[0])
+
+
+def parse_twine(file: IO[str], story: TwineStory | None = None) -> Iterator[Passage]:
+    """
+    Parse a Twee source or a Twine HTML archive, told apart by their first non-blank character.
+
+    The format is sniffed from chunks read with `file.read`, never from lines: a
+    Twine 2 archive may have no line break at all.
+
+    Example:
+        >>> with open("story.twee", encoding="utf-8") as file:
+        ...     story = TwineStory()
+        ...     passages = list(parse_twine(file, story))
+    """
+    # read past the leading blanks to sniff the format, then parse from the start
+    head = ""
+    while chunk := file.read(CHUNK_SIZE):
+        head += chunk
+        if not head.isspace():
+            break
+    if head.lstrip()[:1] == "<":
+        return parse_twine_html(_Prepended(head, file), story)
+    # Twee is line based: the last line of the head is completed from the file
+    return parse_twee(itertools.chain(io.StringIO(head + file.readline()), file), story)
+
+
+class _Prepended:
+    """File-like `read` over a text read beforehand followed by the rest of the file, as `parse_twine_html` expects."""
+
+    def __init__(self, head: str, file: IO[str]):
+        self.head = head
+        self.file = file
+
+    def read(self, size: int) -> str:
+        if not self.head:
+            return self.file.read(size)
+        chunk, self.head = self.head[:size], self.head[size:]
+        return chunk
@@ -0,0 +1,14 @@
+"""
+Load and latency benchmarks.
+
+Builds the application against a temporary database filled with a synthetic
+corpus, drives the main endpoints with concurrent workers and reports latency
+percentiles, throughput and SQL query counts as JSON.
+
+    python -m benchmarks --stories 50 --nodes 2000 --users 500 --output bench.json
+    python -m benchmarks --compare old.json new.json
+
+`benchmarks.hot_queries` times the reader's hot reads per call, Core against ORM:
+
+    python -m benchmarks.hot_queries --calls 5000
+"""
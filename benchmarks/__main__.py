@@ -0,0 +1,55 @@
+import argparse
+import json
+import sys
+from benchmarks.datagen import CorpusSpec
+from benchmarks.harness import SCENARIOS, compare, run_benchmarks
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Load and latency benchmarks.")
+    parser.add_argument("--stories", type=int, default=10)
+    parser.add_argument("--nodes", type=int, default=200, help="nodes per story")
+    parser.add_argument("--branching", type=int, default=2, help="outgoing edges per node")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=200, help="reading sessions (user, story pairs)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--shards", type=int, default=0, help="shard files the stories are spread over, 0 for none")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent workers")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--driver", choices=["client", "server"], default="client")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS),
+                        default=["home", "story_nodes", "node_detail", "read", "account", "login"])
+    parser.add_argument("--admission-control", action="store_true",
+                        help="enable the concurrency classes (503 when saturated)")
+    parser.add_argument("--cache-backend", choices=["lru", "shared", "redis"], default="lru",
+                        help="application cache backend (redis runs against an in-memory stand-in)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two JSON reports")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            rows = compare(json.load(old), json.load(new))
+        json.dump(rows, sys.stdout, indent=2)
+        print()
+        return 0
+
+    spec = CorpusSpec(args.stories, args.nodes, args.branching, args.users, args.sessions, args.seed, args.shards)
+    report = run_benchmarks(spec, args.scenarios, args.requests, args.workers, args.driver, args.warmup,
+                            args.admission_control, args.cache_backend)
+    for result in report["results"]:
+        print(f"{result['scenario']:>12}  p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+              f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:8.1f} req/s  "
+              f"{result['queries_per_request']:6.1f} queries/req  {result['errors']} errors", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Synthetic corpus generator.
+
+Rows are written with Core bulk inserts and explicit, contiguous ids, so the
+benchmark scenarios can pick random valid ids without querying the database.
+"""
+import random
+from dataclasses import dataclass
+from sqlalchemy import insert
+from app.extensions import db, bcrypt
+from app.models import Asset, Story, StoryNode, StoryEdge, User, UserStory
+from app.services.search_service import rebuild_search_index
+from app.utils.shards import NODE_ID_BITS, use_shard
+
+
+BATCH_SIZE = 10_000
+PASSWORD = "benchmark-password"
+SPEAKERS = ["Narrator", "Anthony", "Professor Oak", "Dora", "Yoya"]
+PICTURES = ["p1.png", "p2.png", "p3.png", "spy.png", "tn.jpeg", "joli_paysage.jpg", "restaurant.jpg"]
+WORDS = ("spy mission agent secret letter city night street hotel room restaurant forum "
+         "phone portfolio card aisle lesson professor answer question greek horse white").split()
+
+
+@dataclass
+class CorpusSpec:
+    """Size of a synthetic corpus."""
+    stories: int = 10
+    nodes: int = 200
+    branching: int = 2
+    users: int = 50
+    sessions: int = 200
+    seed: int = 42
+    # shard files the stories are spread over (see `app.utils.shards`), 0 for the central database only
+    shards: int = 0
+
+    def shard(self, story_id: int) -> int | None:
+        """Shard of a story, as `ShardRouter.shard_for_new_story` places it."""
+        return story_id % self.shards + 1 if self.shards else None
+
+    def node_ids(self, story_id: int) -> range:
+        """Ids of the nodes of a story, its START node first."""
+        first = ((self.shard(story_id) or 0) << NODE_ID_BITS) + (story_id - 1) * self.nodes + 1
+        return range(first, first + self.nodes)
+
+
+def _sentence(rng: random.Random, length: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def _node_row(rng: random.Random, spec: CorpusSpec, story_id: int, index: int, node_id: int) -> dict:
+    if index == 0:
+        node_type = "START"
+    elif index == spec.nodes - 1:
+        node_type = "END"
+    else:
+        node_type = "QUIZ" if rng.random() < 0.2 else "DIALOG"
+    if node_type == "QUIZ":
+        answer = rng.choice(WORDS)
+        content = (f"<div><span>{_sentence(rng, 8)}</span><quiz solution='{answer}' type='multichoice'>"
+                   f"<quizchoice>{answer}</quizchoice><quizchoice>{rng.choice(WORDS)}</quizchoice></quiz></div>")
+    else:
+        content = " ".join(_sentence(rng, rng.randint(6, 20)) for _ in range(rng.randint(1, 4)))
+    return {
+        "id": node_id,
+        "story_id": story_id,
+        "node_type": node_type,
+        "content": content,
+        "speaker": rng.choice(SPEAKERS),
+        # assets are inserted with the ids 1..len(PICTURES)
+        "left_img_id": rng.randint(1, len(PICTURES)),
+        "right_img_id": rng.randint(1, len(PICTURES)),
+        "background_img_id": rng.randint(1, len(PICTURES)),
+    }
+
+
+def _flush(model, rows: list[dict]):
+    if rows:
+        db.session.execute(insert(model), rows)
+        rows.clear()
+
+
+def generate_corpus(spec: CorpusSpec) -> None:
+    """
+    Fill an empty database with a synthetic corpus.
+
+    Every story is a forward-branching graph: node i always links to node i + 1 and
+    to up to `branching - 1` other nodes further ahead. Users all share the same
+    password (`PASSWORD`) so that it is hashed only once.
+
+    Args:
+        spec (CorpusSpec): The size of the corpus to generate.
+
+    Side Effects:
+        Inserts assets, stories, nodes, edges, users and reading sessions (the content and
+        readers of each story in its shard, if `spec.shards`), rebuilds the search index and commits.
+
+    Example:
+        >>> generate_corpus(CorpusSpec(stories=100, nodes=1000))
+    """
+    rng = random.Random(spec.seed)
+    db.session.execute(insert(Asset), [{"id": asset_id, "path": path}
+                                       for asset_id, path in enumerate(PICTURES, start=1)])
+    db.session.execute(insert(Story), [{
+        "id": story_id,
+        "title": _sentence(rng, 3),
+        "description": _sentence(rng, 12),
+        "shard": spec.shard(story_id),
+    } for story_id in range(1, spec.stories + 1)])
+
+    nodes: list[dict] = []
+    edges: list[dict] = []
+    for story_id in range(1, spec.stories + 1):
+        ids = spec.node_ids(story_id)
+        with use_shard(spec.shard(story_id)):
+            for index, node_id in enumerate(ids):
+                nodes.append(_node_row(rng, spec, story_id, index, node_id))
+                if index + 1 >= len(ids):
+                    continue
+                targets = {node_id + 1}
+                for _ in range(spec.branching - 1):
+                    targets.add(rng.randint(node_id + 1, min(node_id + 10, ids[-1])))
+                edges.extend({"from_node_id": node_id, "to_node_id": target, "condition": "SUCCESS"}
+                             for target in sorted(targets))
+                if len(nodes) >= BATCH_SIZE:
+                    _flush(StoryNode, nodes)
+                if len(edges) >= BATCH_SIZE:
+                    _flush(StoryEdge, edges)
+            if spec.shards:  # the next story may be in another shard
+                _flush(StoryNode, nodes)
+                _flush(StoryEdge, edges)
+    _flush(StoryNode, nodes)
+    _flush(StoryEdge, edges)
+
+    password_hash = bcrypt.generate_password_hash(PASSWORD).decode()
+    db.session.execute(insert(User), [{
+        "id": user_id,
+        "username": f"user{user_id}",
+        "password": password_hash,
+    } for user_id in range(1, spec.users + 1)])
+
+    pairs = [(user_id, story_id)
+             for user_id in range(1, spec.users + 1)
+             for story_id in range(1, spec.stories + 1)]
+    sessions = rng.sample(pairs, min(spec.sessions, len(pairs)))
+    readers: dict[int | None, list[dict]] = {}
+    for user_id, story_id in sessions:
+        readers.setdefault(spec.shard(story_id), []).append({
+            "user_id": user_id,
+            "story_id": story_id,
+            "progress": rng.choice(spec.node_ids(story_id)),
+            "health": rng.randrange(10, 101, 10),
+        })
+    for shard, rows in readers.items():
+        with use_shard(shard):
+            _flush(UserStory, rows)
+
+    rebuild_search_index()
+    db.session.commit()
@@ -0,0 +1,329 @@
+"""
+Benchmark harness: scenarios, drivers and statistics.
+"""
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Callable
+from flask import Flask
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+from app import create_app
+from app.extensions import db, shards
+from app.utils.cache import InMemoryClient
+from benchmarks.datagen import CorpusSpec, generate_corpus, PASSWORD, WORDS
+
+
+@dataclass
+class Scenario:
+    """An endpoint to benchmark, with a factory building a random request for it."""
+    name: str
+    method: str
+    build: Callable[[random.Random, CorpusSpec], tuple[str, dict | None]]
+    authenticated: bool = True
+    # whether the body is sent as JSON rather than as a form
+    json_body: bool = False
+
+
+def _random_story(rng: random.Random, spec: CorpusSpec) -> int:
+    return rng.randint(1, spec.stories)
+
+
+def _random_node(rng: random.Random, spec: CorpusSpec) -> int:
+    return rng.choice(spec.node_ids(_random_story(rng, spec)))
+
+
+def _view_event(rng: random.Random, spec: CorpusSpec) -> dict:
+    story_id = _random_story(rng, spec)
+    return {"story_id": story_id, "node_id": rng.choice(spec.node_ids(story_id)), "kind": "view"}
+
+
+SCENARIOS: dict[str, Scenario] = {scenario.name: scenario for scenario in [
+    Scenario("home", "GET", lambda rng, spec: ("/", None), authenticated=False),
+    Scenario("story_nodes", "GET", lambda rng, spec: (f"/api/stories/{_random_story(rng, spec)}/nodes", None)),
+    Scenario("story_graph", "GET", lambda rng, spec: (
+        f"/api/stories/{_random_story(rng, spec)}/nodes?fields=id,node_type,speaker,next", None)),
+    Scenario("node_detail", "GET", lambda rng, spec: (f"/api/stories/nodes/{_random_node(rng, spec)}", None)),
+    Scenario("read", "GET", lambda rng, spec: (f"/read/{_random_story(rng, spec)}", None)),
+    Scenario("account", "GET", lambda rng, spec: ("/account", None)),
+    Scenario("search", "GET", lambda rng, spec: ("/api/search?q=secret+mis", None), authenticated=False),
+    Scenario("login", "POST", lambda rng, spec: (
+        "/login", {"username": f"user{rng.randint(1, spec.users)}", "password": PASSWORD}
+    ), authenticated=False),
+    # writes, spread over the stories of the corpus: their throughput grows with the stories written
+    # to at once when the stories are sharded (--shards), since each shard has a write lock of its own
+    Scenario("node_edit", "PUT", lambda rng, spec: (
+        f"/api/stories/nodes/{_random_node(rng, spec)}", {"content": f"<p>{' '.join(rng.choices(WORDS, k=12))}</p>"}
+    ), json_body=True),
+    Scenario("events", "POST", lambda rng, spec: ("/api/events", {"events": [_view_event(rng, spec)]}), json_body=True),
+]}
+
+
+class QueryCounter:
+    """Counts the SQL statements executed by an engine."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+class ClientDriver:
+    """Sends requests in-process through Flask's test client."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+
+    def session(self, user_id: int | None):
+        client = self.app.test_client()
+        if user_id is not None:
+            with client.session_transaction() as session:
+                session["user_id"] = user_id
+
+        def send(method: str, url: str, form: dict | None, json_body: bool = False) -> int:
+            if json_body:
+                return client.open(url, method=method, json=form).status_code
+            return client.open(url, method=method, data=form).status_code
+        return send
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    """Sends real HTTP requests to a threaded local server running the app."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=_QuietHandler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def session(self, user_id: int | None):
+        cookies = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(cookies), _NoRedirect()
+        )
+        if user_id is not None:
+            # sign a session cookie exactly like the app would
+            serializer = self.app.session_interface.get_signing_serializer(self.app)
+            opener.addheaders.append(("Cookie", f"session={serializer.dumps({'user_id': user_id})}"))
+
+        def send(method: str, url: str, form: dict | None, json_body: bool = False) -> int:
+            headers = {}
+            if json_body:
+                data = json.dumps(form).encode()
+                headers["Content-Type"] = "application/json"
+            else:
+                data = urllib.parse.urlencode(form).encode() if form is not None else None
+            request = urllib.request.Request(self.base_url + url, data=data, method=method, headers=headers)
+            try:
+                with opener.open(request) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as error:
+                return error.code
+        return send
+
+    def close(self):
+        self.server.shutdown()
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(driver, counter: QueryCounter, scenario: Scenario, spec: CorpusSpec,
+                 requests: int, workers: int, seed: int) -> dict:
+    """
+    Send `requests` requests of a scenario from `workers` concurrent workers.
+
+    Returns:
+        dict: Latency percentiles (milliseconds), throughput (requests per second),
+              error count and mean SQL statements per request.
+    """
+    per_worker = [requests // workers + (1 if i < requests % workers else 0) for i in range(workers)]
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def work(index: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + index)
+        send = driver.session(rng.randint(1, spec.users) if scenario.authenticated else None)
+        local_latencies, local_errors = [], 0
+        for _ in range(per_worker[index]):
+            url, form = scenario.build(rng, spec)
+            start = time.perf_counter()
+            status = send(scenario.method, url, form, scenario.json_body)
+            local_latencies.append(time.perf_counter() - start)
+            # logins and enrollments answer with redirects
+            if status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    queries_before = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(work, range(workers)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "scenario": scenario.name,
+        "requests": len(latencies),
+        "workers": workers,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "queries_per_request": (counter.count - queries_before) / len(latencies) if latencies else 0.0,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(spec: CorpusSpec, scenarios: list[str], requests: int, workers: int,
+                   driver: str = "client", warmup: int = 20, admission_control: bool = False,
+                   cache_backend: str = "lru") -> dict:
+    """
+    Build the app against a temporary database, generate the corpus and run the scenarios.
+
+    Args:
+        spec (CorpusSpec): The size of the synthetic corpus.
+        scenarios (list[str]): Names of the scenarios to run (see `SCENARIOS`).
+        requests (int): Measured requests per scenario.
+        workers (int): Concurrent workers per scenario.
+        driver (str): "client" for Flask's test client, "server" for HTTP against a local server.
+        warmup (int): Unmeasured requests sent before each scenario.
+        admission_control (bool): Whether concurrency classes apply. Off by default, so that
+                                  scenarios measure the endpoints rather than shed load.
+        cache_backend (str): The application cache backend, "lru", "shared" or "redis".
+                             "redis" runs against an in-memory stand-in of the server.
+
+    Returns:
+        dict: The run metadata and one result entry per scenario.
+
+    Example:
+        >>> report = run_benchmarks(CorpusSpec(), ["node_detail"], requests=500, workers=8)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            "ADMISSION_CONTROL": admission_control,
+            "CACHE_BACKEND": cache_backend,
+            "CACHE_DIR": os.path.join(directory, "cache"),
+            "CACHE_CLIENT": InMemoryClient() if cache_backend == "redis" else None,
+            # no background jobs competing with the measured requests
+            "MAINTENANCE_SCHEDULER": False,
+            "SHARDING": bool(spec.shards),
+            "SHARD_BUCKETS": spec.shards or 1,
+            "SHARD_DIR": os.path.join(directory, "shards"),
+            "SHARD_POOL_SIZE": spec.shards or 1,
+        })
+        counter = QueryCounter()
+        with app.app_context():
+            start = time.perf_counter()
+            generate_corpus(spec)
+            generation_time = time.perf_counter() - start
+            engines = [db.engine, *(shards.engine(bucket) for bucket in shards.existing())]
+            for engine in engines:
+                event.listen(engine, "before_cursor_execute", counter)
+
+        runner = ServerDriver(app) if driver == "server" else ClientDriver(app)
+        try:
+            results = []
+            for name in scenarios:
+                scenario = SCENARIOS[name]
+                if warmup:
+                    run_scenario(runner, counter, scenario, spec, warmup, 1, spec.seed)
+                results.append(run_scenario(runner, counter, scenario, spec, requests, workers, spec.seed))
+        finally:
+            runner.close()
+            with app.app_context():
+                for engine in engines:
+                    event.remove(engine, "before_cursor_execute", counter)
+                shards.dispose()
+                db.engine.dispose()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "driver": driver,
+            "cache_backend": cache_backend,
+            "corpus": asdict(spec),
+            "generation_seconds": generation_time,
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> list[dict]:
+    """
+    Compare two reports scenario by scenario.
+
+    Returns:
+        list[dict]: For each scenario present in both reports, the old and new p95
+                    latency and throughput, with their ratios (new / old).
+    """
+    old_results = {result["scenario"]: result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        previous = old_results.get(result["scenario"])
+        if previous is None:
+            continue
+        rows.append({
+            "scenario": result["scenario"],
+            "p95_ms": (previous["p95_ms"], result["p95_ms"]),
+            "p95_ratio": result["p95_ms"] / previous["p95_ms"] if previous["p95_ms"] else None,
+            "throughput_rps": (previous["throughput_rps"], result["throughput_rps"]),
+            "throughput_ratio": (result["throughput_rps"] / previous["throughput_rps"]
+                                 if previous["throughput_rps"] else None),
+            "queries_per_request": (previous["queries_per_request"], result["queries_per_request"]),
+        })
+    return rows
@@ -0,0 +1,139 @@
+"""
+Micro-benchmark of the reader's hot reads: the Core statements of the services
+against the ORM queries they replace, per call and without the application cache.
+
+    python -m benchmarks.hot_queries --calls 5000 --output hot.json
+
+Every call runs in a fresh session, like a request does, so that the ORM can't
+answer from its identity map.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Callable
+from app import create_app
+from app.extensions import db
+from app.models import StoryEdge, StoryNode, UserStory
+from app.services.stories_service import get_next_nodes_id, get_start_node, get_start_node_data, get_story_node
+from app.services.users_service import get_user_story_data, get_user_story_info
+from benchmarks.datagen import CorpusSpec, generate_corpus
+
+
+def _orm_node(node_id: int) -> dict:
+    return db.session.get(StoryNode, node_id).serialize()
+
+
+def _orm_next_ids(node_id: int) -> list[int]:
+    return [edge.to_node_id for edge in StoryEdge.query.filter(StoryEdge.from_node_id == node_id).all()]
+
+
+def _orm_user_story(user_id: int, story_id: int) -> dict:
+    return get_user_story_info(user_id, story_id).serialize()
+
+
+def _time_calls(call: Callable[[], object], calls: int) -> list[float]:
+    durations = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+        db.session.remove()
+    return durations
+
+
+def run_hot_queries(spec: CorpusSpec, calls: int) -> list[dict]:
+    """
+    Time the ORM and Core versions of each hot read against a temporary database.
+
+    Args:
+        spec (CorpusSpec): The size of the synthetic corpus.
+        calls (int): Measured calls per read and version.
+
+    Returns:
+        list[dict]: Per read, the median and mean time per call of both versions in
+                    microseconds, and the speedup of the Core version (ORM median / Core median).
+
+    Example:
+        >>> rows = run_hot_queries(CorpusSpec(), calls=2000)
+    """
+    rng = random.Random(spec.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(directory, 'bench.db')}"})
+        with app.app_context():
+            generate_corpus(spec)
+            stories = [rng.randint(1, spec.stories) for _ in range(calls)]
+            nodes = [rng.choice(spec.node_ids(story_id)) for story_id in stories]
+            user_stories = [(user_story.user_id, user_story.story_id) for user_story in UserStory.query.all()]
+            readers = [rng.choice(user_stories) for _ in range(calls)]
+            fields = list(StoryNode.FIELDS)  # with fields, the node detail skips the application cache
+
+            def inputs(values: list) -> Callable[[], object]:
+                iterator = iter(values * 2)  # warm-up calls included
+                return lambda: next(iterator)
+
+            reads = {
+                "node_detail": (lambda pick: lambda: _orm_node(pick()),
+                                lambda pick: lambda: get_story_node(pick(), fields), nodes),
+                "next_ids": (lambda pick: lambda: _orm_next_ids(pick()),
+                             lambda pick: lambda: get_next_nodes_id(pick()), nodes),
+                "start_node": (lambda pick: lambda: get_start_node(pick()).serialize(),
+                               lambda pick: lambda: get_start_node_data(pick()), stories),
+                "user_story": (lambda pick: lambda: _orm_user_story(*pick()),
+                               lambda pick: lambda: get_user_story_data(*pick()), readers),
+            }
+            rows = []
+            for name, (orm, core, values) in reads.items():
+                timings = {}
+                for version, build in (("orm", orm), ("core", core)):
+                    call = build(inputs(values))
+                    _time_calls(call, calls)  # warm-up: statement caches, page cache
+                    timings[version] = _time_calls(call, calls)
+                orm_median = statistics.median(timings["orm"]) * 1e6
+                core_median = statistics.median(timings["core"]) * 1e6
+                rows.append({
+                    "read": name,
+                    "orm_median_us": orm_median,
+                    "orm_mean_us": statistics.fmean(timings["orm"]) * 1e6,
+                    "core_median_us": core_median,
+                    "core_mean_us": statistics.fmean(timings["core"]) * 1e6,
+                    "speedup": orm_median / core_median if core_median else None,
+                })
+            db.engine.dispose()
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.hot_queries",
+                                     description="Per-call overhead of the hot reads, ORM against Core.")
+    parser.add_argument("--stories", type=int, default=10)
+    parser.add_argument("--nodes", type=int, default=200, help="nodes per story")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=200, help="reading sessions (user, story pairs)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--calls", type=int, default=2000, help="measured calls per read and version")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    spec = CorpusSpec(args.stories, args.nodes, 2, args.users, args.sessions, args.seed)
+    rows = run_hot_queries(spec, args.calls)
+    for row in rows:
+        print(f"{row['read']:>12}  orm {row['orm_median_us']:8.1f} us  core {row['core_median_us']:8.1f} us  "
+              f"x{row['speedup']:.2f}", file=sys.stderr)
+    report = {"corpus": asdict(spec), "calls": args.calls, "results": rows}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,50 +3,55 @@ from app.models import *
 
 def populate():
     story = Story(title="Test Story", description="This is a test story")
+    p1 = Asset(path="p1.png")
+    p2 = Asset(path="p2.png")
+    landscape = Asset(path="joli_paysage.jpg")
+    db.session.add_all([p1, p2, landscape])
+    db.session.flush()
     # start node
     start_node = StoryNode(
         node_type="START",
         content="this is the story of a man named Stanley.",
         story_id=1, speaker="Narator",
-        left_img="p1.png",
-        right_img="p2.png",
-        background_img="joli_paysage.jpg"
+        left_img_id=p1.id,
+        right_img_id=p2.id,
+        background_img_id=landscape.id
     )
     end_node = StoryNode(
         node_type="END",
         content="And this is how ended the story.",
         story_id=1,
         speaker="Narator",
-        left_img="p1.png",
-        right_img="p2.png",
-        background_img="joli_paysage.jpg"
+        left_img_id=p1.id,
+        right_img_id=p2.id,
+        background_img_id=landscape.id
     )
     some_node = StoryNode(
         node_type="DIALOG",
         content="Hello, ready to do some exercices ?",
         story_id=1,
         speaker="Narator",
-        left_img="p2.png",
-        right_img="p1.png",
-        background_img="joli_paysage.jpg"
+        left_img_id=p2.id,
+        right_img_id=p1.id,
+        background_img_id=landscape.id
     )
     some_quiz = StoryNode(
         node_type="QUIZ",
         content="<div><span> what is the first greek letter ? </span><quiz solution='alpha' type='multichoice'><quizchoice>alpha</quizchoice> <quizchoice>beta</quizchoice></quiz></div>",
         story_id=1,
         speaker="Dora",
-        left_img="p1.png", 
-        right_img="p2.png",
-        background_img="joli_paysage.jpg"
+        left_img_id=p1.id, 
+        right_img_id=p2.id,
+        background_img_id=landscape.id
     )
     some_quiz2 = StoryNode(
         node_type="QUIZ",
         content="<div><span> What is the Henri IV's horse color ? </span><quiz solution='white' ></quiz><span> Spoiler, it's white </span></div>",
         story_id=1,
         speaker="Dora",
-        left_img="p1.png",
-        right_img="p2.png",
-        background_img="joli_paysage.jpg"
+        left_img_id=p1.id,
+        right_img_id=p2.id,
+        background_img_id=landscape.id
     )
     db.session.add(story)
     db.session.add(start_node)
@@ -0,0 +1,47 @@
+import pytest
+from app import create_app
+
+
+@pytest.fixture(params=[False, True], ids=["central", "sharded"])
+def app(request, tmp_path):
+    """The application on an empty database, with or without story sharding."""
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+        "SHARDING": request.param,
+        "SHARD_BUCKETS": 4,
+        "SHARD_DIR": str(tmp_path / "shards"),
+        "CACHE_BACKEND": "lru",
+        "PUBLISH_FOLDER": str(tmp_path / "published"),
+        "MAINTENANCE_SCHEDULER": False,
+    })
+    yield app
+    from app.services import branching_service
+    # kept per process for good, while every test has a database of its own
+    branching_service._drafts.clear()
+    branching_service._versions.clear()
+    with app.app_context():
+        from app.extensions import db, shards
+        shards.dispose()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as a new user."""
+    client = app.test_client()
+    client.put("/api/users/new", json={"username": "reader", "password": "secret-password"})
+    client.post("/login", data={"username": "reader", "password": "secret-password"})
+    return client
+
+
+@pytest.fixture
+def story(client):
+    """A story going from its start node to a dialog node, then to an END node."""
+    story_id = int(client.get("/editor/new").headers["Location"].rsplit("/", 1)[1])
+    start_id = client.get(f"/api/stories/{story_id}/start").get_json()["data"]["id"]
+    dialog_id = client.post(f"/api/stories/{story_id}/nodes", json={"content": "<p>Hello</p>"}).get_json()["node_id"]
+    end_id = client.post(f"/api/stories/{story_id}/nodes", json={"content": "The end", "node_type": "END"}).get_json()["node_id"]
+    client.post(f"/api/stories/{story_id}/edges", json={"from_node_id": start_id, "to_node_id": dialog_id})
+    client.post(f"/api/stories/{story_id}/edges", json={"from_node_id": dialog_id, "to_node_id": end_id})
+    return {"id": story_id, "start": start_id, "dialog": dialog_id, "end": end_id}
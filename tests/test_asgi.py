@@ -0,0 +1,45 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("aiosqlite")
+from app.asgi import create_asgi_app
+
+
+async def _get(application, path: str, cookie: str = "") -> tuple[int, dict]:
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": b"", "root_path": "",
+             "headers": [(b"cookie", cookie.encode())], "server": ("localhost", 80), "client": ("127.0.0.1", 1)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+    return messages[0]["status"], json.loads(body)
+
+
+def test_reader_endpoints_serve_every_story(app, client, story):
+    client.get(f"/read/{story['id']}")
+    cookie = f"session={client.get_cookie('session').value}"
+    application = create_asgi_app(app)
+
+    async def requests():
+        try:
+            return await asyncio.gather(
+                _get(application, f"/api/stories/{story['id']}/start"),
+                _get(application, f"/api/stories/nodes/{story['dialog']}"),
+                _get(application, f"/api/userinfo/{story['id']}", cookie),
+            )
+        finally:
+            await application.engine.dispose()
+            application.wsgi.close()
+
+    (start_status, start), (node_status, node), (progress_status, progress) = asyncio.run(requests())
+    # the nodes and readers of a sharded story are not in the central database the async routes read
+    assert (start_status, start["data"]["id"]) == (200, story["start"])
+    assert (node_status, node["data"]["id"], node["next"]) == (200, story["dialog"], [story["end"]])
+    assert (progress_status, progress["progress"]) == (200, story["start"])
@@ -0,0 +1,13 @@
+def test_a_failing_backend_does_not_fail_the_request(app, client, story, monkeypatch):
+    cache = app.extensions["cache"]
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("cache server down")
+
+    for command in ("get", "set", "delete", "incr"):
+        monkeypatch.setattr(cache.backend, command, unavailable)
+    # the update bumps the story's namespace once committed
+    response = client.put(f"/api/stories/nodes/{story['dialog']}", json={"speaker": "Ann"})
+    assert response.status_code == 200
+    assert cache.errors > 0
+    assert cache.bump("story:1") == 0
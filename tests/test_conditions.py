@@ -0,0 +1,56 @@
+import pytest
+from app.utils.conditions import ConditionError, compile_condition
+
+
+def _state(outcome=None, health=100, choice=None):
+    return {"outcome": outcome, "health": health, "choice": choice}
+
+
+@pytest.mark.parametrize("source, state, expected", [
+    (None, _state(), True),
+    ("  ", _state(outcome="wrong"), True),
+    ("ALWAYS", _state(outcome="wrong"), True),
+    ("SUCCESS", _state(), True),
+    ("SUCCESS", _state(outcome="correct"), True),
+    ("SUCCESS", _state(outcome="wrong"), False),
+    ("FAIL", _state(outcome="wrong"), True),
+    ("FAIL", _state(outcome="correct"), False),
+    ("FAIL and health > 0", _state(outcome="wrong", health=40), True),
+    ("FAIL and health > 0", _state(outcome="wrong", health=0), False),
+    ("choice == 2", _state(choice=2), True),
+    ("choice == 2", _state(choice=1), False),
+    ('outcome == "correct" or health < 30', _state(health=20), True),
+    ("outcome == 'correct' or health < 30", _state(outcome="correct"), True),
+    ('outcome == "correct" or health < 30', _state(), False),
+    ("not FAIL", _state(outcome="wrong"), False),
+    ("not (choice == 1 or choice == 2)", _state(choice=3), True),
+    ("health >= 50.5", _state(health=50), False),
+    ("choice == none", _state(), True),
+    ("true and not false", _state(), True),
+])
+def test_conditions_hold_for_the_state(source, state, expected):
+    assert compile_condition(source)(state) is expected
+
+
+def test_and_binds_tighter_than_or():
+    predicate = compile_condition("choice == 1 or choice == 2 and health > 50")
+    assert predicate(_state(choice=1, health=10))
+    assert not predicate(_state(choice=2, health=10))
+
+
+def test_comparing_with_a_missing_choice_is_false():
+    assert not compile_condition("choice > 1")(_state())
+
+
+@pytest.mark.parametrize("source, position", [
+    ("health > 0 @", 11),
+    ("mana > 0", 0),
+    ("(choice == 1", 12),
+    ("choice ==", 9),
+    ("choice == 1 2", 12),
+    ("FAIL and", 8),
+])
+def test_malformed_conditions_report_where(source, position):
+    with pytest.raises(ConditionError) as error:
+        compile_condition(source)
+    assert error.value.position == position
@@ -0,0 +1,51 @@
+from sqlalchemy import event
+
+
+def _statements(app, bucket=None):
+    from app.extensions import db, shards
+    statements = []
+    engines = [db.engine] + ([shards.engine(bucket)] if bucket is not None else [])
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_enrollment_pins_the_published_version_in_one_insert(app, client, story):
+    assert client.post(f"/api/stories/{story['id']}/versions").status_code == 201
+    with app.app_context():
+        from app.services.stories_service import get_story_shard
+        statements = _statements(app, get_story_shard(story["id"]))
+    assert client.get(f"/read/{story['id']}").status_code == 200
+    writes = [statement for statement in statements if "user_stories" in statement and not statement.startswith("SELECT")]
+    assert len(writes) == 1 and writes[0].startswith("INSERT")
+    progress = client.get(f"/api/userinfo/{story['id']}").get_json()
+    assert (progress["progress"], progress["story_version"]) == (story["start"], 1)
+
+
+def test_enrolling_twice_counts_the_reader_once(client, story):
+    assert client.get(f"/read/{story['id']}").status_code == 200
+    assert client.get(f"/read/{story['id']}").status_code == 200
+    stats = client.get(f"/api/stories/{story['id']}/stats").get_json()
+    assert stats["story"]["readers"] == 1
+    assert client.get(f"/api/userinfo/{story['id']}").get_json()["story_version"] is None
+
+
+def test_readers_of_an_unpublished_story_read_the_latest_version(client, story):
+    client.get(f"/read/{story['id']}")
+    client.post(f"/api/stories/{story['id']}/versions")
+    page = client.get(f"/read/{story['id']}").get_data(as_text=True)
+    assert '<p id="bundleURL" style="display: none">/api/bundles/' in page
+
+
+def test_readers_of_an_unpublished_story_advance_in_the_version_they_read(client, story):
+    client.get(f"/read/{story['id']}")
+    client.post(f"/api/stories/{story['id']}/versions")
+    client.get(f"/read/{story['id']}")
+    assert client.get(f"/api/userinfo/{story['id']}").get_json()["story_version"] == 1
+    # the draft changes after version 1: start -> end
+    edge = {"from_node_id": story["start"], "to_node_id": story["dialog"]}
+    assert client.delete(f"/api/stories/{story['id']}/edges", json=edge).status_code == 200
+    client.post(f"/api/stories/{story['id']}/edges", json={"from_node_id": story["start"], "to_node_id": story["end"]})
+    response = client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["start"]})
+    assert response.get_json()["next"] == story["dialog"]
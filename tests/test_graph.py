@@ -0,0 +1,25 @@
+def _graph(client, story_id, bbox):
+    response = client.get(f"/api/stories/{story_id}/graph?bbox={bbox}")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_unplaced_nodes_are_placed_once_and_only_shown_in_their_viewport(client, story):
+    # the story's nodes were created without a position
+    assert _graph(client, story["id"], "-5000,-5000,-4000,-4000")["nodes"] == []
+    graph = _graph(client, story["id"], "0,0,10000,10000")
+    positions = {node["id"]: (node["x"], node["y"]) for node in graph["nodes"]}
+    assert set(positions) == {story["start"], story["dialog"], story["end"]}
+    layout = client.get(f"/api/stories/{story['id']}/layout").get_json()["positions"]
+    assert positions == {int(node_id): tuple(position) for node_id, position in layout.items()}
+    # the edges of the nodes placed on the fly are there too
+    assert {(edge["from"], edge["to"]) for edge in graph["edges"]} == {
+        (story["start"], story["dialog"]), (story["dialog"], story["end"])
+    }
+
+
+def test_placing_keeps_the_positions_set_by_the_author(client, story):
+    client.put(f"/api/stories/nodes/{story['end']}", json={"x": 5000, "y": 5000})
+    nodes = _graph(client, story["id"], "4900,4900,5100,5100")["nodes"]
+    assert [(node["id"], node["x"], node["y"]) for node in nodes] == [(story["end"], 5000, 5000)]
+    assert len(_graph(client, story["id"], "0,0,10000,10000")["nodes"]) == 3
@@ -0,0 +1,20 @@
+def test_the_scheduler_starts_with_the_first_request(app, client):
+    maintenance = app.extensions["maintenance"]
+    app.config["MAINTENANCE_SCHEDULER"] = True
+    try:
+        client.get("/")
+        assert maintenance._thread is not None and maintenance._thread.is_alive()
+        assert not maintenance.start()  # once per process
+    finally:
+        maintenance.stop()
+
+
+def test_caches_are_not_warmed_with_a_per_process_cache(app):
+    maintenance = app.extensions["maintenance"]
+    app.config["MAINTENANCE_SCHEDULER"] = True
+    assert app.config["CACHE_BACKEND"] == "lru"
+    try:
+        maintenance.start()
+        assert maintenance.jobs["warm_caches"].interval is None
+    finally:
+        maintenance.stop()
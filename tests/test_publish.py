@@ -0,0 +1,41 @@
+import threading
+from app.services import publish_service
+
+
+def test_concurrent_publishes_get_consecutive_versions(app, story, monkeypatch):
+    compile_story = publish_service.compile_story
+    # a different draft for each thread, so that every publish creates a version
+    monkeypatch.setattr(publish_service, "compile_story",
+                        lambda story_id: {**compile_story(story_id), "draft": threading.current_thread().name})
+    barrier = threading.Barrier(6, timeout=30)
+    versions, errors = [], []
+
+    def publish():
+        with app.app_context():
+            barrier.wait()
+            try:
+                versions.append(publish_service.publish_story(story["id"]).version)
+            except Exception as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=publish) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert sorted(versions) == [1, 2, 3, 4, 5, 6]
+
+
+def test_the_write_lock_is_only_held_to_record_the_version(app, client, story):
+    from sqlalchemy import event
+    with app.app_context():
+        from app.extensions import db
+        statements = []
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+    assert client.post(f"/api/stories/{story['id']}/versions").status_code == 201
+    locked = statements[statements.index("BEGIN IMMEDIATE"):]
+    # the compilation read the story before
+    assert not any("story_nodes" in statement for statement in locked)
+    assert any(statement.startswith("INSERT INTO story_versions") for statement in locked)
@@ -0,0 +1,53 @@
+def _readers_here(client, story_id):
+    nodes = client.get(f"/api/stories/{story_id}/stats").get_json()["nodes"]
+    return {node["node_id"]: (node["readers_here"], node["drop_off"]) for node in nodes}
+
+
+def test_advancing_moves_the_reader_between_nodes(client, story):
+    assert client.get(f"/read/{story['id']}").status_code == 200
+    assert _readers_here(client, story["id"]) == {story["start"]: (1, 1)}
+
+    response = client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["start"]})
+    assert response.status_code == 200
+    # the view the reader sends once on the next node doesn't count them twice
+    client.post("/api/events", json={"events": [{"story_id": story["id"], "node_id": story["dialog"], "kind": "view"}]})
+    counts = _readers_here(client, story["id"])
+    assert counts[story["start"]] == (0, 0)
+    assert counts[story["dialog"]] == (1, 1)
+
+
+def test_readers_on_an_end_node_do_not_drop_off(client, story):
+    client.get(f"/read/{story['id']}")
+    client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["start"]})
+    client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["dialog"]})
+    counts = _readers_here(client, story["id"])
+    assert counts[story["dialog"]] == (0, 0)
+    assert counts[story["end"]] == (1, 0)
+
+
+def test_readers_only_advance_from_the_node_they_are_on(client, story):
+    client.get(f"/read/{story['id']}")
+    client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["start"]})
+    # e.g. a second tab still showing the start node
+    response = client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["start"]})
+    assert response.status_code == 409
+    assert client.get(f"/api/userinfo/{story['id']}").get_json()["progress"] == story["dialog"]
+
+
+def test_the_progress_cannot_be_set(client, story):
+    client.get(f"/read/{story['id']}")
+    response = client.put(f"/api/userinfo/{story['id']}", json={"progress": story["end"]})
+    assert response.status_code == 400
+    assert client.get(f"/api/userinfo/{story['id']}").get_json()["progress"] == story["start"]
+
+
+def test_late_events_do_not_move_the_reader_back(client, story):
+    client.get(f"/read/{story['id']}")
+    client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["start"]})
+    response = client.post("/api/events", json={"events": [
+        {"story_id": story["id"], "node_id": story["start"], "kind": "view"},
+    ]})
+    assert response.status_code == 202
+    counts = _readers_here(client, story["id"])
+    assert counts[story["start"]] == (0, 0)
+    assert counts[story["dialog"]] == (1, 1)
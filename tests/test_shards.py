@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from app.utils.migrations import MIGRATIONS, migrate, schema_version
+
+sharded = pytest.mark.parametrize("app", [True], indirect=True, ids=["sharded"])
+
+
+@sharded
+def test_shard_engines_are_instrumented_and_stamped(app, story):
+    with app.app_context():
+        from app.extensions import shards
+        from app.services.stories_service import get_story_shard
+        engine = shards.engine(get_story_shard(story["id"]))
+        instrumentation = app.extensions["instrumentation"]
+        assert event.contains(engine, "after_cursor_execute", instrumentation._after_cursor_execute)
+        assert event.contains(engine, "handle_error", app.extensions["metrics"]._handle_error)
+        with engine.connect() as connection:
+            assert schema_version(connection) == len(MIGRATIONS)
+
+
+def test_unstamped_shard_files_are_not_migrated_from_scratch(tmp_path):
+    # a shard file as the first sharding release created it: current tables, user_version 0
+    engine = create_engine(f"sqlite:///{tmp_path / 'shard-0001.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE story_nodes (id INTEGER PRIMARY KEY, x FLOAT, y FLOAT)"))
+    assert migrate(engine, shard=True) == len(MIGRATIONS)
+    with engine.connect() as connection:
+        assert schema_version(connection) == len(MIGRATIONS)
+        assert connection.execute(text("SELECT name FROM sqlite_master WHERE name = 'assets'")).first() is None
+    engine.dispose()
+
+
+@sharded
+def test_writes_to_a_sharded_story_leave_the_central_database_alone(app, client, story):
+    with app.app_context():
+        from app.extensions import db
+        statements = []
+        event.listen(db.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+    assert client.get(f"/read/{story['id']}").status_code == 200
+    assert client.post(f"/api/userinfo/{story['id']}/advance", json={"node_id": story["start"]}).status_code == 200
+    assert client.put(f"/api/stories/nodes/{story['dialog']}", json={"content": "<p>Hello there</p>"}).status_code == 200
+    assert client.post("/api/events", json={"events": [
+        {"story_id": story["id"], "node_id": story["dialog"], "kind": "view"},
+    ]}).status_code == 202
+    assert [statement for statement in statements if statement.split()[0] in ("INSERT", "UPDATE", "DELETE")] == []
+    # what was written in the shard is read from there
+    stats = client.get(f"/api/stories/{story['id']}/stats").get_json()
+    assert (stats["story"]["readers"], stats["story"]["views"]) == (1, 1)
+    results = client.get("/api/search?q=hello+there").get_json()["results"]
+    assert [(result["kind"], result["id"]) for result in results] == [("node", story["dialog"])]
+
+
+@sharded
+def test_rebuilding_the_stats_moves_central_events_of_sharded_stories(app, client, story):
+    client.get(f"/read/{story['id']}")
+    with app.app_context():
+        from sqlalchemy import insert
+        from app.extensions import db
+        from app.models import ReadingEvent
+        from app.services.events_service import rebuild_reading_stats
+        # logged before the events moved to the shards
+        db.session.execute(insert(ReadingEvent).values(user_id=1, story_id=story["id"],
+                                                       node_id=story["dialog"], kind="view"))
+        db.session.commit()
+        rebuild_reading_stats()
+        assert db.session.execute(text("SELECT count(*) FROM reading_events")).scalar() == 0
+    stats = client.get(f"/api/stories/{story['id']}/stats").get_json()
+    assert (stats["story"]["readers"], stats["story"]["views"]) == (1, 1)
+
+
+@sharded
+def test_node_edits_take_the_write_lock_of_their_shard_first(app, client, story):
+    with app.app_context():
+        from app.extensions import shards
+        from app.services.stories_service import get_story_shard
+        statements = []
+        event.listen(shards.engine(get_story_shard(story["id"])), "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+    assert client.put(f"/api/stories/nodes/{story['dialog']}", json={"content": "<p>Hi</p>"}).status_code == 200
+    assert statements[0] == "BEGIN IMMEDIATE"
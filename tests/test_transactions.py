@@ -0,0 +1,28 @@
+import pytest
+from app.utils.transactions import on_commit, transaction
+
+
+def test_callbacks_of_a_rolled_back_savepoint_are_dropped(app):
+    called = []
+    with app.app_context():
+        with transaction():
+            on_commit(lambda: called.append("outer"))
+            with pytest.raises(ValueError):
+                with transaction(savepoint=True):
+                    on_commit(lambda: called.append("rolled back"))
+                    raise ValueError
+            with transaction(savepoint=True):
+                on_commit(lambda: called.append("released"))
+    assert called == ["outer", "released"]
+
+
+def test_callbacks_are_dropped_on_rollback(app):
+    called = []
+    with app.app_context():
+        with pytest.raises(ValueError):
+            with transaction():
+                on_commit(lambda: called.append("rolled back"))
+                raise ValueError
+        with transaction():
+            pass
+    assert called == []
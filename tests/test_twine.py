@@ -0,0 +1,77 @@
+import io
+import pytest
+from app.utils import twine
+from app.utils.twine import TwineError, TwineStory, parse_twine, parse_twee
+
+
+class _ReadOnly:
+    """A text stream that can only be read in chunks, as a file whose lines must not be iterated."""
+
+    def __init__(self, text: str):
+        self.stream = io.StringIO(text)
+        self.reads = 0
+
+    def read(self, size: int) -> str:
+        self.reads += 1
+        return self.stream.read(size)
+
+
+_ARCHIVE = (
+    '<html><body><tw-storydata name="Cave" startnode="2">'
+    '<tw-passagedata pid="1" name="Exit" position="200,100">Daylight.</tw-passagedata>'
+    '<tw-passagedata pid="2" name="Start" tags="intro" position="100,100">Go [[Exit]]</tw-passagedata>'
+    '<tw-passagedata pid="3" name="Style" tags="stylesheet">body {}</tw-passagedata>'
+    '</tw-storydata></body></html>'
+)
+
+
+def test_an_archive_without_line_breaks_is_read_in_chunks(monkeypatch):
+    monkeypatch.setattr(twine, "CHUNK_SIZE", 16)
+    file, story = _ReadOnly("\n\n  " + _ARCHIVE), TwineStory()
+    passages = list(parse_twine(file, story))
+    assert [(passage.name, passage.text, passage.position) for passage in passages] == [
+        ("Exit", "Daylight.", (200.0, 100.0)), ("Start", "Go [[Exit]]", (100.0, 100.0))
+    ]
+    assert (story.title, story.start) == ("Cave", "Start")
+    assert file.reads > len(_ARCHIVE) // 16
+
+
+def test_twee_is_parsed_after_sniffing(monkeypatch):
+    monkeypatch.setattr(twine, "CHUNK_SIZE", 4)
+    source = '\n:: StoryTitle\nCave\n\n:: Start {"position": "10,20"}\nGo [[Exit]]\n:: Exit\nDaylight.'
+    story = TwineStory()
+    passages = list(parse_twine(io.StringIO(source), story))
+    assert [(passage.name, passage.line, passage.text_line) for passage in passages] == [("Start", 5, 6), ("Exit", 7, 8)]
+    assert passages[0].position == (10.0, 20.0)
+    assert (story.title, story.start) == ("Cave", "Start")
+
+
+@pytest.mark.parametrize("source, message, line", [
+    ("\nHello\n:: Start", "Text outside of a passage", 2),
+    (":: Start\ntext\n::\n", "Invalid passage header", 3),
+    (":: Start\n\n:: Next {oops}\n", "Invalid passage metadata", 3),
+    (':: Start {"position": "a,b"}\n', "Invalid passage position", 1),
+    (":: StoryData\n{\n:: Start\n", "Invalid StoryData", 1),
+])
+def test_twee_errors_give_their_line(source, message, line):
+    with pytest.raises(TwineError) as error:
+        list(parse_twee(io.StringIO(source)))
+    assert str(error.value).startswith(message)
+    assert error.value.line == line
+
+
+@pytest.mark.parametrize("source, message, line", [
+    ('<html>\n<tw-passagedata name="A">a</tw-passagedata>', "<tw-passagedata> outside of <tw-storydata>", 2),
+    ('<tw-storydata>\n\n<tw-passagedata>a</tw-passagedata>', "Passage without a name", 3),
+    ('<tw-storydata>\n<tw-passagedata name="A">\n<tw-passagedata name="B">', "Unclosed <tw-passagedata>", 3),
+    ('<tw-storydata>\n<tw-passagedata name="A" position="x">', "Invalid passage position", 2),
+    ('<tw-storydata>\n<tw-storydata>', "Nested <tw-storydata>", 2),
+    ('<tw-storydata>\n<tw-passagedata name="A">never closed', "Unclosed <tw-passagedata>", 2),
+    ("<html>\n<body>\n</body>\n</html>", "No Twine 2 passages", 4),
+])
+def test_archive_errors_give_their_line(monkeypatch, source, message, line):
+    monkeypatch.setattr(twine, "CHUNK_SIZE", 8)
+    with pytest.raises(TwineError) as error:
+        list(parse_twine(_ReadOnly(source)))
+    assert str(error.value).startswith(message)
+    assert error.value.line == line